@@ -1,27 +1,66 @@
 """This module is the front-end of the bot and serves as a gateway between Telegram API
 and the rest of the application.
 
-:todo:
-    1. Timestamp su history e clean old entries
-    2. Use coroutines in request_manager in order to communicate with asyncbot
+Every update is handled by a coroutine which awaits :mod:`.request_manager`, so updates
+waiting for BGG or Telegram never block the others. The updates of the same chat are
+handled one at a time, in order (see :class:`.dispatcher.ChatDispatcher`), and every
+call to Telegram goes through a :class:`.send_queue.SendQueue`, which respects its flood limits.
 """
 import sys
 import random
+import asyncio
+import functools
 import logging
 import telepot
 import telepot.aio
+import telepot.exception
 from telepot.namedtuple import ReplyKeyboardMarkup, KeyboardButton, ForceReply
 from telepot.namedtuple import InlineKeyboardMarkup, InlineKeyboardButton
 from telepot.namedtuple import InlineQueryResultArticle, InlineQueryResultPhoto, InputTextMessageContent
 
 import request_manager
 import constants
+import exceptions
 from objects import answer as ans
+from objects import dispatcher
+from objects import send_queue
 from tools import history_manager
 from tools import input_parser
 
 logger = logging.getLogger("async")
 
+def _retryAfter(err):
+    """Returns the delay requested by Telegram if a call failed because of its flood
+    limits, see :class:`.send_queue.SendQueue`.
+    """
+    if isinstance(err, telepot.exception.TelegramError) and 429 == err.error_code:
+        parameters = err.json.get("parameters", {}) if isinstance(err.json, dict) else {}
+        return parameters.get("retry_after", constants.TELEGRAM_DEFAULT_RETRY_AFTER)
+    return None
+
+def chatKey(msg):
+    """Returns the key which decides the worker of an update in the supervisor mode (see
+    :class:`.supervisor.Supervisor`): the ID of the chat, or of the user for updates
+    without a chat, like inline queries. The ID of a private chat is the ID of its user,
+    so inline queries reach the worker which has the recent games of the user.
+
+    Args:
+        msg (dict): The update.
+
+    Returns:
+        int: The key of the update.
+    """
+    flavor = telepot.flavor(msg)
+    if "chat" == flavor:
+        return msg["chat"]["id"]
+    if "callback_query" == flavor and "message" in msg:
+        return msg["message"]["chat"]["id"]
+    return msg["from"]["id"]
+
+def _logSendError(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Cannot send answer: " + repr(future.exception()))
+
 class BggBot(telepot.aio.Bot):
     """This class implements the mehods that are called by telepot upon retrieving a
     message. The mapping of the methods is the default one.
@@ -35,6 +74,8 @@ class BggBot(telepot.aio.Bot):
         super(BggBot, self).__init__(*args, **kwargs)
         self._answerer = telepot.aio.helper.Answerer(self)
         self._message_with_inline_keyboard = None
+        self._dispatcher = dispatcher.ChatDispatcher(self._route)
+        self._sendQueue = send_queue.SendQueue(_retryAfter)
         self.ANSWER_METHODS = {"n": self.sendNormalMessage, "c": self.sendCallbackAnswer, "i": self.sendInlineAnswer, "e": self.editMessage}
 
     async def setBotName(self):
@@ -47,6 +88,51 @@ class BggBot(telepot.aio.Bot):
         constants.defineREGEXPs()
         logger.info("QUERY_REGEXP: " + constants.COMMAND_REGEXP + constants.ARGUMENT_REGEXP)
 
+    async def registerWebhook(self, url, secretToken=None):
+        """Registers the webhook. The ``setWebhook`` of telepot does not know the
+        ``secret_token`` parameter, so the request is made directly.
+
+        Args:
+            url (str): The URL where Telegram posts the updates.
+            secretToken (str): The value Telegram sends in the
+                ``X-Telegram-Bot-Api-Secret-Token`` header of every update, or None.
+        """
+        params = {"url": url}
+        if secretToken is not None:
+            params["secret_token"] = secretToken
+        await self._api_request("setWebhook", params)
+
+    async def handle(self, msg):
+        """Called by telepot for every update. Messages and callback queries are queued
+        in the dispatcher by chat, the rest is handled at once: inline queries do not
+        change the history, and the Answerer already drops the outdated ones.
+
+        Args:
+            msg (dict): The update.
+        """
+        flavor = telepot.flavor(msg)
+        if "chat" == flavor:
+            self._dispatcher.dispatch(msg["chat"]["id"], msg)
+        elif "callback_query" == flavor and "message" in msg:
+            self._dispatcher.dispatch(msg["message"]["chat"]["id"], msg)
+        else:
+            await self._route(msg)
+
+    async def _route(self, msg):
+        await super(BggBot, self).handle(msg)
+
+    def dispatcherStats(self):
+        """Returns the counters of the dispatcher, see :meth:`.ChatDispatcher.stats`. It
+        must be called on the event loop.
+        """
+        return self._dispatcher.stats()
+
+    def sendQueueStats(self):
+        """Returns the counters of the send queue, see :meth:`.SendQueue.stats`. It must
+        be called on the event loop.
+        """
+        return self._sendQueue.stats()
+
     async def on_chat_message(self, msg):
         """Processes a normal chat message.
 
@@ -61,19 +147,16 @@ class BggBot(telepot.aio.Bot):
 
         if contentType != 'text':
             # we only accept text, so print help
-            answer = request_manager.processCommand("help", None)
+            answer = await request_manager.processCommand("help", None)
         else:
-            msgText = msg["text"]
-            command, msgText = input_parser.parseCommand(msgText)
-
-        if command:
+            command, msgText = input_parser.parseCommand(msg["text"])
+            if not command:
+                return
             if msgText is not None:
                 logger.debug("Processing command " + command + " and message: " + msgText)
             else:
                 logger.debug("Processing command " + command)
-            answer = request_manager.processCommand(command, msgText, chatId)            
-        else:
-            return
+            answer = await request_manager.processCommand(command, msgText, chatId)
 
         id_ = {"chat_id": chatId}
         await self.sendAnswer(id_, answer)
@@ -92,7 +175,7 @@ class BggBot(telepot.aio.Bot):
                 "message_id": msg["message"]["message_id"],
                 "query_id": queryId
             }
-            answer = request_manager.processCallback(data, msgId["chat_id"], msgId["message_id"])
+            answer = await request_manager.processCallback(data, msgId["chat_id"], msgId["message_id"])
             if answer is not None: # may be None if multiple people are pressing buttons at the same time
                 await self.sendAnswer(msgId, answer)
         else:
@@ -104,13 +187,15 @@ class BggBot(telepot.aio.Bot):
         Args:
             msg (str): The message to process.
         """
-        def compute():
+        async def compute():
             logger.debug("Computing inline")
             queryId, fromId, queryString, offset = telepot.glance(msg, 'inline_query', True)
             offset = int(offset) if offset else 0
             command, msgText = input_parser.parseInlineCommand(queryString.lower())
 
-            answer = request_manager.processInline(command, msgText, fromId, offset)
+            answer = await request_manager.processInline(command, msgText, fromId, offset)
+            if answer is None:
+                return {"results": []}
             resultList = []
             for inlineAnswer in answer.answerList:
                 resultList.append(dict(type="article", title=inlineAnswer.title, id=inlineAnswer.id_, input_message_content=dict(message_text=inlineAnswer.formattedAnswer, parse_mode="HTML"), thumb_url=inlineAnswer.thumbUrl))
@@ -120,7 +205,7 @@ class BggBot(telepot.aio.Bot):
 
     def on_chosen_inline_result(self, msg):
         resultId, fromId, queryString = telepot.glance(msg, flavor='chosen_inline_result')
-        logger.info('Chosen Inline Result:', resultId, fromId, queryString)
+        logger.info("Chosen Inline Result: " + str(resultId) + " " + str(fromId) + " " + queryString)
 
     def on_edited_chat_message(self, msg):
         logger.info("Message edited")
@@ -153,7 +238,8 @@ class BggBot(telepot.aio.Bot):
             markup = InlineKeyboardMarkup(inline_keyboard = answer.inlineKeyboardMarkup)
         else:
             markup = None
-        sentMessage = await self.sendMessage(chatId, answer.formattedAnswer, parse_mode="HTML", reply_markup=markup, disable_web_page_preview=answer.disableWebPagePreview)
+        sentMessage = await self._sendQueue.send(chatId, functools.partial(self.sendMessage, chatId, answer.formattedAnswer,
+            parse_mode="HTML", reply_markup=markup, disable_web_page_preview=answer.disableWebPagePreview))
         history_manager.setMsgId(chatId, sentMessage["message_id"])
 
     async def sendCallbackAnswer(self, id_, answer):
@@ -164,7 +250,7 @@ class BggBot(telepot.aio.Bot):
             answer (.answer.Answer): The answer to send.
         """
         queryId = id_["query_id"]
-        await self.answerCallbackQuery(queryId, text=answer.formattedAnswer)
+        await self._sendQueue.send(None, functools.partial(self.answerCallbackQuery, queryId, text=answer.formattedAnswer))
 
     async def editMessage(self, id_, answer):
         """Formats and edits a chat message.
@@ -176,7 +262,11 @@ class BggBot(telepot.aio.Bot):
         """
         msgId = (id_["chat_id"], id_["message_id"])
         markup = InlineKeyboardMarkup(inline_keyboard = answer.inlineKeyboardMarkup)
-        await self.editMessageText(msgId, answer.formattedAnswer, parse_mode="HTML", reply_markup=markup, disable_web_page_preview=answer.disableWebPagePreview)
+        # only the latest page of a list matters: the edit is not awaited, so that the next
+        # update of the chat can replace it while it waits in the send queue
+        future = asyncio.ensure_future(self._sendQueue.send(id_["chat_id"], functools.partial(self.editMessageText, msgId,
+            answer.formattedAnswer, parse_mode="HTML", reply_markup=markup, disable_web_page_preview=answer.disableWebPagePreview), msgId))
+        future.add_done_callback(_logSendError)
 
     def sendInlineAnswer(self, id_, answer):
         pass # TODO implement or remove?
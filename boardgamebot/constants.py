@@ -1,3 +1,4 @@
+import os
 import re
 import datetime
 
@@ -12,16 +13,151 @@ botProxy = None
 
 # LOG
 logfileName = "log/logfile_" + str(datetime.date.today()) + ".log"
+STATS_LOG_INTERVAL = 300
+"""Number of seconds between two logs of the cache and BGG statistics."""
+
+# SEND QUEUE
+TELEGRAM_SEND_RATE = 30
+"""Number of calls per second which can be made to Telegram on average, by all chats."""
+TELEGRAM_SEND_BURST = 30
+"""Maximum number of calls which can be made to Telegram at once."""
+TELEGRAM_CHAT_SEND_RATE = 1
+"""Number of messages per second which can be sent to a single chat on average."""
+TELEGRAM_CHAT_SEND_BURST = 3
+"""Maximum number of messages which can be sent to a single chat at once."""
+TELEGRAM_SEND_ATTEMPTS = 3
+"""Maximum number of attempts of a call which fails because of the flood limits."""
+TELEGRAM_DEFAULT_RETRY_AFTER = 1
+"""Number of seconds to wait after a flood error, if Telegram does not say."""
+
+# WEBHOOK
+WEBHOOK_HOST = "127.0.0.1"
+"""Default address the webhook listens on, usually behind a reverse proxy with TLS."""
+WEBHOOK_PORT = 8443
+"""Default port the webhook listens on."""
+WEBHOOK_SECRET = os.environ.get("BGG_WEBHOOK_SECRET")
+"""Secret path of the webhook. If None, a random one is generated at every start. It can
+be set with the BGG_WEBHOOK_SECRET environment variable."""
+WEBHOOK_SECRET_TOKEN = os.environ.get("BGG_WEBHOOK_SECRET_TOKEN")
+"""Value required in the X-Telegram-Bot-Api-Secret-Token header of every update, if the
+webhook is registered with one. It can be set with the BGG_WEBHOOK_SECRET_TOKEN
+environment variable. If None, the header is not checked."""
+WEBHOOK_QUEUE_SIZE = 1000
+"""Maximum number of updates waiting to be handled. Telegram sends again the updates
+refused when the queue is full."""
+WEBHOOK_WORKERS = 4
+"""Number of tasks which hand the updates of the webhook to the bot."""
+
+# WORKERS
+WORKERS = 1
+"""Default number of worker processes. With more than one, the bot runs in supervisor mode
+(see :class:`.supervisor.Supervisor`)."""
+WORKER_CHECK_INTERVAL = 1
+"""Number of seconds between two checks of the workers by the supervisor."""
+WORKER_RESTART_DELAY = 5
+"""Minimum number of seconds between two starts of the same worker, so that a worker which
+fails at startup is not started again in a tight loop."""
+WORKER_STOP_TIMEOUT = 30
+"""Number of seconds the supervisor waits for a worker to save its history and exit."""
 
 # HTTP
-DEFAULT_API_PATH = "http://www.boardgamegeek.com/xmlapi2/"
+DEFAULT_API_PATH = os.environ.get("BGG_API_PATH", "http://www.boardgamegeek.com/xmlapi2/")
+"""Base path of BGG API2. It can be overridden with the BGG_API_PATH environment variable,
+for example to use the fake server in ``test/fake_bgg.py``.
+"""
 DEFAULT_REQUEST_TIMEOUT = 60
 REQUEST_KEYWORDS = {"id_search": "thing", "name_search": "search"}
 """Dictionary used by the :mod:`tools.http` module to construct BGG API queries."""
 ATTEMPTS_LIMIT = 3
+"""Maximum number of failed attempts for a single request to BGG."""
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+"""HTTP status codes which mean that the request to BGG may succeed if retried later."""
+BACKOFF_BASE = 1
+"""Delay in seconds before the first retry. It doubles after every failed attempt."""
+BACKOFF_MAX = 30
+QUEUED_POLL_INTERVAL = 2
+"""Seconds to wait before polling again a request BGG answered with 202 (queued)."""
+SEARCH_DEADLINE = 120
+"""Maximum number of seconds spent on a single request to BGG, including all retries."""
+ATTEMPT_LOG_SIZE = 1000
+THING_IDS_LIMIT = 20
+"""Maximum number of IDs BGG accepts in a single ``thing`` request."""
+HTTP_CONNECTION_LIMIT = 100
+"""Maximum number of simultaneous connections opened by the shared aiohttp session."""
+STREAM_CHUNK_SIZE = 16384
+"""Size in bytes of the chunks of a search response fed to the incremental parser."""
 
 BOARDGAMEGEEK_BASE_ADDRESS = r"https://www.boardgamegeek.com/boardgame/"
 
+# XML PARSER
+XML_BACKEND = "auto"
+"""The parser used by :mod:`.tools.xml_parser`: "lxml", "defusedxml" or "auto" to use
+lxml if it is installed, and defusedxml otherwise."""
+
+# OFFLOAD
+OFFLOAD_EXECUTOR = "thread"
+"""Where :mod:`.tools.offload` runs the CPU-heavy steps with a large input: "thread",
+"process" or "none" to always run them on the event loop. Threads keep the loop
+responsive while lxml parses, since it releases the GIL; processes also run the Python
+code in parallel, but pay for pickling the input and the result. Processes are spawned,
+since the bot already runs threads when the pool starts them."""
+OFFLOAD_THRESHOLD = 32768
+"""Size in bytes of the input of a step above which it is offloaded."""
+OFFLOAD_WORKERS = 2
+"""Number of workers of the offload pool."""
+STAGE_LOG_SIZE = 1000
+"""Number of recent steps kept by :mod:`.tools.offload` for its statistics."""
+
+# SCHEDULER
+BGG_REQUEST_RATE = 2
+"""Number of requests per second which can be sent to BGG on average."""
+BGG_REQUEST_BURST = 10
+"""Maximum number of requests which can be sent to BGG at once, after a quiet period."""
+PRIORITY_INTERACTIVE = 0
+"""Priority of requests coming from chat commands and callbacks."""
+PRIORITY_INLINE = 1
+"""Priority of requests coming from inline queries."""
+PRIORITY_BACKGROUND = 2
+"""Priority of prefetch and refresh requests."""
+SCHEDULER_MAX_WAITING = 200
+"""Maximum number of BGG requests waiting for their turn. Beyond this, the lowest priority ones are shed."""
+SCHEDULER_MAX_WAIT = {PRIORITY_INTERACTIVE: 30, PRIORITY_INLINE: 5, PRIORITY_BACKGROUND: 300}
+"""Maximum number of seconds a BGG request waits for its turn, for each priority."""
+
+# CIRCUIT BREAKER
+BREAKER_WINDOW = 60
+"""Length in seconds of the window over which the BGG error rate is computed."""
+BREAKER_MIN_REQUESTS = 10
+"""Minimum number of requests in the window before the circuit breaker can open."""
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_OPEN_TIME = 30
+"""Seconds during which no request is sent to BGG after the circuit breaker opens."""
+
+# CACHE
+GAME_CACHE_SIZE = 5000
+"""Maximum number of games kept in memory by :mod:`tools.http`."""
+GAME_CACHE_TTL = 6 * 3600
+"""Seconds after which a cached game is requested again to BGG."""
+SEARCH_CACHE_SIZE = 2000
+"""Maximum number of searches by name kept in memory by :mod:`tools.http`."""
+SEARCH_CACHE_TTL = 3600
+SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+"""Approximate memory limit of the cached searches, in bytes."""
+SEARCH_CACHE_GAME_OVERHEAD = 400
+"""Estimated size in bytes of a game in a search result, excluding its name and link."""
+CATALOG_PATH = "resources/catalog.db"
+"""The SQLite database where :mod:`tools.catalog` keeps games and searches across restarts."""
+CATALOG_GAME_TTL = 24 * 3600
+"""Seconds after which a game in the catalog is requested again to BGG."""
+CATALOG_SEARCH_TTL = 6 * 3600
+CATALOG_STALE_TTL = 30 * 24 * 3600
+"""Maximum age of the catalog entries which are served when BGG is unreachable."""
+CATALOG_TIMEOUT = 10
+CATALOG_READ_BATCH = 500
+CATALOG_WRITE_BATCH = 500
+CATALOG_WRITE_INTERVAL = 1
+"""Maximum seconds the writer thread waits for new entries before checking if it should stop."""
+
 # COMMANDS
 COMMAND_DESCRIPTIONS = OrderedDict([
             ("/b", "Search for a boardgame by name and returns a list of matches."),
@@ -66,8 +202,9 @@ BGG_TYPES = ["g", "l"]
 
 # ANSWER
 LIST_SIZE_LIMIT=150
+"""Maximum number of games kept from a search, the rest of the response is discarded."""
 LIST_PAGE_SIZE = 10
-INLINE_LIST_PAGE_SIZE = 4
+INLINE_LIST_PAGE_SIZE = 10
 MARKUP_KEYBOARD_ROW_LENGTH = 3
 ANSWER_METHOD_TYPES = ["n", "c", "i", "e"]
 """Types of :class:`.objects.answer.Answer`. This must contain the same keys which are in
@@ -77,10 +214,40 @@ ANSWER_METHODS in :class:`.asyncbot.BggBot`.
 # HISTORY
 CHAT_HISTORY_PATH = "resources/chat_history.dat"
 USER_HISTORY_PATH = "resources/user_history.dat"
-HISTORY_SAVING_INTERVAL = 300
+"""Files of the history saved by earlier versions, read only if there is no history index."""
+HISTORY_BACKEND = os.environ.get("BGG_HISTORY_BACKEND", "memory")
+"""Where the history is kept: "memory" for a single process, saved in the files below,
+or "sqlite" for a database shared by several processes (see :mod:`.objects.history_store`).
+It can be overridden with the BGG_HISTORY_BACKEND environment variable."""
+HISTORY_DB_PATH = "resources/history.db"
+"""Database of the history, used by the "sqlite" backend."""
+HISTORY_DB_TIMEOUT = 0.2
+"""Number of seconds to wait for the history database, when it is locked by another process.
+The wait blocks the event loop, so it must be short; transactions only change one row."""
+HISTORY_INDEX_PATH = "resources/history.idx"
+"""Index of the history, see :mod:`.objects.history_index`."""
+HISTORY_LOG_PATH = "resources/history.log"
+"""Append-only log of the history entries changed after the index was written."""
+HISTORY_SAVING_INTERVAL = 5
+"""Number of seconds between two saves of the changed history entries."""
+PAUSE_LOG_SIZE = 1000
+"""Number of recent snapshots kept by :mod:`.tools.persistence_unit` for its statistics."""
+HISTORY_LOG_MAX_SIZE = 4194304
+"""Size in bytes of the history log after which it is merged into the index. It bounds
+the data read when the bot starts."""
 RECENT_GAMES_LIMIT = 5
 HISTORY_WARNING_SIZE = 268435456
 """Size in byte of the history after which a warning will be produced."""
+HISTORY_MAX_IDLE = 7776000
+"""Number of seconds after which the history of a chat or user which sent no query is discarded."""
+HISTORY_MAX_CHATS = 200000
+"""Maximum number of chats in the history, the least recently active are discarded first."""
+HISTORY_MAX_USERS = 200000
+"""Maximum number of users associated to their private chat."""
+HISTORY_SWEEP_INTERVAL = 1
+"""Number of seconds between two sweeps for idle entries in the history."""
+HISTORY_SWEEP_BATCH = 100
+"""Maximum number of entries examined by a single sweep, so that it never blocks the event loop."""
 
 # INLINE
 INLINE_EXACT_QUERY_THRESHOLD = 5
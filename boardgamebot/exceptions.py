@@ -7,6 +7,16 @@ class BggUnreachable(GenericError):
         # fatal is just a hint to decide whether to retry the connection or not
         self.fatal = fatal
 
+class RequestShed(BggUnreachable):
+    # the request was dropped by the scheduler, because BGG request budget is exhausted
+    def __init__(self):
+        super().__init__(True)
+
+class CircuitOpen(BggUnreachable):
+    # the request was not sent, because BGG is failing too often
+    def __init__(self):
+        super().__init__(True)
+
 # RESULT OF BGG QUERY
 class NoResultFound(GenericError):
     pass
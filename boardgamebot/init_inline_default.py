@@ -1,6 +1,7 @@
 """This module is only used to initialize a default inline result for inline queries.
 """
 import pickle
+import asyncio
 
 import constants
 
@@ -8,7 +9,7 @@ from tools import http
 from tools import output_formatter
 from objects import answer
 
-def _searchByIdInline(id_, cacheTime, isPersonal):
+async def _searchByIdInline(id_, cacheTime, isPersonal):
     """Searches for a game by ID and returns an inline answer.
 
     Args:
@@ -21,7 +22,7 @@ def _searchByIdInline(id_, cacheTime, isPersonal):
         answer.TelegramInlineAnswerList: An object containing all the information
             to be sent to answer the inline query.
     """
-    game = http.searchById(id_)
+    game = await http.searchById(id_, constants.PRIORITY_BACKGROUND)
     formattedInlineGame = output_formatter.formatInlineGame(game)
     inlineList = answer.TelegramInlineAnswerList(cacheTime, isPersonal)
     inlineList.addInlineAnswer(formattedInlineGame)
@@ -29,7 +30,9 @@ def _searchByIdInline(id_, cacheTime, isPersonal):
 
 
 if __name__ == "__main__":
-    inlineList = _searchByIdInline("145654", 3600, True)
+    loop = asyncio.get_event_loop()
+    inlineList = loop.run_until_complete(_searchByIdInline("145654", 3600, True))
+    loop.run_until_complete(http.closeSession())
     with open(constants.INLINE_DEFAULT_PATH, "wb") as inlineDefault:
         pickle.dump(inlineList, inlineDefault, -1)
         print("Success!")
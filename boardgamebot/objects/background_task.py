@@ -1,24 +1,95 @@
 """This module contains threads that run in background.
 """
+import time
+import asyncio
 import threading
 
 import logging
 import constants
 from tools import persistence_unit
+from tools import http
+from tools import catalog
+from tools import offload
 
 logger = logging.getLogger("background_task")
 
 class Historian(threading.Thread):
-    """This thread regularly saves the history on file.
+    """This thread regularly saves the changes to the history on file, and logs statistics.
+
+    Args:
+        event (threading.Event): Stops the thread when set.
+        loop (asyncio.AbstractEventLoop): The loop which changes the history, where the
+            snapshots are taken.
+        saving (bool): Whether the history must be saved, which is not needed when it is
+            kept in a database.
     """
-    def __init__(self, event):
+    def __init__(self, event, loop, saving=True):
         threading.Thread.__init__(self)
         self.stopped = event
+        self.loop = loop
+        self.saving = saving
 
     def run(self):
+        lastStats = time.monotonic()
         while not self.stopped.wait(constants.HISTORY_SAVING_INTERVAL):
-            logger.warn("Saving history...")
-            persistence_unit.saveHistory()
-            logger.warn("History saved.")
+            if self.saving:
+                persistence_unit.saveHistory(self.loop)
+            if time.monotonic() - lastStats >= constants.STATS_LOG_INTERVAL:
+                lastStats = time.monotonic()
+                try:
+                    self.logStats()
+                except Exception:
+                    # statistics must never stop the history from being saved
+                    logger.exception("Cannot log statistics")
+
+    def logStats(self):
+        logger.info("Game cache: " + str(http.GAME_CACHE.stats()))
+        logger.info("Search cache: " + str(http.SEARCH_CACHE.stats()))
+        logger.info("BGG scheduler: " + str(http.SCHEDULER.stats()))
+        logger.info("BGG attempts: " + str(http.attemptStats()))
+        logger.info("BGG circuit breaker: " + str(http.BREAKER.stats()))
+        logger.info("History snapshots: " + str(persistence_unit.pauseStats()))
+        logger.info("Offload stages: " + str(offload.stageStats()))
+
+class Inbox(threading.Thread):
+    """This thread takes the updates routed to a worker process by the
+    :class:`.supervisor.Supervisor`, and hands them to the handler of the bot on the loop.
+    It is a daemon, since it waits for updates until the process exits. If the supervisor
+    dies, the loop is stopped.
+
+    Args:
+        connection (multiprocessing.connection.Connection): The end of the channel of the
+            worker.
+        loop (asyncio.AbstractEventLoop): The loop where the updates are handled.
+        handler (Callable[[dict],Coroutine]): The coroutine function which handles an
+            update, like :meth:`.asyncbot.BggBot.handle`.
+    """
+    def __init__(self, connection, loop, handler):
+        threading.Thread.__init__(self, daemon=True)
+        self.connection = connection
+        self.loop = loop
+        self.handler = handler
+
+    def run(self):
+        while True:
+            try:
+                msg = self.connection.recv()
+            except (EOFError, OSError):
+                logger.error("The supervisor closed the channel, stopping")
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                return
+            self.loop.call_soon_threadsafe(self._handle, msg)
 
-            
+    def _handle(self, msg):
+        asyncio.ensure_future(self.handler(msg))
+
+class CatalogWriter(threading.Thread):
+    """This thread commits to disk the games and searches queued by :mod:`.catalog`.
+    """
+    def __init__(self, event):
+        threading.Thread.__init__(self)
+        self.stopped = event
+
+    def run(self):
+        while not self.stopped.is_set():
+            catalog.writePending(constants.CATALOG_WRITE_INTERVAL)
@@ -0,0 +1,112 @@
+"""This module contains an in-memory cache used to avoid repeating requests to BGG.
+"""
+import time
+from collections import OrderedDict
+
+class TimedLRUCache():
+    """A bounded cache with a time to live for its entries. When the cache is full,
+    the least recently used entry is evicted.
+
+    Args:
+        maxSize (int): The maximum number of entries.
+        ttl (float): The number of seconds after which an entry expires.
+        weigher (Callable[[object],int]): An optional function returning the weight of a
+            value, for example an estimate of its memory footprint.
+        maxWeight (int): The maximum total weight of the entries. It is ignored if
+            ``weigher`` is None.
+    """
+    def __init__(self, maxSize, ttl, weigher=None, maxWeight=None):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.weigher = weigher
+        self.maxWeight = maxWeight
+        self.weight = 0
+        self._entries = OrderedDict()
+        # key -> (expiration time, value, weight), ordered from least to most recently used
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Gets an entry and marks it as the most recently used.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The cached value, or None if it is missing or expired. Expired entries
+            are kept until they are evicted or replaced, see :meth:`getStale`.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expiration, value, weight = entry
+        if expiration < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def getStale(self, key):
+        """Gets an entry even if it is expired. It is meant to be used when fresh data
+        cannot be retrieved, and it does not affect the counters or the LRU order.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The cached value, or None if it is missing.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def put(self, key, value, ttl=None):
+        """Inserts or replaces an entry, evicting the least recently used ones if
+        the cache is full.
+
+        Args:
+            key: The key of the entry.
+            value: The value to cache.
+            ttl (float): An optional time to live for this entry, used instead of
+                the default one.
+        """
+        self._remove(key)
+        weight = self.weigher(value) if self.weigher is not None else 0
+        if ttl is None:
+            ttl = self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value, weight)
+        self.weight += weight
+        while len(self._entries) > self.maxSize or self._overweight():
+            _, (_, _, evictedWeight) = self._entries.popitem(last=False)
+            self.weight -= evictedWeight
+            self.evictions += 1
+
+    def _overweight(self):
+        return self.weigher is not None and self.weight > self.maxWeight and len(self._entries) > 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def invalidate(self, key):
+        self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.weight = 0
+
+    def size(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns the counters of the cache, useful to tune its size and TTL.
+
+        Returns:
+            dict: The number of entries, their total weight, hits, misses and evictions.
+        """
+        return {"size": self.size(), "weight": self.weight, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -1,47 +1,118 @@
 """This module contains the class that models an entry in the history.
 """
+import time
 
 import constants
-from objects import answer
 
 class ChatHistory():
     """This class contains all the information about the history in a single chat.
+
+    Only game IDs, offsets and message IDs are kept, so that the size of the history
+    does not depend on the size of the games. Games are resolved when needed through
+    :mod:`.http`, whose caches are shared by all chats.
     """
     def __init__(self):
-        self.lastGame = None
-        """The most recent game searched in a chat.
+        self.lastGameId = None
+        """The ID of the most recent game searched in a chat.
+        """
+        self.lastGameMsgId = None
+        """The ID of the message which shows :attr:`~.lastGameId`.
+        """
+        self.lastListSearch = None
+        """The search string of the most recent game list searched in a chat.
+        """
+        self.lastListExact = False
+        """Whether the most recent game list comes from an exact search.
+        """
+        self.lastListIds = ()
+        """The IDs of the games in the most recent game list.
         """
-        self.lastGameList = None
-        """The most recent game list searched in a chat.
+        self.lastListOffset = 0
+        """The offset of the page shown for the most recent game list.
         """
-        self.recentGames = answer.TelegramInlineAnswerList(30, True)
-        """The list of most recent games searched in a chat.
+        self.lastListMsgId = None
+        """The ID of the message which shows the most recent game list.
         """
-        self.setMsgId = None  # function to use when setting msgId
-        """This contains the function to call to set the message ID.
-        The function should correspond to the most recent variable set
-        (:attr:`~.lastGame` or :attr:`~.lastGameList`).
+        self.recentGameIds = []
+        """The IDs of the most recent games searched in a chat, the most recent first.
         """
-    def setLastGame(self, game, formattedAnswer):
-        self.lastGame = game
-        self.setMsgId = self.setLastGameMsgId
-        self.addRecentGame(game, formattedAnswer)
+        self.msgIdTarget = None
+        """The type of the most recent object set ("g" for the game, "l" for the list,
+        see :data:`.constants.BGG_TYPES`), which gets the message ID in :meth:`~.setMsgId`.
+        """
+        self.lastAccess = time.time()
+        """When the history was last used, as a timestamp. Histories pickled before it
+        existed get the time they are loaded.
+        """
+
+    def touch(self):
+        self.lastAccess = time.time()
+
+    def __setstate__(self, state):
+        if "lastGame" in state:
+            state = self._convertOldState(state)
+        self.__init__()
+        self.__dict__.update(state)
+
+    def _convertOldState(self, state):
+        """Converts a history pickled when it held whole games and inline answers.
+        """
+        newState = {}
+        lastGame = state.get("lastGame")
+        if lastGame is not None:
+            newState["lastGameId"] = lastGame.id_
+            newState["lastGameMsgId"] = lastGame.msgId
+        lastGameList = state.get("lastGameList")
+        if lastGameList is not None:
+            newState["lastListSearch"] = lastGameList.originalSearch
+            newState["lastListIds"] = tuple(game.id_ for game in lastGameList.gameList)
+            newState["lastListOffset"] = lastGameList.offset
+            newState["lastListMsgId"] = lastGameList.msgId
+        setMsgId = state.get("setMsgId")
+        if setMsgId is not None:
+            newState["msgIdTarget"] = "g" if "setLastGameMsgId" == setMsgId.__name__ else "l"
+        recentGames = state.get("recentGames")
+        if recentGames is not None:
+            newState["recentGameIds"] = [inlineAnswer.id_ for inlineAnswer in recentGames.answerList]
+        return newState
 
     def setLastGameMsgId(self, msgId):
-        self.lastGame.setMsgId(msgId)
-        
-    def setLastGameList(self, gameList):
-        self.lastGameList = gameList
-        self.setMsgId = self.setLastGameListMsgId
+        # histories pickled before IDs were used hold a bound method with this name
+        self.lastGameMsgId = msgId
 
     def setLastGameListMsgId(self, msgId):
-        self.lastGameList.setMsgId(msgId)
-
-    def addRecentGame(self, game, formattedAnswer):
-        for g in self.recentGames.answerList:
-            if g.id_ == game.id_:
-                return
-        inlineAnswer = answer.TelegramInlineAnswer(formattedAnswer, game.id_, game.name.title(), game.thumbnail)
-        self.recentGames.prependInlineAnswer(inlineAnswer)
-        if self.recentGames.size() > constants.RECENT_GAMES_LIMIT:
-            self.recentGames.removeLast()
+        self.lastListMsgId = msgId
+
+    def setLastGame(self, id_):
+        self.lastGameId = id_
+        self.lastGameMsgId = None
+        self.msgIdTarget = "g"
+        self.addRecentGame(id_)
+
+    def setLastGameList(self, gameList, exact):
+        self.lastListSearch = gameList.originalSearch
+        self.lastListExact = exact
+        self.lastListIds = tuple(game.id_ for game in gameList.gameList)
+        self.lastListOffset = gameList.offset
+        self.lastListMsgId = None
+        self.msgIdTarget = "l"
+
+    def setLastListPage(self, gameList, offset):
+        # the list may have been fetched again, its games are the ones numbered in the page
+        self.lastListIds = tuple(game.id_ for game in gameList.gameList)
+        self.lastListOffset = offset
+
+    def setMsgId(self, msgId):
+        """Sets the message ID of the most recent object set (game or list).
+        """
+        if "g" == self.msgIdTarget:
+            self.setLastGameMsgId(msgId)
+        elif "l" == self.msgIdTarget:
+            self.setLastGameListMsgId(msgId)
+
+    def addRecentGame(self, id_):
+        if id_ in self.recentGameIds:
+            return
+        self.recentGameIds.insert(0, id_)
+        if len(self.recentGameIds) > constants.RECENT_GAMES_LIMIT:
+            self.recentGameIds.pop()
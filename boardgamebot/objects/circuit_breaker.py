@@ -0,0 +1,111 @@
+"""This module contains a circuit breaker, used to stop contacting a service which is down.
+"""
+import time
+import logging
+import collections
+
+logger = logging.getLogger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class CircuitBreaker():
+    """A circuit breaker driven by the error rate of the most recent requests.
+
+    While the breaker is closed, requests are allowed and their outcome is recorded.
+    When the error rate over the rolling window reaches the threshold the breaker opens,
+    and requests are refused for some time. Then the breaker becomes half-open: a single
+    probe request is allowed, which closes the breaker if it succeeds or opens it again
+    if it fails.
+
+    Args:
+        window (float): The length in seconds of the rolling window.
+        minRequests (int): The minimum number of requests in the window before the
+            breaker can open.
+        failureRate (float): The error rate, between 0 and 1, which opens the breaker.
+        openTime (float): The number of seconds the breaker stays open.
+    """
+    def __init__(self, window, minRequests, failureRate, openTime):
+        self.window = window
+        self.minRequests = minRequests
+        self.failureRate = failureRate
+        self.openTime = openTime
+        self.state = CLOSED
+        self._outcomes = collections.deque()
+        # (timestamp, success) of the requests in the window
+        self._failures = 0
+        self._openedAt = None
+        self._probing = False
+        self.refused = 0
+
+    def isOpen(self):
+        """Checks whether the breaker is open, without changing its state. It can be used
+        to fail fast before doing any work for a request.
+        """
+        return OPEN == self.state and time.monotonic() < self._openedAt + self.openTime
+
+    def allow(self):
+        """Checks whether a request may be sent. If it returns True, the outcome of the
+        request must be recorded with :meth:`recordSuccess` or :meth:`recordFailure`.
+
+        Returns:
+            bool: True if the request may be sent.
+        """
+        if OPEN == self.state and time.monotonic() >= self._openedAt + self.openTime:
+            self._setState(HALF_OPEN)
+        if CLOSED == self.state:
+            return True
+        if HALF_OPEN == self.state and not self._probing:
+            self._probing = True
+            return True
+        self.refused += 1
+        return False
+
+    def recordSuccess(self):
+        if HALF_OPEN == self.state:
+            self._close()
+        else:
+            self._record(True)
+
+    def recordFailure(self):
+        if HALF_OPEN == self.state:
+            self._open()
+        else:
+            self._record(False)
+            if len(self._outcomes) >= self.minRequests and self._failures >= self.failureRate * len(self._outcomes):
+                self._open()
+
+    def _record(self, success):
+        now = time.monotonic()
+        self._outcomes.append((now, success))
+        if not success:
+            self._failures += 1
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, oldSuccess = self._outcomes.popleft()
+            if not oldSuccess:
+                self._failures -= 1
+
+    def _open(self):
+        self._openedAt = time.monotonic()
+        self._probing = False
+        self._setState(OPEN)
+
+    def _close(self):
+        self._outcomes.clear()
+        self._failures = 0
+        self._probing = False
+        self._setState(CLOSED)
+
+    def _setState(self, state):
+        if state != self.state:
+            logger.warning("Circuit breaker: " + self.state + " -> " + state)
+            self.state = state
+
+    def stats(self):
+        """Returns the state and the counters of the breaker.
+
+        Returns:
+            dict: The state, the requests and failures in the window and the refused requests.
+        """
+        return {"state": self.state, "requests": len(self._outcomes), "failures": self._failures, "refused": self.refused}
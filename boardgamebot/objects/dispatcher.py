@@ -0,0 +1,66 @@
+"""This module contains the dispatcher which orders the updates of each chat.
+"""
+import asyncio
+import logging
+import collections
+
+logger = logging.getLogger("dispatcher")
+
+class ChatDispatcher():
+    """Runs the updates of each chat one at a time, in order of arrival, and the updates
+    of different chats concurrently, so that handlers never race on the history of a chat.
+
+    A chat with pending updates has a queue and a task which empties it. When the queue
+    is empty the task ends and the queue is discarded, so idle chats use no memory.
+
+    Args:
+        handler (Callable[[dict],Coroutine]): The coroutine function which handles an update.
+
+    Attributes:
+        dispatched (int): The number of updates dispatched.
+        maxPending (int): The longest queue of a single chat so far.
+    """
+    def __init__(self, handler):
+        self._handler = handler
+        self._queues = {}
+        self.dispatched = 0
+        self.maxPending = 0
+
+    def dispatch(self, key, msg):
+        """Queues an update, which is handled after the previous ones of the same chat.
+
+        Args:
+            key (int): The ID of the chat.
+            msg (dict): The update.
+        """
+        self.dispatched += 1
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = collections.deque()
+            self._queues[key] = queue
+            asyncio.ensure_future(self._run(key, queue))
+        queue.append(msg)
+        self.maxPending = max(self.maxPending, len(queue))
+
+    async def _run(self, key, queue):
+        try:
+            while queue:
+                msg = queue.popleft()
+                try:
+                    await self._handler(msg)
+                except asyncio.CancelledError:
+                    raise
+                except:
+                    logger.exception("Error while handling an update of chat " + str(key))
+        finally:
+            del self._queues[key]
+
+    def stats(self):
+        """Returns the counters of the dispatcher.
+
+        Returns:
+            dict: The number of chats with pending updates, the pending updates, the
+            dispatched updates and the longest queue so far.
+        """
+        return {"chats": len(self._queues), "pending": sum(len(queue) for queue in self._queues.values()),
+            "dispatched": self.dispatched, "maxPending": self.maxPending}
@@ -1,33 +1,98 @@
 """This module contains DTOs used to wrap the result of a query to BGG.
+
+Many games are kept at the same time in caches and in the chat history, so these
+classes use ``__slots__``, numeric fields are converted once when they are set, and
+the names of categories, mechanics, designers and artists are interned, since the
+same few thousands of them are shared by all games.
 """
+import sys
 
 import constants
 import exceptions
 
+def _toInt(value):
+    """Converts a numeric field received from BGG.
+
+    Args:
+        value (str): The value to convert, may be None or already an int.
+
+    Returns:
+        int: The value, or None if it is missing or not a number (like "Not Ranked").
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _toFloat(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 class BggObject():
     """The base type shared by all the other objects in this module.
 
+    Instances can be pickled and copied. Objects pickled before ``__slots__`` were
+    introduced are still loaded correctly.
+
     Args:
         type_ (str): The type of a game, used to obtain a specific instance without
             'casting'. Available types are the ones in :data:`.constants.BGG_TYPES`.
 
+    Attributes:
+        stale (bool): True if the object could not be refreshed from BGG, so it may be outdated.
+
     Raises:
         .exceptions.BggObjectNotSupported: If the type is not supported.
     """
+    __slots__ = ("type_", "stale")
+
     def __init__(self, type_):
         if type_ in constants.BGG_TYPES:
             self.type_ = type_
         else:
             raise exceptions.BggObjectNotSupported(type_)
+        self.stale = False
+
+    def _slots(self):
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                yield slot
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self._slots() if hasattr(self, slot)}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (dict state, slots state), as pickled by default for objects with slots
+            dictState, slotState = state
+            state = dict(dictState or {})
+            state.update(slotState or {})
+        self._setDefaults()
+        for key, value in state.items():
+            setattr(self, key, value)
+        self._normalize()
+
+    def _setDefaults(self):
+        """Sets the attributes which may be missing from old pickles."""
+        self.stale = False
+
+    def _normalize(self):
+        """Converts the attributes of old pickles to the current representation."""
+        pass
 
 class Game(BggObject):
     """This class models a game.
     """
+    __slots__ = ("id_", "name", "year", "average", "rank", "playingTime", "minPlayers", "maxPlayers",
+        "categories", "mechanics", "designers", "artists", "description", "thumbnail", "link", "msgId")
+
     def __init__(self, id_, name=None, year=None):
         super().__init__("g")
         self.id_ = id_
         self.name = name
-        self.year = year
+        self.year = _toInt(year)
 
         self.average = None
         self.rank = None
@@ -44,43 +109,60 @@ class Game(BggObject):
 
         self.msgId = None
 
+    def _setDefaults(self):
+        super()._setDefaults()
+        self.msgId = None
+
+    def _normalize(self):
+        # games pickled before numeric fields were converted hold strings
+        self.year = _toInt(self.year)
+        self.average = _toFloat(self.average)
+        self.rank = _toInt(self.rank)
+        self.playingTime = _toInt(self.playingTime)
+        self.minPlayers = _toInt(self.minPlayers)
+        self.maxPlayers = _toInt(self.maxPlayers)
+        self.categories = [sys.intern(category) for category in self.categories]
+        self.mechanics = [sys.intern(mechanic) for mechanic in self.mechanics]
+        self.designers = [sys.intern(designer) for designer in self.designers]
+        self.artists = [sys.intern(artist) for artist in self.artists]
+
     def setId(self, id_):
         self.id_ = id_
     def setName(self, name):
         self.name = name
     def setYear(self, year):
-        self.year = year
+        self.year = _toInt(year)
 
     def setAverage(self, avg):
-        self.average = avg
+        self.average = _toFloat(avg)
     def setRank(self, rank):
-        self.rank = rank
+        self.rank = _toInt(rank)
     def setPlayingTime(self, time):
-        self.playingTime = time
+        self.playingTime = _toInt(time)
     def setMinPlayers(self, minP):
-        self.minPlayers = minP
+        self.minPlayers = _toInt(minP)
     def setMaxPlayers(self, maxP):
-        self.maxPlayers = maxP
+        self.maxPlayers = _toInt(maxP)
     def addCategory(self, category):
-        self.categories.append(category)
+        self.categories.append(sys.intern(category))
     def numCategories(self):
         return len(self.categories)
     def getCategories(self):
         return self.categories
     def addMechanic(self, mechanic):
-        self.mechanics.append(mechanic)
+        self.mechanics.append(sys.intern(mechanic))
     def numMechanics(self):
         return len(self.mechanics)
     def getMechanics(self):
         return self.mechanics
     def addDesigner(self, designer):
-        self.designers.append(designer)
+        self.designers.append(sys.intern(designer))
     def numDesigners(self):
         return len(self.designers)
     def getDesigners(self):
         return self.designers
     def addArtist(self, artist):
-        self.artists.append(artist)
+        self.artists.append(sys.intern(artist))
     def numArtists(self):
         return len(self.artists)
     def getArtists(self):
@@ -98,12 +180,18 @@ class Game(BggObject):
     def toString(self):
         s = self.name + " (" + self.id_ + ")"
         if self.year is not None:
-            s += " - " + self.year
+            s += " - " + str(self.year)
         return s
 
 class GameList(BggObject):
     """This class models a game list.
+
+    Attributes:
+        total (int): The number of games found by BGG, which may be more than the games
+            in the list. None if unknown.
     """
+    __slots__ = ("gameList", "offset", "originalSearch", "msgId", "total")
+
     def __init__(self, gameList=None, offset=0, originalSearch=None):
         super().__init__("l")
         if gameList is None:
@@ -113,6 +201,12 @@ class GameList(BggObject):
         self.offset = offset
         self.originalSearch = originalSearch
         self.msgId = None
+        self.total = None
+
+    def _setDefaults(self):
+        super()._setDefaults()
+        self.msgId = None
+        self.total = None
 
     def addGame(self, game):
         self.gameList.append(game)
@@ -135,6 +229,14 @@ class GameList(BggObject):
     def get(self, index):
         return self.gameList[index]
 
+    def copy(self):
+        """Returns a new list with the same games, but without the navigation state
+        (offset, original search and message ID).
+        """
+        gameList = GameList(list(self.gameList))
+        gameList.total = self.total
+        return gameList
+
     # DEBUG
     def toString(self):
         s = ""
@@ -0,0 +1,158 @@
+"""This module contains the on-disk format of the history, which allows to start the bot
+without reading the whole history.
+
+Every entry of the history is stored as a record with a fixed-layout header (the kind of
+entry, "c" for chats and "u" for users, its ID, the time it was last used and the length
+of the pickled value which follows); a value of length 0 means the entry was discarded.
+The log of changes is a sequence of records, while the index starts with a table of
+fixed-size rows sorted by kind and ID, followed by the values: it is memory-mapped, so
+an entry is found with a binary search and only its value is unpickled.
+"""
+import os
+import mmap
+import struct
+import logging
+
+logger = logging.getLogger("history_index")
+
+RECORD = struct.Struct("<cqdI")
+"""Header of a record in the log: kind, ID, last access and length of the value."""
+ROW = struct.Struct("<cqdQI")
+"""Row of the index table: kind, ID, last access, offset and length of the value."""
+HEADER = struct.Struct("<8sQ")
+"""Header of the index: :data:`MAGIC` and number of rows."""
+MAGIC = b"BGBHIDX1"
+
+def packRecord(kind, key, lastAccess, data):
+    """Serializes a record for the log.
+
+    Args:
+        kind (str): "c" for a chat, "u" for a user.
+        key (int): The ID of the chat or user.
+        lastAccess (float): When the entry was last used.
+        data (bytes): The pickled value, empty if the entry was discarded.
+
+    Returns:
+        bytes: The record.
+    """
+    return RECORD.pack(kind.encode(), key, lastAccess, len(data)) + data
+
+def readRecords(file):
+    """Reads the records of a log. A truncated record at the end, left by a crash while
+    appending, is ignored with the rest of the file.
+
+    Args:
+        file (io.BufferedReader): The log, opened in binary mode.
+
+    Yields:
+        tuple: The kind, the ID, the last access and the value of each record.
+    """
+    while True:
+        header = file.read(RECORD.size)
+        if len(header) < RECORD.size:
+            if header:
+                logger.warning("Truncated record in history log, the rest is ignored")
+            return
+        kind, key, lastAccess, length = RECORD.unpack(header)
+        data = file.read(length)
+        if kind not in (b"c", b"u") or len(data) < length:
+            logger.warning("Truncated record in history log, the rest is ignored")
+            return
+        yield kind.decode(), key, lastAccess, data
+
+class HistoryIndex():
+    """A read-only view of an index file. Values are returned as memoryviews of the
+    mapped file, so they are not copied until they are unpickled.
+
+    Args:
+        path (str): The path of the index, written by :meth:`write`.
+
+    Raises:
+        ValueError: If the file is not an index.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self._count = HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic = None
+        if MAGIC != magic:
+            self._map.close()
+            raise ValueError("Not a history index: " + path)
+        self._view = memoryview(self._map)
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Unmaps the file.
+
+        Raises:
+            BufferError: If values returned by the index are still referenced.
+        """
+        self._view.release()
+        self._map.close()
+
+    def size(self):
+        return len(self._map)
+
+    def _row(self, position):
+        return ROW.unpack_from(self._map, HEADER.size + position * ROW.size)
+
+    def find(self, kind, key):
+        """Looks for an entry with a binary search on the table.
+
+        Args:
+            kind (str): "c" for a chat, "u" for a user.
+            key (int): The ID of the chat or user.
+
+        Returns:
+            tuple: The last access and the value of the entry, or None if it is not in
+            the index.
+        """
+        target = (kind.encode(), key)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            rowKind, rowKey, lastAccess, offset, length = self._row(middle)
+            if (rowKind, rowKey) < target:
+                low = middle + 1
+            elif (rowKind, rowKey) > target:
+                high = middle
+            else:
+                return lastAccess, self._view[offset:offset + length]
+        return None
+
+    def rows(self):
+        """Iterates on all the entries, sorted by kind and ID.
+
+        Yields:
+            tuple: The kind, the ID, the last access and the value of each entry.
+        """
+        for position in range(self._count):
+            kind, key, lastAccess, offset, length = self._row(position)
+            yield kind.decode(), key, lastAccess, self._view[offset:offset + length]
+
+    @staticmethod
+    def write(path, entries):
+        """Writes a new index, replacing the existing one atomically. Views of the old
+        index remain valid.
+
+        Args:
+            path (str): The path of the index.
+            entries (list): Tuples with the kind, the ID, the last access and the value
+                (bytes-like) of each entry, sorted by kind and ID.
+        """
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "wb") as file:
+            file.write(HEADER.pack(MAGIC, len(entries)))
+            offset = HEADER.size + len(entries) * ROW.size
+            for kind, key, lastAccess, data in entries:
+                file.write(ROW.pack(kind.encode(), key, lastAccess, offset, len(data)))
+                offset += len(data)
+            for kind, key, lastAccess, data in entries:
+                file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmpPath, path)
@@ -0,0 +1,342 @@
+"""This module contains the backends which store the history for :mod:`.history_manager`.
+
+:class:`MemoryHistoryStore` keeps the history in the memory of a single process, and is
+saved on disk by :mod:`.persistence_unit`. :class:`SqliteHistoryStore` keeps it in a
+SQLite database in WAL mode, which can be shared by several processes on the same host:
+every change is written through, in a transaction with the read which preceded it, so a
+callback is resolved correctly whichever process handles it, and concurrent changes of a
+chat are not lost.
+"""
+import time
+import pickle
+import contextlib
+import sqlite3
+import logging
+from collections import OrderedDict, deque
+
+import constants
+
+logger = logging.getLogger("history_store")
+
+class HistoryStore():
+    """The interface of the backends. Chat histories returned by :meth:`getChat` are not
+    saved when they change, they must be passed to :meth:`putChat`, in the same
+    :meth:`transaction`.
+    """
+    @contextlib.contextmanager
+    def transaction(self):
+        """Makes the reads and the changes in the ``with`` block atomic, for backends shared
+        by several processes. If the block raises, its changes are discarded.
+        """
+        yield
+    def getChat(self, chatId):
+        """Gets the history of a chat.
+
+        Args:
+            chatId (int): The ID of the chat.
+
+        Returns:
+            .chat_history.ChatHistory: The history, or None if there is none or it has
+            been idle for longer than :data:`.constants.HISTORY_MAX_IDLE`.
+        """
+        raise NotImplementedError()
+
+    def putChat(self, chatId, chatHistory):
+        """Saves a new or changed history of a chat, as the most recently used.
+
+        Args:
+            chatId (int): The ID of the chat.
+            chatHistory (.chat_history.ChatHistory): The history.
+        """
+        raise NotImplementedError()
+
+    def touchChat(self, chatId, chatHistory):
+        """Marks as the most recently used a chat which was only read.
+
+        Args:
+            chatId (int): The ID of the chat.
+            chatHistory (.chat_history.ChatHistory): The history, marked as used with
+                :meth:`~.chat_history.ChatHistory.touch`.
+        """
+        raise NotImplementedError()
+
+    def getUser(self, userId):
+        """Gets the private chat of a user.
+
+        Args:
+            userId (int): The ID of the user.
+
+        Returns:
+            int: The ID of the private chat, or None if it is not known.
+        """
+        raise NotImplementedError()
+
+    def putUser(self, userId, chatId):
+        """Sets the private chat of a user, as the most recently used.
+
+        Args:
+            userId (int): The ID of the user.
+            chatId (int): The ID of the private chat.
+        """
+        raise NotImplementedError()
+
+    def sweep(self):
+        """Discards some of the entries which have been idle for longer than
+        :data:`.constants.HISTORY_MAX_IDLE`. It must be quick enough to be called often
+        on the event loop.
+
+        Returns:
+            int: The number of discarded entries.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+class MemoryHistoryStore(HistoryStore):
+    """Keeps the history in memory, in order of last use, so that the least recently used
+    entries can be discarded in constant time: when there are too many of them, and by
+    :meth:`sweep` when they have been idle for too long.
+
+    Every change is also recorded, so that :mod:`.persistence_unit` only saves the
+    entries which changed since the last save (see :meth:`takeChanges`). Entries which
+    are not in memory are looked up with :attr:`loader`, so that the history saved on
+    disk is loaded one entry at a time, the first time it is used.
+    """
+    def __init__(self):
+        self.chats = OrderedDict()
+        """A dictionary where keys are chat IDs and values are
+        :class:`~.chat_history.ChatHistory` objects, from the least to the most recently used.
+        """
+        self.users = OrderedDict()
+        """A dictionary where keys are user IDs and values are tuples with the ID of the
+        private chat corresponding to the user and the time it was last used, from the
+        least to the most recently used.
+        """
+        self.loader = None
+        """A function which gets an entry from the saved history, see :meth:`setLoader`."""
+        self._changes = deque()
+        # the entries changed since the last save, as tuples of ("c", chat ID) or
+        # ("u", user ID); it is emptied by the thread which saves the history, so it is
+        # a deque, whose appends and pops are thread-safe
+        self._discarded = set()
+        # the entries discarded since the history was loaded, which must not be loaded again
+
+    def _history(self, kind):
+        return self.chats if "c" == kind else self.users
+
+    def _maxSize(self, kind):
+        return constants.HISTORY_MAX_CHATS if "c" == kind else constants.HISTORY_MAX_USERS
+
+    def _lastAccess(self, kind, value):
+        return value.lastAccess if "c" == kind else value[1]
+
+    def _discard(self, kind, key):
+        self._discarded.add((kind, key))
+        self._changes.append((kind, key))
+
+    def _lookup(self, kind, key):
+        """Gets an entry, loading it with :attr:`loader` if it is not in memory.
+
+        Args:
+            kind (str): "c" for :attr:`chats`, "u" for :attr:`users`.
+            key (int): The ID of the chat or user.
+
+        Returns:
+            object: The entry, or None if there is none or it is idle.
+        """
+        history = self._history(kind)
+        value = history.get(key)
+        if value is not None or self.loader is None or (kind, key) in self._discarded:
+            return value
+        value = self.loader(kind, key)
+        if value is None:
+            return None
+        if self._lastAccess(kind, value) < time.time() - constants.HISTORY_MAX_IDLE:
+            self._discard(kind, key)
+            return None
+        history[key] = value
+        self._evictOverflow(kind)
+        return value
+
+    def _put(self, kind, key, value):
+        history = self._history(kind)
+        history[key] = value
+        history.move_to_end(key)
+        self._discarded.discard((kind, key))
+        self._changes.append((kind, key))
+        self._evictOverflow(kind)
+
+    def _evictOverflow(self, kind):
+        """Discards the least recently used entries, until there are no more than
+        :data:`.constants.HISTORY_MAX_CHATS` chats or :data:`.constants.HISTORY_MAX_USERS`
+        users. Since an entry is added at a time, it discards at most one entry.
+        """
+        history = self._history(kind)
+        while len(history) > self._maxSize(kind):
+            key, value = history.popitem(last=False)
+            self._discard(kind, key)
+
+    def _evictIdle(self, kind, minAccess):
+        """Discards the least recently used entries, if they were last used before
+        minAccess. At most :data:`.constants.HISTORY_SWEEP_BATCH` entries are examined.
+
+        Returns:
+            int: The number of discarded entries.
+        """
+        history = self._history(kind)
+        evicted = 0
+        while history and evicted < constants.HISTORY_SWEEP_BATCH:
+            key, value = next(iter(history.items()))
+            if self._lastAccess(kind, value) >= minAccess:
+                break
+            del history[key]
+            self._discard(kind, key)
+            evicted += 1
+        return evicted
+
+    def getChat(self, chatId):
+        return self._lookup("c", chatId)
+
+    def putChat(self, chatId, chatHistory):
+        self._put("c", chatId, chatHistory)
+
+    def touchChat(self, chatId, chatHistory):
+        # the whole entry is saved anyway, the time of last use is in it
+        self._put("c", chatId, chatHistory)
+
+    def getUser(self, userId):
+        user = self._lookup("u", userId)
+        return user[0] if user is not None else None
+
+    def putUser(self, userId, chatId):
+        self._put("u", userId, (chatId, time.time()))
+
+    def sweep(self):
+        minAccess = time.time() - constants.HISTORY_MAX_IDLE
+        return self._evictIdle("c", minAccess) + self._evictIdle("u", minAccess)
+
+    def setHistory(self, chats, users):
+        """Replaces the history, for example with the one saved on disk. Histories saved
+        before entries were kept in order of last use are converted.
+
+        Args:
+            chats (dict): See :attr:`chats`.
+            users (dict): See :attr:`users`. Values can also be plain chat IDs.
+        """
+        self._discarded.clear()
+        now = time.time()
+        self.chats = OrderedDict(sorted(chats.items(), key=lambda item: item[1].lastAccess))
+        users = [(userId, entry if isinstance(entry, tuple) else (entry, now)) for userId, entry in users.items()]
+        self.users = OrderedDict(sorted(users, key=lambda item: item[1][1]))
+        self._evictOverflow("c")
+        self._evictOverflow("u")
+
+    def setLoader(self, loader):
+        """Sets the function which gets the entries which are not in memory.
+
+        Args:
+            loader (Callable[[str,int],object]): A function which takes "c" or "u" and
+                the ID of a chat or user, and returns the saved entry (see :attr:`chats`
+                and :attr:`users`) or None. It is called on the event loop.
+        """
+        self.loader = loader
+
+    def takeChanges(self):
+        """Collects the entries changed since the last call. The values are the ones in
+        the history, so they must be used before the event loop changes them again (see
+        :func:`.persistence_unit.takeSnapshot`).
+
+        Returns:
+            list: A list of tuples with "c" (for a chat) or "u" (for a user), the ID and
+            the current value of the entry, which is None if the entry was discarded.
+        """
+        keys = set()
+        while True:
+            try:
+                keys.add(self._changes.popleft())
+            except IndexError:
+                break
+        return [(kind, key, self._history(kind).get(key)) for kind, key in keys]
+
+    def restoreChanges(self, records):
+        """Marks again as changed the entries returned by :meth:`takeChanges`, if they
+        could not be saved.
+        """
+        for kind, key, value in records:
+            self._changes.append((kind, key))
+
+class SqliteHistoryStore(HistoryStore):
+    """Keeps the history in a SQLite database in WAL mode, shared by all the processes
+    which open it. Every change is committed at once, without waiting for the disk
+    (``synchronous=NORMAL``), so the queries are quick enough to run on the event loop.
+    Reads only update the time of last use, without writing the history again.
+
+    Transactions take the write lock at once (``BEGIN IMMEDIATE``), so two processes
+    cannot both read a chat and then overwrite each other's change. They are short, so
+    a process waits for the lock at most :data:`.constants.HISTORY_DB_TIMEOUT` seconds,
+    and the event loop is never blocked for long: if the lock is not obtained, the
+    update fails with :class:`sqlite3.OperationalError`.
+
+    Args:
+        path (str): The path of the database, created if needed.
+    """
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=constants.HISTORY_DB_TIMEOUT, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS chats (id INTEGER PRIMARY KEY, data BLOB NOT NULL, accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chats_accessed ON chats (accessed)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, chat INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS users_accessed ON users (accessed)")
+        logger.info("History database opened: " + path)
+
+    def getChat(self, chatId):
+        row = self._connection.execute("SELECT data FROM chats WHERE id = ? AND accessed >= ?",
+            (chatId, time.time() - constants.HISTORY_MAX_IDLE)).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except (pickle.UnpicklingError, EOFError, AttributeError):
+            logger.exception("Cannot read history of chat " + str(chatId))
+            return None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def putChat(self, chatId, chatHistory):
+        self._connection.execute("INSERT OR REPLACE INTO chats (id, data, accessed) VALUES (?, ?, ?)",
+            (chatId, pickle.dumps(chatHistory, -1), chatHistory.lastAccess))
+
+    def touchChat(self, chatId, chatHistory):
+        self._connection.execute("UPDATE chats SET accessed = ? WHERE id = ?", (chatHistory.lastAccess, chatId))
+
+    def getUser(self, userId):
+        row = self._connection.execute("SELECT chat FROM users WHERE id = ? AND accessed >= ?",
+            (userId, time.time() - constants.HISTORY_MAX_IDLE)).fetchone()
+        return row[0] if row is not None else None
+
+    def putUser(self, userId, chatId):
+        self._connection.execute("INSERT OR REPLACE INTO users (id, chat, accessed) VALUES (?, ?, ?)",
+            (userId, chatId, time.time()))
+
+    def sweep(self):
+        # HISTORY_MAX_CHATS and HISTORY_MAX_USERS bound the memory, so they do not apply here
+        minAccess = time.time() - constants.HISTORY_MAX_IDLE
+        evicted = 0
+        for table in ("chats", "users"):
+            cursor = self._connection.execute("DELETE FROM " + table + " WHERE id IN (SELECT id FROM " + table
+                + " WHERE accessed < ? LIMIT ?)", (minAccess, constants.HISTORY_SWEEP_BATCH))
+            evicted += cursor.rowcount
+        return evicted
+
+    def close(self):
+        self._connection.close()
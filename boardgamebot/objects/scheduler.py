@@ -0,0 +1,208 @@
+"""This module contains the classes used to pace the requests sent to external services.
+"""
+import time
+import heapq
+import asyncio
+import itertools
+
+import exceptions
+
+class TokenBucket():
+    """A token bucket: tokens are added at a constant rate, up to a maximum, and every
+    request consumes one of them.
+
+    Args:
+        rate (float): The number of tokens added every second.
+        capacity (float): The maximum number of tokens, that is the largest burst allowed.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._lastRefill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._lastRefill) * self.rate)
+        self._lastRefill = now
+
+    def tryTake(self):
+        """Consumes a token if one is available.
+
+        Returns:
+            bool: True if a token was consumed.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Returns the number of seconds until a token is available.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class Ticket():
+    """Tracks a request in a :class:`RequestScheduler`, so that its priority can be raised
+    while it waits, see :meth:`RequestScheduler.promote`.
+
+    Args:
+        priority (int): The initial priority of the request.
+
+    Attributes:
+        priority (int): The priority of the request, raised by promotions.
+    """
+    def __init__(self, priority):
+        self.priority = priority
+        self.entry = None
+        # the entry in the waiting heap, while the request waits
+        self.timer = None
+        self.since = None
+
+class RequestScheduler():
+    """Grants permission to send requests according to a :class:`TokenBucket`. When no
+    token is available, requests wait in priority lanes: a lower number means a higher
+    priority, and requests with the same priority are served in order of arrival.
+
+    When too many requests are waiting, the one with the lowest priority is shed, and
+    requests waiting longer than the limit of their lane are shed as well.
+
+    Args:
+        bucket (TokenBucket): The bucket which limits the rate of the requests.
+        maxWaiting (int): The maximum number of requests waiting at the same time.
+        maxWait (dict): A dictionary where keys are priorities and values are the maximum
+            number of seconds a request with that priority may wait.
+    """
+    def __init__(self, bucket, maxWaiting, maxWait):
+        self.bucket = bucket
+        self.maxWaiting = maxWaiting
+        self.maxWait = maxWait
+        self._waiting = []
+        # heap of (priority, arrival number, future)
+        self._arrivals = itertools.count()
+        self._timer = None
+        self.granted = 0
+        self.shed = 0
+
+    async def acquire(self, priority, ticket=None):
+        """Waits until a request with the given priority may be sent.
+
+        Args:
+            priority (int): The priority of the request.
+            ticket (Ticket): If given, it tracks the request while it waits, so that it
+                can be promoted.
+
+        Raises:
+            .exceptions.RequestShed: If the request was shed.
+        """
+        if not self._waiting and self.bucket.tryTake():
+            self.granted += 1
+            return
+        if len(self._waiting) >= self.maxWaiting:
+            self._shedLowest(priority)
+        if ticket is None:
+            ticket = Ticket(priority)
+        future = asyncio.get_event_loop().create_future()
+        ticket.entry = (priority, next(self._arrivals), future)
+        ticket.since = time.monotonic()
+        heapq.heappush(self._waiting, ticket.entry)
+        self._setTimeout(ticket, priority)
+        self._schedule()
+        try:
+            await future
+        finally:
+            ticket.entry = None
+            if ticket.timer is not None:
+                ticket.timer.cancel()
+                ticket.timer = None
+
+    def _setTimeout(self, ticket, priority):
+        """Sheds the request of a ticket when it has waited longer than the limit of its lane."""
+        if ticket.timer is not None:
+            ticket.timer.cancel()
+            ticket.timer = None
+        maxWait = self.maxWait[priority]
+        if maxWait is not None:
+            delay = max(0, ticket.since + maxWait - time.monotonic())
+            ticket.timer = asyncio.get_event_loop().call_later(delay, self._expire, ticket.entry[2])
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_exception(exceptions.RequestShed())
+            self.shed += 1
+
+    def promote(self, ticket, priority):
+        """Raises the priority of a request, for example when a more important caller is
+        waiting for it. If the request is waiting, it moves to its new lane, keeping its
+        arrival, and the time it can wait becomes the limit of the new lane.
+
+        Args:
+            ticket (Ticket): The ticket of the request.
+            priority (int): The new priority. It is ignored if it is not higher than the
+                current one.
+        """
+        if priority >= ticket.priority:
+            return
+        ticket.priority = priority
+        entry = ticket.entry
+        if entry is None or entry[2].done():
+            return
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        ticket.entry = (priority,) + entry[1:]
+        heapq.heappush(self._waiting, ticket.entry)
+        self._setTimeout(ticket, priority)
+
+    def _shedLowest(self, priority):
+        """Makes room for a new request, shedding the waiting request with the lowest
+        priority (the most recent one among equals) if it is less important than the new one.
+
+        Args:
+            priority (int): The priority of the new request.
+
+        Raises:
+            .exceptions.RequestShed: If the new request is the one to shed.
+        """
+        lowest = max(self._waiting, key=lambda entry: entry[:2])
+        if lowest[0] <= priority:
+            self.shed += 1
+            raise exceptions.RequestShed()
+        self._waiting.remove(lowest)
+        heapq.heapify(self._waiting)
+        if not lowest[2].done():
+            lowest[2].set_exception(exceptions.RequestShed())
+        self.shed += 1
+
+    def _schedule(self):
+        if self._waiting and self._timer is None:
+            loop = asyncio.get_event_loop()
+            self._timer = loop.call_later(self.bucket.delay(), self._grant)
+
+    def _grant(self):
+        """Lets waiting requests go, in order of priority, as long as there are tokens.
+        Requests which stopped waiting (because they timed out or were cancelled) are discarded.
+        """
+        self._timer = None
+        while self._waiting:
+            future = self._waiting[0][2]
+            if future.done():
+                heapq.heappop(self._waiting)
+            elif self.bucket.tryTake():
+                heapq.heappop(self._waiting)
+                future.set_result(None)
+                self.granted += 1
+            else:
+                break
+        self._schedule()
+
+    def stats(self):
+        """Returns the counters of the scheduler.
+
+        Returns:
+            dict: The number of waiting, granted and shed requests.
+        """
+        return {"waiting": len(self._waiting), "granted": self.granted, "shed": self.shed}
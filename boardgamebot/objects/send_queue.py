@@ -0,0 +1,156 @@
+"""This module contains the queue which paces the messages sent to Telegram.
+"""
+import asyncio
+import logging
+import collections
+
+import constants
+from objects import scheduler
+
+logger = logging.getLogger("send_queue")
+
+class _Send():
+    """A call waiting in :class:`SendQueue`."""
+    def __init__(self, call, editKey):
+        self.call = call
+        self.editKey = editKey
+        self.attempts = 0
+        self.future = asyncio.get_event_loop().create_future()
+
+class SendQueue():
+    """Sends the answers of the bot within the flood limits of Telegram: every chat has a
+    :class:`~.scheduler.TokenBucket`, and all the chats share a
+    :class:`~.scheduler.RequestScheduler`. Calls wait instead of failing, so the latency
+    of the answers grows smoothly with the load.
+
+    The calls of a chat are made in order by a task, which ends when the chat has nothing
+    more to send. An edit of a message which is still waiting replaces the waiting one,
+    since only the latest state of a message matters. When Telegram answers that a chat
+    is sending too much, the chat is paused for the time requested and the call is retried.
+
+    Args:
+        retryAfter (Callable[[Exception],float]): A function which returns the number of
+            seconds to wait before retrying a call which failed with the given exception,
+            or None if the call must not be retried.
+
+    Attributes:
+        sent (int): The number of calls made.
+        collapsed (int): The number of edits replaced by a later one.
+        retried (int): The number of calls retried after a flood error.
+    """
+    def __init__(self, retryAfter):
+        self._retryAfter = retryAfter
+        self._global = scheduler.RequestScheduler(
+            scheduler.TokenBucket(constants.TELEGRAM_SEND_RATE, constants.TELEGRAM_SEND_BURST),
+            float("inf"), {0: None, 1: None})
+        self._queues = {}
+        self._buckets = {}
+        # buckets of the chats which sent recently, kept until they are full again
+        self._edits = {}
+        # waiting edits, by edit key
+        self.sent = 0
+        self.collapsed = 0
+        self.retried = 0
+
+    async def send(self, key, call, editKey=None):
+        """Makes a call to Telegram when the limits allow it.
+
+        Args:
+            key (int): The ID of the chat the call sends to. If None, the call is only
+                subject to the global limit and is made before the other ones, like the
+                answers to callback queries, which must be quick.
+            call (Callable[[],Coroutine]): The call, usually a :func:`functools.partial`
+                of a method of the bot.
+            editKey (object): For edits, an identifier of the edited message: a waiting
+                edit with the same key is replaced by this one.
+
+        Returns:
+            The result of the call, or of the call which replaced it.
+        """
+        if key is None:
+            await self._global.acquire(0)
+            self.sent += 1
+            return await call()
+        if editKey is not None and editKey in self._edits:
+            send = self._edits[editKey]
+            send.call = call
+            self.collapsed += 1
+        else:
+            send = _Send(call, editKey)
+            if editKey is not None:
+                self._edits[editKey] = send
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = collections.deque()
+                self._queues[key] = queue
+                asyncio.ensure_future(self._run(key, queue))
+            queue.append(send)
+        # the future may be shared by the edits it replaced
+        return await asyncio.shield(send.future)
+
+    def _bucket(self, key):
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = scheduler.TokenBucket(constants.TELEGRAM_CHAT_SEND_RATE, constants.TELEGRAM_CHAT_SEND_BURST)
+        return bucket
+
+    def _keepBucket(self, key, bucket):
+        """Keeps the bucket of a chat which has nothing more to send until it is full
+        again, since a new bucket would allow a burst too soon.
+        """
+        delay = (bucket.capacity - bucket.tokens) / bucket.rate
+        if delay > 0:
+            self._buckets[key] = bucket
+            asyncio.get_event_loop().call_later(delay, self._dropBucket, key, bucket)
+
+    def _dropBucket(self, key, bucket):
+        if self._buckets.get(key) is bucket:
+            del self._buckets[key]
+
+    async def _run(self, key, queue):
+        bucket = self._bucket(key)
+        try:
+            while queue:
+                # the call stays in the queue while it waits, so that edits can replace it
+                send = queue[0]
+                while not bucket.tryTake():
+                    await asyncio.sleep(bucket.delay())
+                await self._global.acquire(1)
+                queue.popleft()
+                if send.editKey is not None and self._edits.get(send.editKey) is send:
+                    del self._edits[send.editKey]
+                await self._call(key, queue, send)
+        finally:
+            del self._queues[key]
+            self._keepBucket(key, bucket)
+
+    async def _call(self, key, queue, send):
+        send.attempts += 1
+        try:
+            result = await send.call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            delay = self._retryAfter(err)
+            if delay is None or send.attempts >= constants.TELEGRAM_SEND_ATTEMPTS:
+                send.future.set_exception(err)
+                return
+            logger.warning("Flood limit in chat " + str(key) + ", retrying in " + str(delay) + " seconds")
+            self.retried += 1
+            queue.appendleft(send)
+            if send.editKey is not None and send.editKey not in self._edits:
+                self._edits[send.editKey] = send
+            await asyncio.sleep(delay)
+            return
+        self.sent += 1
+        send.future.set_result(result)
+
+    def stats(self):
+        """Returns the counters of the queue.
+
+        Returns:
+            dict: The number of chats with calls waiting, the calls waiting, and the
+            calls made, collapsed and retried.
+        """
+        return {"chats": len(self._queues), "waiting": sum(len(queue) for queue in self._queues.values()),
+            "sent": self.sent, "collapsed": self.collapsed, "retried": self.retried}
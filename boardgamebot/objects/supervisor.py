@@ -0,0 +1,184 @@
+"""This module contains the supervisor which runs the bot in several worker processes.
+"""
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+import constants
+
+logger = logging.getLogger("supervisor")
+
+def shardOf(key, workers):
+    """Returns the worker which handles the updates with the given key.
+
+    Args:
+        key (int): The key of the update, see :func:`.asyncbot.chatKey`.
+        workers (int): The number of workers.
+
+    Returns:
+        int: The index of the worker.
+    """
+    return hash(key) % workers
+
+_STOP = object()
+
+class _Channel():
+    """Carries the updates of the supervisor to a worker process, through a pipe. A thread
+    writes the updates to the pipe, so that routing never blocks when the worker is slow.
+
+    Every process of a worker gets a new channel. A pipe, unlike a
+    :class:`multiprocessing.Queue`, has no lock shared between processes, which a worker
+    dying while it waits for an update would never release.
+
+    Args:
+        context (multiprocessing.context.BaseContext): The context of the workers.
+
+    Attributes:
+        reader (multiprocessing.connection.Connection): The end of the pipe for the worker.
+    """
+    def __init__(self, context):
+        self.reader, self._writer = context.Pipe(duplex=False)
+        self._outbox = queue.Queue()
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+    def put(self, msg):
+        self._outbox.put(msg)
+
+    def _feed(self):
+        while True:
+            msg = self._outbox.get()
+            if msg is _STOP:
+                break
+            try:
+                self._writer.send(msg)
+            except OSError:
+                # the pipe was closed by close(), the update is lost
+                logger.error("Cannot send an update to a worker, update dropped")
+        self._writer.close()
+
+    def close(self):
+        """Closes the channel of a worker which is not running anymore.
+
+        Returns:
+            list: The updates the worker did not receive, in order.
+        """
+        self._outbox.put(_STOP)
+        pending = []
+        # the supervisor has its own copy of the end of the worker, so it reads the
+        # updates left in the pipe, which also lets the thread send the queued ones
+        try:
+            while self._feeder.is_alive() or self.reader.poll():
+                if self.reader.poll(0.1):
+                    pending.append(self.reader.recv())
+        except (EOFError, OSError):
+            pass
+        except Exception:
+            # the worker died while receiving an update, the rest of the pipe is unreadable
+            logger.exception("Cannot read the updates left to a worker")
+        self.reader.close()
+        self._feeder.join()
+        return pending
+
+class Supervisor():
+    """Starts the worker processes, routes the updates to them and starts again the ones
+    which die.
+
+    Every worker has its own channel, and the updates are routed by key (see
+    :func:`shardOf`), so the updates of a chat are always handled by the same worker,
+    which keeps its history. When a worker dies, the updates it did not receive are taken
+    back from its channel and routed to the worker started in its place.
+
+    Workers are spawned, not forked, since the supervisor has a running event loop and
+    threads when a worker is started again.
+
+    Args:
+        target (Callable): The function run by a worker. It receives the index of the
+            worker, the number of workers, the
+            :class:`~multiprocessing.connection.Connection` it receives the updates from
+            and ``args``.
+        workers (int): The number of workers.
+        args (tuple): More arguments for target, which must be picklable.
+
+    Attributes:
+        restarts (int): The number of workers started again.
+    """
+    def __init__(self, target, workers, args=()):
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self._args = args
+        self._channels = [None] * workers
+        self._processes = [None] * workers
+        self._started = [0] * workers
+        self._stopping = False
+        self.restarts = 0
+
+    def _startWorker(self, index):
+        channel = _Channel(self._context)
+        process = self._context.Process(target=self._target, name="worker-" + str(index),
+            args=(index, len(self._channels), channel.reader) + tuple(self._args))
+        process.start()
+        self._channels[index] = channel
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+        logger.info("Worker " + str(index) + " started with PID " + str(process.pid))
+
+    def start(self):
+        for index in range(len(self._channels)):
+            self._startWorker(index)
+
+    def route(self, key, msg):
+        """Sends an update to its worker. It never blocks.
+
+        Args:
+            key (int): The key of the update, see :func:`shardOf`.
+            msg (object): The update, which must be picklable.
+        """
+        self._channels[shardOf(key, len(self._channels))].put(msg)
+
+    def check(self):
+        """Starts again the workers which died. A worker is not started again before
+        :data:`.constants.WORKER_RESTART_DELAY` seconds from its last start, so that a
+        worker which fails at startup does not use all the CPU.
+        """
+        if self._stopping:
+            return
+        for index, process in enumerate(self._processes):
+            if process.is_alive() or time.monotonic() - self._started[index] < constants.WORKER_RESTART_DELAY:
+                continue
+            logger.error("Worker " + str(index) + " exited with code " + str(process.exitcode) + ", starting it again")
+            process.join()
+            pending = self._channels[index].close()
+            self._startWorker(index)
+            for msg in pending:
+                self._channels[index].put(msg)
+            if pending:
+                logger.info(str(len(pending)) + " updates routed again to worker " + str(index))
+            self.restarts += 1
+
+    def stop(self):
+        """Stops the workers, which save their history before exiting, and waits for them.
+        """
+        self._stopping = True
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join(constants.WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.error("Worker " + process.name + " did not stop in time")
+        for channel in self._channels:
+            dropped = len(channel.close())
+            if dropped:
+                logger.warning(str(dropped) + " updates dropped at shutdown")
+
+    def stats(self):
+        """Returns the counters of the supervisor.
+
+        Returns:
+            dict: The number of workers, the workers alive and the restarts.
+        """
+        return {"workers": len(self._processes), "alive": sum(1 for process in self._processes if process.is_alive()),
+            "restarts": self.restarts}
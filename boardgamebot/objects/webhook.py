@@ -0,0 +1,135 @@
+"""This module contains the server which receives the updates of Telegram through a webhook.
+"""
+import hmac
+import asyncio
+import logging
+from aiohttp import web
+
+import constants
+
+logger = logging.getLogger("webhook")
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer():
+    """Receives the updates which Telegram posts to the webhook, and feeds them to the
+    handler of the bot, like :meth:`.asyncbot.BggBot.handle`.
+
+    Updates are only accepted at a secret path, and with the secret token header if one
+    is set. They are put in a bounded queue and acknowledged at once, so Telegram never
+    waits for a search: when the queue is full Telegram gets a 503, and sends the update
+    again later. A few tasks take the updates from the queue and hand them to the handler.
+
+    Args:
+        handler (Callable[[dict],Coroutine]): The coroutine function which handles the
+            message contained in an update.
+        secret (str): The path, without the leading slash, where updates are accepted.
+        secretToken (str): The value of the ``X-Telegram-Bot-Api-Secret-Token`` header
+            required in every request. If None, the header is not checked.
+
+    Attributes:
+        received (int): The number of updates accepted.
+        refused (int): The number of updates refused because the queue was full.
+        rejected (int): The number of requests rejected as invalid or unauthorized.
+    """
+    UPDATE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post",
+        "callback_query", "inline_query", "chosen_inline_result")
+    """The fields of an update which contain a message for the handler."""
+
+    def __init__(self, handler, secret, secretToken=None):
+        self._handler = handler
+        self._secret = secret
+        self._secretToken = secretToken
+        self._queue = asyncio.Queue(maxsize=constants.WEBHOOK_QUEUE_SIZE)
+        self._workers = []
+        self._runner = None
+        self.received = 0
+        self.refused = 0
+        self.rejected = 0
+
+    def makeApp(self):
+        app = web.Application()
+        app.router.add_route("POST", "/" + self._secret, self._receive)
+        return app
+
+    async def _receive(self, request):
+        """Validates an update and puts it in the queue.
+
+        Args:
+            request (aiohttp.web.Request): The request sent by Telegram.
+
+        Returns:
+            aiohttp.web.Response: 200 if the update was accepted, 403 if the secret
+            token is wrong, 400 if the update is not valid, 503 if the queue is full.
+        """
+        if self._secretToken is not None:
+            token = request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(token.encode(), self._secretToken.encode()):
+                self.rejected += 1
+                logger.warning("Update with a wrong secret token from " + str(request.remote))
+                return web.Response(status=403)
+        try:
+            update = await request.json()
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            self.rejected += 1
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.refused += 1
+            logger.warning("Webhook queue full, update refused")
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response()
+
+    async def _work(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                for updateType in self.UPDATE_TYPES:
+                    if updateType in update:
+                        await self._handler(update[updateType])
+                        break
+                else:
+                    logger.debug("Update not supported: " + str(list(update)))
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.exception("Error while handling update " + str(update.get("update_id")))
+
+    async def start(self, host, port):
+        """Starts the server and the tasks which empty the queue.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, 0 for any free port.
+
+        Returns:
+            int: The port the server listens on.
+        """
+        self._runner = web.AppRunner(self.makeApp())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._workers = [asyncio.ensure_future(self._work()) for i in range(constants.WEBHOOK_WORKERS)]
+        port = self._runner.addresses[0][1]
+        logger.info("Webhook listening on " + host + ":" + str(port))
+        return port
+
+    async def stop(self):
+        """Stops the server. Updates still in the queue are dropped, since Telegram did
+        not wait for them: it is only called when the bot shuts down.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def stats(self):
+        """Returns the counters of the server.
+
+        Returns:
+            dict: The number of queued, accepted, refused and rejected updates.
+        """
+        return {"queued": self._queue.qsize(), "received": self.received, "refused": self.refused, "rejected": self.rejected}
@@ -1,7 +1,12 @@
 """This module is the core of the bot. It communicates with all the other parts of the application.
+
+The entry points are coroutines, because every search goes through the asynchronous
+:mod:`.http` client, so a request waiting for BGG never blocks the others. Synchronous
+wrappers are provided for tests and scripts.
 """
 
 import sys
+import asyncio
 import logging
 
 import exceptions
@@ -10,13 +15,14 @@ from tools import input_parser
 from tools import history_manager
 from tools import http
 from tools import output_formatter
+from tools import offload
 from objects import chat_history
 from objects import answer
 
 logger = logging.getLogger("request_manager")
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure
-def _searchByName(name, chatId):
+async def _searchByName(name, chatId):
     """Searches for a boardgame using part of the name.
 
     Args:
@@ -26,10 +32,10 @@ def _searchByName(name, chatId):
     Returns:
         .answer.TelegramAnswer: An object containing all the information to be sent.
     """
-    return _searchList(name, http.searchByName, chatId)
+    return await _searchList(name, False, chatId)
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure
-def _searchByNameExact(name, chatId):
+async def _searchByNameExact(name, chatId):
     """Searches for a boardgame by name,  trying to match the name exactly.
 
     Args:
@@ -39,31 +45,58 @@ def _searchByNameExact(name, chatId):
     Returns:
         .answer.TelegramAnswer: An object containing all the information to be sent.
     """
-    return _searchList(name, http.searchByNameExact, chatId)
+    return await _searchList(name, True, chatId)
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure all 
-def _searchList(searchString, httpSearch, chatId):
+async def _searchList(searchString, exact, chatId):
     """Called by all functions that expect a list of games as result. If the match
     is unique, the result of :func:`_searchById` is returned instead.
 
     Args:
         searchString (str): The string to pass to the search function.
-        httpSearch (Callable[[str],game.gameList]): The function to use to search.
+        exact (bool): Whether the name should be matched exactly or not.
         chatId (int): The ID of the chat where the request came from.
 
     Returns:
         .answer.TelegramAnswer: An object containing all the information to be sent.
     """
-    gameList = httpSearch(searchString)
-    gameList.setOriginalSearch(searchString)
+    gameList = await _getGameList(searchString, exact)
     if (1 == gameList.length()):
         id_ = gameList.get(0).id_
-        return _searchById(id_, chatId)
-    history_manager.updateLastGameList(gameList, chatId)
+        return await _searchById(id_, chatId)
+    history_manager.updateLastGameList(gameList, chatId, exact)
     return output_formatter.formatGameList(gameList)
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure
-def _searchById(id_, chatId, more=False):
+async def _getGameList(searchString, exact, offset=0):
+    """Searches a list of games by name, setting its navigation state.
+
+    Args:
+        searchString (str): The string to pass to the search function.
+        exact (bool): Whether the name should be matched exactly or not.
+        offset (int): The offset of the page to show.
+
+    Returns:
+        .game.GameList: The list of games.
+    """
+    httpSearch = http.searchByNameExact if exact else http.searchByName
+    gameList = await httpSearch(searchString)
+    gameList.setOriginalSearch(searchString)
+    gameList.setOffset(offset)
+    return gameList
+
+async def _formatGame(game, more):
+    """Formats a game, out of the event loop if its description is long enough to be
+    worth it (see :mod:`.offload`).
+
+    Returns:
+        .answer.TelegramAnswer: See ``Returns`` in :func:`.output_formatter.formatGame`.
+    """
+    size = len(game.description) if more and game.description is not None else 0
+    return await offload.run("format", size, output_formatter.formatGame, game, more)
+
+# reraises BggUnreachable, NoResultFound and InvalidXmlStructure
+async def _searchById(id_, chatId, more=False):
     """Searches for a boardgame by ID.
     
     Args:
@@ -77,13 +110,13 @@ def _searchById(id_, chatId, more=False):
     Raises:
         .exceptions.NoResultFound: If no game corresponds to the ID.
     """
-    game = http.searchById(id_)
-    formattedGame = output_formatter.formatGame(game, more)
-    history_manager.updateLastGame(game, formattedGame.formattedAnswer, chatId)
+    game = await http.searchById(id_)
+    formattedGame = await _formatGame(game, more)
+    history_manager.updateLastGame(game, chatId)
     return formattedGame
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure
-def _searchByIdInline(id_):
+async def _searchByIdInline(id_):
     """Searches for a game by ID and returns an inline answer.
 
     Args:
@@ -93,16 +126,17 @@ def _searchByIdInline(id_):
         answer.TelegramInlineAnswer: An object containing all the information
             about a single entry in the list of results which is to be returned.
     """
-    game = http.searchById(id_)
+    game = await http.searchById(id_, constants.PRIORITY_INLINE)
     return output_formatter.formatInlineGame(game)
 
 # reraises BggUnreachable, NoResultFound and InvalidXmlStructure
-def _searchInlineList(searchString, httpSearch, offset):
+async def _searchInlineList(searchString, httpSearch, offset):
     """Searches for a list of games by name (exact or partial).
 
     Args:
         searchString (str): The (partial) name of the game.
-        httpSearch (Callable[[str],game.gameList]): The function to use to search.
+        httpSearch (Callable[[str,int],game.gameList]): The coroutine function to use to search,
+            which also takes the priority of the request.
         offset (int): The offset to apply to the result list before starting to parse the results.
 
     Returns:
@@ -110,15 +144,34 @@ def _searchInlineList(searchString, httpSearch, offset):
             which is to be returned.
     """
     inlineList = answer.TelegramInlineAnswerList(36000, False)
-    gameList = httpSearch(searchString)
+    gameList = await httpSearch(searchString, constants.PRIORITY_INLINE)
     lastIndex = min(offset + constants.INLINE_LIST_PAGE_SIZE, gameList.length())
-    for index in range(offset, lastIndex):
-        inlineList.addInlineAnswer(_searchByIdInline(gameList.get(index).id_))
+    ids = [gameList.get(index).id_ for index in range(offset, lastIndex)]
+    # a single request for the whole page
+    for game in await http.searchByIds(ids, constants.PRIORITY_INLINE):
+        inlineList.addInlineAnswer(output_formatter.formatInlineGame(game))
     if lastIndex < gameList.length():
         inlineList.setNextOffset(str(lastIndex))
     return inlineList
 
-def _gameFromList(pos, chatId):
+async def _recentGamesInline(userId):
+    """Returns the most recent games searched by a user as an inline answer.
+
+    Args:
+        userId (int): The ID of the user.
+
+    Returns:
+        answer.TelegramInlineAnswerList: An object containing all the information
+            which is to be returned.
+    """
+    inlineList = answer.TelegramInlineAnswerList(30, True)
+    ids = history_manager.getRecentGames(userId)
+    if ids:
+        for game in await http.searchByIds(ids, constants.PRIORITY_INLINE):
+            inlineList.addInlineAnswer(output_formatter.formatInlineGame(game))
+    return inlineList
+
+async def _gameFromList(pos, chatId):
     """Returns a game from the most recent search list of the chat.
 
     Args:
@@ -129,11 +182,11 @@ def _gameFromList(pos, chatId):
         .game.Game: The game at the given position in the list.
     """
     id_ = history_manager.getGameIdFromRecentList(pos, chatId)
-    return _searchById(id_, chatId)
+    return await _searchById(id_, chatId)
 
 # CALLBACK METHODS
 
-def _processGameCallback(data, chatId, msgId):
+async def _processGameCallback(data, chatId, msgId):
     """Processes the press of a callback button associated to a game.
 
     Args:
@@ -147,15 +200,15 @@ def _processGameCallback(data, chatId, msgId):
     firstChar, id_ = input_parser.parseCallbackGameData(data)
     more = "m" == firstChar
     if msgId != history_manager.getLastGameMsgId(chatId):
-        answer = _searchById(id_, chatId, more)
+        answer = await _searchById(id_, chatId, more)
         history_manager.setMsgId(chatId, msgId)
     else:
-        game = history_manager.getLastGame(chatId)
-        answer = output_formatter.formatGame(game, more)
+        game = await http.searchById(history_manager.getLastGameId(chatId))
+        answer = await _formatGame(game, more)
     answer.setType("e")
     return answer
     
-def _processListCallback(data, chatId, msgId):
+async def _processListCallback(data, chatId, msgId):
     """Processes the press of a callback button associated to a list of games.
 
     Args:
@@ -168,18 +221,18 @@ def _processListCallback(data, chatId, msgId):
     """
     firstChar, searchString, offset = input_parser.parseCallbackListData(data)
     if msgId != history_manager.getLastGameListMsgId(chatId):
-        gameList = http.searchByName(searchString)
-        gameList.setOriginalSearch(searchString)
-        gameList.setOffset(int(offset))
+        gameList = await _getGameList(searchString, False, int(offset))
         history_manager.updateLastGameList(gameList, chatId)
         history_manager.setMsgId(chatId, msgId)
     else:
-        gameList = history_manager.getLastGameList(chatId)        
+        gameList = await _getGameList(*history_manager.getLastGameList(chatId))
     if "n" == firstChar:
         newOffset = gameList.offset + constants.LIST_PAGE_SIZE
     else:
         newOffset = gameList.offset - constants.LIST_PAGE_SIZE
-    return _changePage(gameList, newOffset)
+    answer = _changePage(gameList, newOffset)
+    history_manager.updateLastGameListPage(gameList, newOffset, chatId)
+    return answer
 
 def _changePage(gameList, offset):
     """Change the page in a list of results.
@@ -204,7 +257,7 @@ def _changePage(gameList, offset):
 
 # PUBLIC
 
-def processCommand(command, msg, chatId=None):
+async def processCommand(command, msg, chatId=None):
     """Entry point of this module for normal queries.
     This is used to process user input in the form of a command string
     and a message body.
@@ -229,16 +282,16 @@ def processCommand(command, msg, chatId=None):
             return output_formatter.formatHelp()
         elif "i" == command or "id" == command:
             logger.debug("id")
-            return _searchById(msg, chatId)
+            return await _searchById(msg, chatId)
         elif "b" == command or "boardgame" == command:
             logger.debug("boardgame")
-            return _searchByName(msg, chatId)
+            return await _searchByName(msg, chatId)
         elif "e" == command or "exact" == command:
             logger.debug("exact")
-            return _searchByNameExact(msg, chatId)
+            return await _searchByNameExact(msg, chatId)
         elif "L" == command:
             logger.debug("gameFromList")
-            return _gameFromList(msg, chatId)
+            return await _gameFromList(msg, chatId)
         else:
             return output_formatter.formatCommandNotSupported(command)
     except exceptions.NoResultFound:
@@ -250,7 +303,7 @@ def processCommand(command, msg, chatId=None):
     except exceptions.GameListIndexOutOfBound as err:
         return output_formatter.formatGameListIndexNotValid(err.index)
 
-def processCallback(data, chatId, msgId):
+async def processCallback(data, chatId, msgId):
     """Entry point of this module for callback queries.
     This is used to process user input in the form of a data string associated to the
     callback button.
@@ -268,9 +321,9 @@ def processCallback(data, chatId, msgId):
     try:
         firstChar = data[:1]
         if 'g' ==  firstChar:
-            return _processGameCallback(data[1:], chatId, msgId)
+            return await _processGameCallback(data[1:], chatId, msgId)
         elif 'l' == firstChar:
-            return _processListCallback(data[1:], chatId, msgId)
+            return await _processListCallback(data[1:], chatId, msgId)
         else:
             return output_formatter.formatBadCallbackData()
     except (exceptions.ChatHistoryNotFound, exceptions.MissingFromChatHistory):
@@ -280,7 +333,7 @@ def processCallback(data, chatId, msgId):
     except (exceptions.ListNavigationOutOfBound, exceptions.BadCallbackData):
         return output_formatter.formatBadCallbackData()
 
-def processInline(command, msg, userId, listOffset=0):
+async def processInline(command, msg, userId, listOffset=0):
     """Entry point of this module for inline queries.
     This is used to process user input in the form of a command string
     and a message body.
@@ -304,22 +357,44 @@ def processInline(command, msg, userId, listOffset=0):
             if "i" == command:
                 logger.debug("Inline query by ID")
                 inlineList = answer.TelegramInlineAnswerList(36000, False)
-                game = _searchByIdInline(msg)
+                game = await _searchByIdInline(msg)
                 inlineList.addInlineAnswer(game)
                 return inlineList
             else:
                 logger.error("Inline command " + command + " is not supported.")
         elif "r" == msg:
             logger.debug("Inline recent games")
-            return history_manager.getRecentGames(userId)
+            return await _recentGamesInline(userId)
         elif len(msg) < constants.INLINE_EXACT_QUERY_THRESHOLD:
             logger.debug("Inline exact search")
-            return _searchInlineList(msg, http.searchByNameExact, listOffset)
+            return await _searchInlineList(msg, http.searchByNameExact, listOffset)
         else:
             logger.debug("Inline non-exact search")
-            return _searchInlineList(msg, http.searchByName, listOffset)
+            return await _searchInlineList(msg, http.searchByName, listOffset)
     except exceptions.NoResultFound:
         pass # do nothing if nothing is found
+    except asyncio.CancelledError:
+        raise # the Answerer cancels the query when the user keeps typing
     except: # in case of any problem, send default result
         logger.exception("Error in inline query.")
         return constants.INLINE_DEFAULT
+
+# SYNCHRONOUS WRAPPERS
+
+def _runSync(coroutine):
+    """Runs a coroutine to completion. It must not be called while the event loop is
+    running, so it is only meant for tests and scripts.
+    """
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+def processCommandSync(command, msg, chatId=None):
+    """Synchronous version of :func:`processCommand`."""
+    return _runSync(processCommand(command, msg, chatId))
+
+def processCallbackSync(data, chatId, msgId):
+    """Synchronous version of :func:`processCallback`."""
+    return _runSync(processCallback(data, chatId, msgId))
+
+def processInlineSync(command, msg, userId, listOffset=0):
+    """Synchronous version of :func:`processInline`."""
+    return _runSync(processInline(command, msg, userId, listOffset))
@@ -1,7 +1,21 @@
 """This module is used to start the bot. It expects the bot API key as command-line argument.
+
+By default the bot polls Telegram for updates. With ``--webhook URL`` it receives them
+instead through a webhook (see :class:`.webhook.WebhookServer`) registered at the public
+base URL given, which must forward to ``--host`` and ``--port``.
+
+With ``--workers N`` and N greater than one, the bot runs in supervisor mode: this process
+receives the updates and routes them by chat to N worker processes (see
+:class:`.supervisor.Supervisor`), which handle them and answer. Every worker keeps the
+history of its chats in its own files and gets a share of the rate limits of BGG and
+Telegram. Chats are assigned to workers by the number of workers, so changing it moves
+chats away from their history, unless the sqlite history backend is used.
 """
+import os
 import sys
 import asyncio
+import argparse
+import binascii
 import aiohttp
 import threading
 import logging
@@ -14,13 +28,192 @@ import asyncbot
 import constants
 from tools import persistence_unit
 from tools import history_manager
+from tools import http
+from tools import catalog
+from tools import offload
 from objects import background_task
+from objects import history_store
+from objects import webhook
+from objects import scheduler
+from objects import supervisor
+
+def sweepHistory(loop):
+    """Discards idle entries from the history, a few at a time, and schedules itself again.
+    """
+    history_manager.sweep()
+    loop.call_later(constants.HISTORY_SWEEP_INTERVAL, sweepHistory, loop)
+
+def logBotStats(loop, bot, logger):
+    """Logs the statistics which must be read on the event loop, and schedules itself again.
+    """
+    logger.info("Chat dispatcher: " + str(bot.dispatcherStats()))
+    logger.info("Send queue: " + str(bot.sendQueueStats()))
+    loop.call_later(constants.STATS_LOG_INTERVAL, logBotStats, loop, bot, logger)
+
+def checkWorkers(loop, workerSupervisor):
+    """Starts again the workers which died, and schedules itself again.
+    """
+    workerSupervisor.check()
+    loop.call_later(constants.WORKER_CHECK_INTERVAL, checkWorkers, loop, workerSupervisor)
+
+def setProxy():
+    if(constants.botProxy is not None):
+        telepot.aio.api._pools = {
+            'default': aiohttp.ProxyConnector(proxy=constants.botProxy, force_close=False, limit=10)
+        }
+        telepot.aio.api._timeout = 300
+        telepot.aio.api._onetime_pool_spec = (aiohttp.ProxyConnector, dict(proxy=constants.botProxy, force_close=True))
+
+def startWebhook(loop, bot, handler, args):
+    """Starts the webhook server and registers the webhook with Telegram.
+
+    Returns:
+        webhook.WebhookServer: The server.
+    """
+    # the secret path makes the webhook unguessable; a random one is set at every start
+    secret = constants.WEBHOOK_SECRET or binascii.hexlify(os.urandom(16)).decode()
+    webhookServer = webhook.WebhookServer(handler, secret, constants.WEBHOOK_SECRET_TOKEN)
+    loop.run_until_complete(webhookServer.start(args.host, args.port))
+    loop.run_until_complete(bot.registerWebhook(args.webhook.rstrip("/") + "/" + secret, constants.WEBHOOK_SECRET_TOKEN))
+    return webhookServer
+
+def stopWebhook(loop, bot, webhookServer, logger):
+    """Stops the webhook server and deletes the webhook, so that Telegram keeps the
+    updates until the bot starts again, and polling is allowed.
+    """
+    loop.run_until_complete(webhookServer.stop())
+    try:
+        loop.run_until_complete(bot.deleteWebhook())
+    except Exception as e:
+        logger.error("Cannot delete the webhook: " + repr(e))
+
+def startPolling(loop, bot, handler=None):
+    """Starts polling Telegram for updates. A webhook left by an earlier run is deleted
+    first, since Telegram refuses to send updates to a bot which has one.
+    """
+    loop.run_until_complete(bot.deleteWebhook())
+    loop.create_task(bot.message_loop(handler))
+
+def startServices(loop, bot, logger):
+    """Retrieves the history and starts the background tasks of a process which handles
+    updates.
+
+    Returns:
+        tuple: The event and the thread of the Historian, and the event and the thread
+        of the CatalogWriter.
+    """
+    # retrieves history and inline default from disk
+    if "sqlite" == constants.HISTORY_BACKEND:
+        history_manager.setStore(history_store.SqliteHistoryStore(constants.HISTORY_DB_PATH))
+    else:
+        persistence_unit.getHistory()
+    persistence_unit.getInlineDefault()
+    sweepHistory(loop)
+    loop.call_later(constants.STATS_LOG_INTERVAL, logBotStats, loop, bot, logger)
+    # start background thread to backup history and log statistics
+    stopSavingTask = threading.Event()
+    savingTask = background_task.Historian(stopSavingTask, loop, "memory" == constants.HISTORY_BACKEND)
+    savingTask.start()
+    # starts the pool for CPU-heavy steps
+    offload.openExecutor()
+    # opens the catalog of games and starts the background thread that writes it
+    catalog.openCatalog()
+    stopCatalogTask = threading.Event()
+    catalogTask = background_task.CatalogWriter(stopCatalogTask)
+    catalogTask.start()
+    return stopSavingTask, savingTask, stopCatalogTask, catalogTask
+
+def workerPath(path, index):
+    """Returns the path of a history file of a worker, like ``history.2.idx``."""
+    root, extension = os.path.splitext(path)
+    return root + "." + str(index) + extension
+
+def shareLimits(workers):
+    """Divides the rate limits of BGG and Telegram among the workers, which pace their
+    requests independently. It must be called before the bot is created.
+    """
+    constants.BGG_REQUEST_RATE /= workers
+    constants.BGG_REQUEST_BURST = max(1, constants.BGG_REQUEST_BURST // workers)
+    # the scheduler is created when tools.http is imported
+    http.SCHEDULER.bucket = scheduler.TokenBucket(constants.BGG_REQUEST_RATE, constants.BGG_REQUEST_BURST)
+    constants.TELEGRAM_SEND_RATE /= workers
+    constants.TELEGRAM_SEND_BURST = max(1, constants.TELEGRAM_SEND_BURST // workers)
+
+def runWorker(index, workers, connection, token):
+    """Runs a worker process of the supervisor mode, which handles the updates routed to
+    it until it receives the TERM signal.
 
-def cleanUp(loop, stopSavingTask, logger):
-    loop.stop()
+    Args:
+        index (int): The index of the worker.
+        workers (int): The number of workers.
+        connection (multiprocessing.connection.Connection): The channel of the updates
+            routed to the worker.
+        token (str): The bot API key.
+    """
+    # the supervisor decides when the workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger = logging.getLogger("run_bot")
+    constants.HISTORY_INDEX_PATH = workerPath(constants.HISTORY_INDEX_PATH, index)
+    constants.HISTORY_LOG_PATH = workerPath(constants.HISTORY_LOG_PATH, index)
+    shareLimits(workers)
+    setProxy()
+
+    bot = asyncbot.BggBot(token)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(bot.setBotName())
+    services = startServices(loop, bot, logger)
+    background_task.Inbox(connection, loop, bot.handle).start()
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+
+    logger.warning("Worker " + str(index) + " listening...")
+    loop.run_forever()
+    cleanUp(loop, *services, logger=logger)
+
+def runSupervisor(args, logger):
+    """Receives the updates, by polling or through the webhook, and routes them to the
+    workers until it receives the TERM signal.
+    """
+    bot = asyncbot.BggBot(args.token)
+    loop = asyncio.get_event_loop()
+    workerSupervisor = supervisor.Supervisor(runWorker, args.workers, (args.token,))
+    workerSupervisor.start()
+
+    async def route(msg):
+        workerSupervisor.route(asyncbot.chatKey(msg), msg)
+
+    webhookServer = None
+    if args.webhook is not None:
+        webhookServer = startWebhook(loop, bot, route, args)
+    else:
+        startPolling(loop, bot, route)
+    loop.call_later(constants.WORKER_CHECK_INTERVAL, checkWorkers, loop, workerSupervisor)
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+
+    logger.warning("Supervisor listening with " + str(args.workers) + " workers...")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    if webhookServer is not None:
+        stopWebhook(loop, bot, webhookServer, logger)
+    logger.info("Stopping workers...")
+    workerSupervisor.stop()
+    loop.close()
+    logger.info("Bye!")
+
+def cleanUp(loop, stopSavingTask, savingTask, stopCatalogTask, catalogTask, logger):
     stopSavingTask.set()
-    logger.info("Saving history...")
-    persistence_unit.saveHistory()
+    savingTask.join()
+    if "memory" == constants.HISTORY_BACKEND:
+        logger.info("Saving history...")
+        persistence_unit.saveHistory()
+    history_manager.STORE.close()
+    stopCatalogTask.set()
+    catalogTask.join()
+    catalog.closeCatalog()
+    offload.closeExecutor()
+    loop.run_until_complete(http.closeSession())
+    loop.close()
     logger.info("Bye!")
 
 # This check is due to the fact that Sphinx autodoc needs to execute the module
@@ -28,15 +221,21 @@ def cleanUp(loop, stopSavingTask, logger):
 if __name__ == "__main__":
     logger = logging.getLogger("run_bot")
 
-    TOKEN = sys.argv[1]  # get token from command-line
+    argParser = argparse.ArgumentParser(description="Starts the bot.")
+    argParser.add_argument("token", help="the bot API key")
+    argParser.add_argument("--webhook", metavar="URL", help="receive updates through a webhook at this public base URL, instead of polling")
+    argParser.add_argument("--host", default=constants.WEBHOOK_HOST, help="the address the webhook listens on")
+    argParser.add_argument("--port", type=int, default=constants.WEBHOOK_PORT, help="the port the webhook listens on")
+    argParser.add_argument("--workers", type=int, default=constants.WORKERS, help="the number of worker processes which handle the updates")
+    args = argParser.parse_args()
+    TOKEN = args.token  # get token from command-line
 
     # set proxy
-    if(constants.botProxy is not None):
-        telepot.aio.api._pools = {
-            'default': aiohttp.ProxyConnector(proxy=constants.botProxy, force_close=False, limit=10)
-        }
-        telepot.aio.api._timeout = 300
-        telepot.aio.api._onetime_pool_spec = (aiohttp.ProxyConnector, dict(proxy=constants.botProxy, force_close=True))
+    setProxy()
+
+    if args.workers > 1:
+        runSupervisor(args, logger)
+        sys.exit()
 
     bot = asyncbot.BggBot(TOKEN)
     loop = asyncio.get_event_loop()
@@ -44,25 +243,25 @@ if __name__ == "__main__":
     # set bot name at startup
     loop.run_until_complete(bot.setBotName())
 
-    loop.create_task(bot.message_loop())
+    # the history and the catalog must be ready before the first update is accepted
+    stopSavingTask, savingTask, stopCatalogTask, catalogTask = startServices(loop, bot, logger)
 
-    # retrieves history and inline default from disk
-    persistence_unit.getHistory()
-    persistence_unit.getInlineDefault()
-    # start background thread to backup history
-    stopSavingTask = threading.Event()
-    savingTask = background_task.Historian(stopSavingTask)
-    savingTask.start()
+    webhookServer = None
+    if args.webhook is not None:
+        webhookServer = startWebhook(loop, bot, bot.handle, args)
+    else:
+        startPolling(loop, bot)
 
-    # registers a listener for the TERM signal, in order to clean up before exiting
-    def cleanUpTERM(signal, frame):
-        cleanUp(loop, stopSavingTask, logger)
-        sys.exit(0)
-    signal.signal(signal.SIGTERM, cleanUpTERM)
+    # registers a listener for the TERM signal, in order to clean up before exiting;
+    # the loop is only stopped here, since the HTTP session must be closed on the loop
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
     
     logger.warning("Listening...")
 
     try:
         loop.run_forever()
     except KeyboardInterrupt: 
-        cleanUp(loop, stopSavingTask, logger)
+        pass
+    if webhookServer is not None:
+        stopWebhook(loop, bot, webhookServer, logger)
+    cleanUp(loop, stopSavingTask, savingTask, stopCatalogTask, catalogTask, logger)
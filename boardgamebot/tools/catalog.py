@@ -0,0 +1,204 @@
+"""This module keeps an on-disk catalog of the games and searches retrieved from BGG,
+so that they survive a restart of the bot.
+
+The catalog is a SQLite database. Reads are run on a dedicated thread and awaited,
+writes are queued and committed in batches by :class:`.background_task.CatalogWriter`,
+so the event loop never waits for the disk. Until :func:`openCatalog` is called the catalog is
+disabled: reads find nothing and writes are discarded.
+"""
+import time
+import queue
+import pickle
+import sqlite3
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+import constants
+
+logger = logging.getLogger("catalog")
+
+_enabled = False
+_pending = queue.Queue()
+"""Writes waiting to be committed, as tuples of (SQL statement, parameters)."""
+_readExecutor = None
+_local = threading.local()
+# each thread uses its own connection
+
+def _connection():
+    """Gets the connection of the current thread, opening it if needed.
+
+    Returns:
+        sqlite3.Connection: The connection to the catalog.
+    """
+    if getattr(_local, "connection", None) is None:
+        connection = sqlite3.connect(constants.CATALOG_PATH, timeout=constants.CATALOG_TIMEOUT)
+        connection.execute("PRAGMA journal_mode=WAL")
+        _local.connection = connection
+    return _local.connection
+
+def _closeConnection():
+    connection = getattr(_local, "connection", None)
+    if connection is not None:
+        connection.close()
+        _local.connection = None
+
+def _readGames(ids, maxAge):
+    """Reads some games from the catalog. It runs on the read thread.
+
+    Args:
+        ids (list): The IDs of the games, as strings.
+        maxAge (float): The maximum age in seconds of the entries to return.
+
+    Returns:
+        dict: A dictionary where keys are game IDs and values are tuples with the
+        :class:`.game.Game` and its fetch timestamp.
+    """
+    games = {}
+    minFetched = time.time() - maxAge
+    for i in range(0, len(ids), constants.CATALOG_READ_BATCH):
+        batch = ids[i:i + constants.CATALOG_READ_BATCH]
+        query = "SELECT id, data, fetched FROM games WHERE fetched >= ? AND id IN (" + ",".join("?" * len(batch)) + ")"
+        for id_, data, fetched in _connection().execute(query, [minFetched] + batch):
+            games[id_] = (pickle.loads(data), fetched)
+    return games
+
+def _readSearch(query, exact, maxAge):
+    """Reads a search from the catalog. It runs on the read thread.
+
+    Args:
+        query (str): The normalized query.
+        exact (bool): Whether the search is exact or not.
+        maxAge (float): The maximum age in seconds of the entry to return.
+
+    Returns:
+        tuple: The :class:`.game.GameList` and its fetch timestamp, or None if not found.
+    """
+    row = _connection().execute("SELECT data, fetched FROM searches WHERE query = ? AND exact = ? AND fetched >= ?",
+        (query, int(exact), time.time() - maxAge)).fetchone()
+    if row is None:
+        return None
+    return pickle.loads(row[0]), row[1]
+
+async def _read(function, *args):
+    """Runs a read on the read thread, without blocking the event loop. Errors are
+    logged and treated as a miss, since the catalog is only an optimization.
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(_readExecutor, function, *args)
+    except (sqlite3.Error, pickle.UnpicklingError, EOFError, AttributeError):
+        logger.exception("Cannot read from catalog")
+        return None
+
+# PUBLIC
+
+def openCatalog():
+    """Creates the catalog if needed and enables it.
+    """
+    global _enabled, _readExecutor
+    connection = sqlite3.connect(constants.CATALOG_PATH, timeout=constants.CATALOG_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS games (id TEXT PRIMARY KEY, data BLOB NOT NULL, fetched REAL NOT NULL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT NOT NULL, exact INTEGER NOT NULL, data BLOB NOT NULL, fetched REAL NOT NULL, PRIMARY KEY (query, exact))")
+    connection.commit()
+    connection.close()
+    _readExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    _enabled = True
+    logger.info("Catalog opened: " + constants.CATALOG_PATH)
+
+def closeCatalog():
+    """Disables the catalog and commits the pending writes. It must be called after
+    the writer thread has been stopped.
+    """
+    global _enabled
+    _enabled = False
+    if _readExecutor is not None:
+        _readExecutor.submit(_closeConnection)
+        _readExecutor.shutdown()
+    while not _pending.empty():
+        writePending(0)
+    _closeConnection()
+
+async def getGames(ids, maxAge=None):
+    """Gets some games from the catalog.
+
+    Args:
+        ids (list): The IDs of the games, as strings.
+        maxAge (float): The maximum age in seconds of the entries to return. The default
+            is :data:`.constants.CATALOG_GAME_TTL`.
+
+    Returns:
+        dict: See ``Returns`` in :func:`_readGames`. Missing games are not in the dictionary.
+    """
+    if not _enabled or not ids:
+        return {}
+    if maxAge is None:
+        maxAge = constants.CATALOG_GAME_TTL
+    games = await _read(_readGames, list(ids), maxAge)
+    return games if games is not None else {}
+
+async def getSearch(query, exact, maxAge=None):
+    """Gets a search from the catalog.
+
+    Args:
+        query (str): The normalized query.
+        exact (bool): Whether the search is exact or not.
+        maxAge (float): The maximum age in seconds of the entry to return. The default
+            is :data:`.constants.CATALOG_SEARCH_TTL`.
+
+    Returns:
+        tuple: See ``Returns`` in :func:`_readSearch`.
+    """
+    if not _enabled:
+        return None
+    if maxAge is None:
+        maxAge = constants.CATALOG_SEARCH_TTL
+    return await _read(_readSearch, query, exact, maxAge)
+
+def storeGame(game):
+    """Queues a game to be written in the catalog. It never blocks.
+
+    Args:
+        game (.game.Game): The game to store.
+    """
+    if _enabled:
+        data = pickle.dumps(game, -1)
+        _pending.put(("INSERT OR REPLACE INTO games (id, data, fetched) VALUES (?, ?, ?)", (game.id_, data, time.time())))
+
+def storeSearch(query, exact, gameList):
+    """Queues a search to be written in the catalog. It never blocks.
+
+    Args:
+        query (str): The normalized query.
+        exact (bool): Whether the search is exact or not.
+        gameList (.game.GameList): The result of the search.
+    """
+    if _enabled:
+        data = pickle.dumps(gameList, -1)
+        _pending.put(("INSERT OR REPLACE INTO searches (query, exact, data, fetched) VALUES (?, ?, ?, ?)", (query, int(exact), data, time.time())))
+
+def writePending(timeout):
+    """Commits all the queued writes in a single transaction. It is called by the writer
+    thread.
+
+    Args:
+        timeout (float): The maximum time to wait for the first write, in seconds.
+    """
+    writes = []
+    try:
+        writes.append(_pending.get(timeout=timeout) if timeout > 0 else _pending.get_nowait())
+        while len(writes) < constants.CATALOG_WRITE_BATCH:
+            writes.append(_pending.get_nowait())
+    except queue.Empty:
+        pass
+    if not writes:
+        return
+    try:
+        connection = _connection()
+        with connection:
+            for statement, parameters in writes:
+                connection.execute(statement, parameters)
+    except sqlite3.Error:
+        logger.exception("Cannot write to catalog")
@@ -1,84 +1,119 @@
 """This module is used to manage chat and user history.
+
+The history only holds game IDs, offsets and message IDs: callers resolve them into
+games through :mod:`.http`, whose caches are shared by all chats.
+
+The history is kept by a backend (see :mod:`.history_store`), in memory by default. A
+chat history is read from the backend, changed and put back, so that backends shared by
+several processes see every change.
 """
 import logging
 
 import exceptions
-import constants
 from objects import chat_history
+from objects import history_store
 
 logger = logging.getLogger("history_manager")
 
-CHAT_HISTORY = {}
-"""A dictionary where keys are chat IDs and values are
-:class:`~.chat_history.ChatHistory` objects.
-"""
-USER_PRIVATE_CHAT = {}
-"""A dictionary where keys are user IDs and values are chat IDs
-(the private chat corresponding to the user).
-"""
+STORE = history_store.MemoryHistoryStore()
+"""The backend which keeps the history, see :func:`setStore`."""
 
-def _getOrCreateChatHistory(chatId):
-    """Gets a specific chat history or creates an entry if not found.
+def setStore(store):
+    """Replaces the backend which keeps the history. It must be called before the event
+    loop starts.
 
     Args:
-        chatId (int): The ID of the chat.
-
-    Returns:
-        .chat_history.ChatHistory: the history associated to the chat, or an
-        empty history if none was associated.
+        store (.history_store.HistoryStore): The new backend.
     """
-    if chatId not in CHAT_HISTORY:
-        CHAT_HISTORY[chatId] = chat_history.ChatHistory()
-    return CHAT_HISTORY[chatId]
+    global STORE
+    STORE = store
 
-def _retrieveChatHistory(chatId):
-    """Gets a specific chat history, throwing an error if it is not found.
+def _retrieveChatHistory(chatId, create=False):
+    """Gets a specific chat history, marking it as used. Changes must be saved with
+    :func:`_saveChatHistory`, in the same :meth:`.HistoryStore.transaction`, so that a
+    change made meanwhile by another process is not overwritten.
 
     Args:
         chatId (int): The ID of the chat.
+        create (bool): Whether an empty history is returned if none is found.
 
     Returns:
         .chat_history.ChatHistory: the history associated to the chat.
 
     Raises:
-        .exceptions.ChatHistoryNotFound: If there is no history associated.
+        .exceptions.ChatHistoryNotFound: If there is no history associated and create is False.
     """
-    if chatId not in CHAT_HISTORY:
-        raise exceptions.ChatHistoryNotFound()
-    return CHAT_HISTORY[chatId]
+    chatHistory = STORE.getChat(chatId)
+    if chatHistory is None:
+        if not create:
+            raise exceptions.ChatHistoryNotFound()
+        chatHistory = chat_history.ChatHistory()
+    chatHistory.touch()
+    return chatHistory
+
+def _saveChatHistory(chatId, chatHistory):
+    STORE.putChat(chatId, chatHistory)
+
+def _readChatHistory(chatId):
+    # the history is only read, but the time it was last used must be saved too
+    chatHistory = _retrieveChatHistory(chatId)
+    STORE.touchChat(chatId, chatHistory)
+    return chatHistory
 
 # UPDATE METHODS
 
-def updateLastGame(game, formattedAnswer, chatId):
-    """Updates the last game searched in a chat.
+def updateLastGame(game, chatId):
+    """Updates the last game searched in a chat, and adds it to the recent games.
     
     Args:
         game (.game.Game): The last game searched.
         chatId (int): The ID of the relative chat.
     """
-    chatHistory = _getOrCreateChatHistory(chatId)
-    chatHistory.setLastGame(game, formattedAnswer)
+    with STORE.transaction():
+        chatHistory = _retrieveChatHistory(chatId, True)
+        chatHistory.setLastGame(game.id_)
+        _saveChatHistory(chatId, chatHistory)
 
-def updateLastGameList(gameList, chatId):
+def updateLastGameList(gameList, chatId, exact=False):
     """Updates the last game list searched in a chat.
 
     Args:
-        gameList (.game.GameList): The last game list searched.
+        gameList (.game.GameList): The last game list searched. Its original search
+            and offset must be set.
         chatId (int): The ID of the relative chat.
+        exact (bool): Whether the list comes from an exact search.
     """
-    chatHistory = _getOrCreateChatHistory(chatId)
-    chatHistory.setLastGameList(gameList)
+    with STORE.transaction():
+        chatHistory = _retrieveChatHistory(chatId, True)
+        chatHistory.setLastGameList(gameList, exact)
+        _saveChatHistory(chatId, chatHistory)
 
-def addRecentGame(game, formattedGame, chatId):
+def updateLastGameListPage(gameList, offset, chatId):
+    """Updates the page shown for the last game list. The games of the list are stored
+    again, since the list is fetched again to change page and BGG may have returned
+    different results.
+
+    Args:
+        gameList (.game.GameList): The list the page was taken from.
+        offset (int): The new offset.
+        chatId (int): The ID of the relative chat.
+    """
+    with STORE.transaction():
+        chatHistory = _retrieveChatHistory(chatId)
+        chatHistory.setLastListPage(gameList, offset)
+        _saveChatHistory(chatId, chatHistory)
+
+def addRecentGame(game, chatId):
     """Adds a game to the list of recent games.
     
     Args:
         game (.game.Game): A game to add to the list of recent searches.
-        formattedGame (str): The formatted description of the game.
         chatId (int): The ID of the relative chat.
     """
-    chatHistory = _getOrCreateChatHistory(chatId)
-    chatHistory.addRecentGame(game, formattedGame)
+    with STORE.transaction():
+        chatHistory = _retrieveChatHistory(chatId, True)
+        chatHistory.addRecentGame(game.id_)
+        _saveChatHistory(chatId, chatHistory)
 
 def setMsgId(chatId, msgId):
     """Sets the message ID associated to the  most recent object inserted in the chat history.
@@ -89,9 +124,10 @@ def setMsgId(chatId, msgId):
         chatId (int): The ID of a chat.
         msgId (int): The ID of the last sent message in the chat.
     """
-    chatHistory = _retrieveChatHistory(chatId)
-    if chatHistory.setMsgId is not None:
+    with STORE.transaction():
+        chatHistory = _retrieveChatHistory(chatId)
         chatHistory.setMsgId(msgId)
+        _saveChatHistory(chatId, chatHistory)
 
 def setUserPrivateChat(userId, chatId):
     """Sets the ID of the private chat associated to a user.
@@ -100,25 +136,47 @@ def setUserPrivateChat(userId, chatId):
         userId (int): The ID of the user.
         chatId (int): The ID of the relative private chat.
     """
-    if userId not in USER_PRIVATE_CHAT:
-        USER_PRIVATE_CHAT[userId] = chatId
+    if STORE.getUser(userId) is None:
         logger.info("user: " + str(userId) + " has private chat " + str(chatId))
+    STORE.putUser(userId, chatId)
+
+def sweep():
+    """Discards some of the chats and users which have been idle for longer than
+    :data:`.constants.HISTORY_MAX_IDLE`. It is quick enough to be called often on the
+    event loop.
+
+    Returns:
+        int: The number of discarded entries.
+    """
+    evicted = STORE.sweep()
+    if evicted > 0:
+        logger.info("Discarded " + str(evicted) + " idle history entries")
+    return evicted
 
 # GETTERS
 
-def getLastGame(chatId):
-    chatHistory = _retrieveChatHistory(chatId)
-    game = chatHistory.lastGame
-    if game is None:
+def getLastGameId(chatId):
+    """Gets the ID of the most recent game searched in the chat.
+
+    Args:
+        chatId (int): The ID of the chat.
+
+    Returns:
+        str: The ID of the game.
+
+    Raises:
+        .exceptions.MissingFromChatHistory: If there is no recent game in the history.
+    """
+    chatHistory = _readChatHistory(chatId)
+    if chatHistory.lastGameId is None:
         raise exceptions.MissingFromChatHistory()
-    return game
+    return chatHistory.lastGameId
 
 def getLastGameMsgId(chatId):
-    chatHistory = _retrieveChatHistory(chatId)
-    game = chatHistory.lastGame
-    if game is None:
+    chatHistory = _readChatHistory(chatId)
+    if chatHistory.lastGameId is None:
         return None
-    return game.msgId
+    return chatHistory.lastGameMsgId
 
 def getGameIdFromRecentList(pos, chatId):
     """Gets the ID of a specific game in the list of recent games.
@@ -134,13 +192,12 @@ def getGameIdFromRecentList(pos, chatId):
         .exceptions.MissingFromChatHistory: If the list of recent games is empty.
         .exceptions.GameListIndexOutOfBound: If the given position is not valid.
     """
-    chatHistory = _retrieveChatHistory(chatId)
-    gameList = chatHistory.lastGameList
-    if gameList is None:
+    chatHistory = _readChatHistory(chatId)
+    if chatHistory.lastListSearch is None:
         raise exceptions.MissingFromChatHistory()
-    if int(pos) < 1 or int(pos) > gameList.length():
+    if int(pos) < 1 or int(pos) > len(chatHistory.lastListIds):
         raise exceptions.GameListIndexOutOfBound(pos)    
-    return gameList.get(int(pos)-1).id_
+    return chatHistory.lastListIds[int(pos)-1]
 
 def getLastGameList(chatId):
     """Gets the most recent list searched in the chat.
@@ -149,16 +206,16 @@ def getLastGameList(chatId):
         chatId (int): The ID of the chat.
 
     Returns:
-        .game.GameList: An object with all the information on the list.
+        tuple: The search string, whether the search was exact, and the offset of
+        the page shown.
 
     Raises:
         .exceptions.MissingFromChatHistory: If there is no recent list in the history.
     """
-    chatHistory = _retrieveChatHistory(chatId)
-    gameList = chatHistory.lastGameList
-    if gameList is None:
+    chatHistory = _readChatHistory(chatId)
+    if chatHistory.lastListSearch is None:
         raise exceptions.MissingFromChatHistory()
-    return gameList
+    return chatHistory.lastListSearch, chatHistory.lastListExact, chatHistory.lastListOffset
 
 def getLastGameListMsgId(chatId):
     """Gets the ID of the most recent list searched in the chat.
@@ -172,11 +229,10 @@ def getLastGameListMsgId(chatId):
     Raises:
         .exceptions.MissingFromChatHistory: If there is no recent list in the history.
     """
-    chatHistory = _retrieveChatHistory(chatId)
-    gameList = chatHistory.lastGameList
-    if gameList is None:
+    chatHistory = _readChatHistory(chatId)
+    if chatHistory.lastListSearch is None:
         raise exceptions.ChatHistoryNotFound()
-    return gameList.msgId
+    return chatHistory.lastListMsgId
 
 def getRecentGames(userId):
     """Gets the list of recent games for a specific user.
@@ -185,17 +241,17 @@ def getRecentGames(userId):
         userId (int): The ID of the user.
 
     Returns:
-        .answer.TelegramInlineAnswerList: The list of recent games.
+        list: The IDs of the recent games, the most recent first.
 
     Raises:
-        .exceptions.ChatHistoryNotFound: If there is no entry for userId in :data:`~.USER_PRIVATE_CHAT`.
+        .exceptions.ChatHistoryNotFound: If there is no entry for userId in :data:`STORE`.
         .exceptions.MissingFromChatHistory: If the list of recent games is None.
     """
-    chatId = USER_PRIVATE_CHAT[userId]
+    chatId = STORE.getUser(userId)
     if chatId is None:
         raise exceptions.ChatHistoryNotFound()
-    chatHistory = _retrieveChatHistory(chatId)
-    recentGames = chatHistory.recentGames
+    chatHistory = _readChatHistory(chatId)
+    recentGames = chatHistory.recentGameIds
     if recentGames is None:
         raise exceptions. MissingFromChatHistory()
     return recentGames
@@ -1,49 +1,155 @@
 """This module uses BGG API2 to retrieve data. It has the task to compose query strings and manage connections.
+
+All public functions are coroutines sharing a single aiohttp session, so that many
+lookups can be in flight at the same time without blocking the event loop.
 """
-import requests
+import sys
+import copy
+import time
+import random
+import asyncio
 import logging
+import functools
+import collections
+import aiohttp
 
 import exceptions
 import constants
 from tools import xml_parser
+from tools import offload
+from tools import catalog
+from tools.stats import summarize
+from objects import cache
+from objects.game import GameList
+from objects import scheduler
+from objects import circuit_breaker
 
 logger = logging.getLogger("http")
 
-def _sendAPI2Req(requestType, payload):
-    """Sends a request to BoardGameGeek using the API.
+GAME_CACHE = cache.TimedLRUCache(constants.GAME_CACHE_SIZE, constants.GAME_CACHE_TTL)
+"""Games already retrieved by ID, keyed by game ID. Cached games are never handed out
+directly, since the history sets a message ID on them: callers always get a copy.
+"""
+
+SCHEDULER = scheduler.RequestScheduler(scheduler.TokenBucket(constants.BGG_REQUEST_RATE, constants.BGG_REQUEST_BURST),
+    constants.SCHEDULER_MAX_WAITING, constants.SCHEDULER_MAX_WAIT)
+"""Paces all the requests sent to BGG. Each attempt of a search waits for its turn here."""
+
+BREAKER = circuit_breaker.CircuitBreaker(constants.BREAKER_WINDOW, constants.BREAKER_MIN_REQUESTS,
+    constants.BREAKER_FAILURE_RATE, constants.BREAKER_OPEN_TIME)
+"""Stops sending requests to BGG for a while when too many of them fail."""
+
+ATTEMPT_LOG = collections.deque(maxlen=constants.ATTEMPT_LOG_SIZE)
+"""The most recent attempts to contact BGG, as tuples of (request type, status code, duration).
+The status code is None for network errors and timeouts. See :func:`attemptStats`.
+"""
+
+_inFlight = {}
+"""Searches which are running, keyed by request type, parse method and payload. Each
+value is a tuple of the future shared by all the callers of :func:`_search` with that key
+and the :class:`~.scheduler.Ticket` of the search.
+"""
+
+_session = None
+"""The :class:`aiohttp.ClientSession` shared by all requests, created by :func:`_getSession`."""
+
+def _getSession():
+    """Returns the shared session, creating it if needed. The session must be created
+    lazily because it binds to the event loop which is running when it is created.
+
+    Returns:
+        aiohttp.ClientSession: The session to use for BGG requests.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=constants.HTTP_CONNECTION_LIMIT)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def _sendAPI2Req(requestType, payload, parser=None):
+    """Sends a request to BoardGameGeek using the API. The duration of the request is
+    recorded in :data:`ATTEMPT_LOG`.
 
     Args:
         requestType (str): The final part of the path for this type of request.
         payload (dict): The parameters of the request.
+        parser: An optional incremental parser, like :class:`.xml_parser.GameListParser`.
+            If present, the content is fed to it while it is received, and the rest of
+            the response is discarded as soon as the parser does not need it.
 
     Returns:
-        str: the content of the response.
+        tuple: The status code of the response, its content (only if the status is 200
+        and there is no parser, None otherwise) and the delay in seconds requested by
+        the ``Retry-After`` header (None if missing).
 
     Raises:
-        .exceptions.BggUnreachable: If the connection fails for any reason.
+        .exceptions.BggUnreachable: If the connection fails for any reason. The error
+            is never fatal, since it may be transient.
+        .exceptions.InvalidXmlStructure: If the parser cannot parse the content.
     """
     path = constants.DEFAULT_API_PATH + requestType
+    status = None
+    start = time.monotonic()
     try:
-        # TODO controlla cosa succede con query con caratteri speciali
-        r = requests.get(path, params=payload, timeout=constants.DEFAULT_REQUEST_TIMEOUT)
-        logger.debug(r.url)
-        logger.debug(r.status_code)
-        return r.text
-    except (requests.exceptions.ConnectionError, requests.exceptions.TooManyRedirects) as err:
-        logger.exception("Network error. Check connection.")
-        raise exceptions.BggUnreachable(True)
-    except requests.exceptions.Timeout as err:
+        async with _getSession().get(path, params=payload, timeout=constants.DEFAULT_REQUEST_TIMEOUT) as r:
+            status = r.status
+            logger.debug(r.url)
+            logger.debug(status)
+            retryAfter = _parseRetryAfter(r.headers.get("Retry-After"))
+            content = None
+            if 200 == status and parser is None:
+                # the parser decodes the content, as declared in the document
+                content = await r.read()
+            elif 200 == status:
+                async for chunk in r.content.iter_chunked(constants.STREAM_CHUNK_SIZE):
+                    if parser.feed(chunk):
+                        # the connection cannot be reused with unread content
+                        r.close()
+                        break
+            return status, content, retryAfter
+    except aiohttp.ClientError as err:
+        logger.warning("Network error: " + repr(err))
+        raise exceptions.BggUnreachable(False)
+    except asyncio.TimeoutError as err:
         logger.warning("Http request timeout")
-        raise exceptions.BggUnreachable(True) # TODO should be True of False?
-    except requests.exceptions.HTTPError as err:
-        logger.exception("Http status error")
         raise exceptions.BggUnreachable(False)
+    finally:
+        ATTEMPT_LOG.append((requestType, status, time.monotonic() - start))
+
+def _parseRetryAfter(value):
+    """Parses the ``Retry-After`` header. Only the number of seconds is supported,
+    HTTP dates are ignored.
+
+    Args:
+        value (str): The value of the header, may be None.
+
+    Returns:
+        float: The delay in seconds, or None.
+    """
+    try:
+        return max(0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    """Computes the delay before retrying a failed attempt: it grows exponentially
+    with the number of attempts, with a random jitter so that failed requests do not
+    retry all at the same time.
+
+    Args:
+        attempt (int): The number of failed attempts so far.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    delay = min(constants.BACKOFF_MAX, constants.BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
 
 def _parseXml(xmlString, parseMethod):
     """Sends the response to :mod:`.xml_parser` to parse it.
 
     Args:
-        xmlString (str): The response to parse.
+        xmlString (bytes): The response to parse.
         parseMethod (Callable[[str],object]): An appropriate method to parse the xml response.
 
     Returns:
@@ -59,71 +165,437 @@ def _parseXml(xmlString, parseMethod):
         return parseMethod(xmlString)
 
 # raises BggUnreachable, reraises NoResultFound
-def _search(requestType, payload, parseMethod):
-    """ Manages all kind of searches, retrying connection if there are problems
-    and raising an exception if all attempts fail.
+async def _search(requestType, payload, parseMethod, onResult=None, priority=constants.PRIORITY_INTERACTIVE, stream=False):
+    """ Manages all kind of searches. Concurrent searches with the same request type,
+    payload and parse method share a single request to BGG: every caller gets the same result, or
+    the same exception. Since the result is shared, callers must not modify it.
 
     Args:
         requestType (str): The final part of the path for this type of request.
         payload (dict): The parameters of the request.
         parseMethod (Callable[[str],object]): An appropriate method to parse the xml response.
+        onResult (Callable[[object],None]): An optional function which is called once
+            with the parsed result, for example to cache it.
+        priority (int): The priority of the request in :data:`SCHEDULER`. A caller joining
+            a search which is already running promotes it, if its priority is higher.
+        stream (bool): If True, parseMethod is a class of incremental parsers, like
+            :class:`.xml_parser.GameListParser`: each attempt creates one and feeds it the
+            response while it is received.
     Returns:
         See ``Returns`` in :func:`~._parseXml`.
 
     Raises:
         .exceptions.BggUnreachable: If it is not possible to establish a connection.
     """
-    retry = True
-    attempts = 1
-    while retry:
+    # a single ID is parsed as a game by searchById and as a list by searchByIds
+    key = (requestType, parseMethod, tuple(sorted(payload.items())))
+    flight = _inFlight.get(key)
+    if flight is None:
+        ticket = scheduler.Ticket(priority)
+        future = asyncio.ensure_future(_fetch(requestType, payload, parseMethod, onResult, ticket, stream))
+        _inFlight[key] = (future, ticket)
+        future.add_done_callback(functools.partial(_searchDone, key))
+    else:
+        logger.debug("Joining search in flight: " + str(key))
+        future, ticket = flight
+        SCHEDULER.promote(ticket, priority)
+    # shield the shared search, so that a caller which is cancelled does not cancel it for the others
+    return await asyncio.shield(future)
+
+def _searchDone(key, future):
+    """Called when a shared search completes, removes it from :data:`_inFlight`.
+    """
+    if key in _inFlight and _inFlight[key][0] is future:
+        del _inFlight[key]
+    if not future.cancelled():
+        future.exception() # avoids warnings if all the callers were cancelled
+
+# raises BggUnreachable, reraises NoResultFound
+async def _fetch(requestType, payload, parseMethod, onResult, ticket, stream):
+    """ Sends a request and parses its result, raising an exception if all attempts fail.
+
+    Network errors, timeouts and the status codes in :data:`.constants.RETRYABLE_STATUS_CODES`
+    are retried after an exponential backoff (or the delay asked by BGG), up to
+    :data:`.constants.ATTEMPTS_LIMIT` attempts. A 202 status means that BGG queued the
+    request, so it is polled again until the data is ready. Other status codes are
+    not retried, and nothing is retried past :data:`.constants.SEARCH_DEADLINE`.
+    Every attempt goes through :data:`BREAKER`, so requests fail at once while BGG is down.
+
+    Args:
+        ticket (.scheduler.Ticket): The ticket of the request in :data:`SCHEDULER`, which
+            holds its priority.
+        See ``Args`` in :func:`~._search` for the others.
+
+    Returns:
+        See ``Returns`` in :func:`~._parseXml`.
+
+    Raises:
+        .exceptions.BggUnreachable: If it is not possible to establish a connection.
+        .exceptions.RequestShed: If the scheduler drops the request.
+        .exceptions.CircuitOpen: If the circuit breaker is open.
+        .exceptions.InvalidXmlStructure: If the response cannot be parsed.
+    """
+    deadline = time.monotonic() + constants.SEARCH_DEADLINE
+    failures = 0
+    while True:
+        if BREAKER.isOpen():
+            raise exceptions.CircuitOpen()
+        await SCHEDULER.acquire(ticket.priority, ticket)
+        if not BREAKER.allow():
+            raise exceptions.CircuitOpen()
+        parser = parseMethod() if stream else None
         try:
-            queryResult = _sendAPI2Req(requestType, payload)
-            return _parseXml(queryResult, parseMethod)
+            status, queryResult, retryAfter = await _sendAPI2Req(requestType, payload, parser)
         except exceptions.BggUnreachable as err:
-            if err.fatal:
-                retry = False
+            status, queryResult, retryAfter = None, None, None
+        except exceptions.InvalidXmlStructure:
+            # BGG answered, so the attempt still counts as a success for the breaker
+            BREAKER.recordSuccess()
+            raise
+        except BaseException:
+            # the outcome must be recorded even when the attempt is cancelled or the parser
+            # fails, otherwise a half-open breaker would wait for the probe forever
+            BREAKER.recordFailure()
+            raise
+        if status is None or status in constants.RETRYABLE_STATUS_CODES:
+            BREAKER.recordFailure()
+        else:
+            BREAKER.recordSuccess()
+        if 200 == status:
+            if stream:
+                result = parser.result()
             else:
-                attempts += 1
-                if attempts > constants.ATTEMPTS_LIMIT:
-                    retry = False
+                # large responses, like batches of games, are parsed out of the loop
+                size = len(queryResult) if queryResult is not None else 0
+                result = await offload.run("parse", size, _parseXml, queryResult, parseMethod)
+            if onResult is not None:
+                onResult(result)
+            return result
+        elif 202 == status:
+            # BGG queued the request: the data will be ready later
+            delay = retryAfter if retryAfter is not None else constants.QUEUED_POLL_INTERVAL
+            logger.info("Request queued by BGG, polling again in " + str(delay) + " seconds")
+        elif status is None or status in constants.RETRYABLE_STATUS_CODES:
+            failures += 1
+            if failures >= constants.ATTEMPTS_LIMIT:
+                logger.warning("Giving up after " + str(failures) + " failed attempts")
+                break
+            delay = retryAfter if retryAfter is not None else _backoff(failures)
+            logger.info("Attempt failed with status " + str(status) + ", retrying in " + str(round(delay, 2)) + " seconds")
+        else:
+            logger.error("Unexpected status code " + str(status))
+            break
+        if time.monotonic() + delay > deadline:
+            logger.warning("Search deadline exceeded")
+            break
+        await asyncio.sleep(delay)
     # if we get here, connection did not work
     raise exceptions.BggUnreachable(True)
 
+def _searchKey(name, exact):
+    """Normalizes a query, so that searches which BGG would answer in the same way
+    share the same entry in :data:`SEARCH_CACHE`.
+
+    Args:
+        name (str): The name to search.
+        exact (bool): Whether the search is exact or not.
+
+    Returns:
+        tuple: The key of the search.
+    """
+    return (" ".join(str(name).lower().split()), exact)
+
+def _gameListSize(gameList):
+    """Estimates the memory used by a list of games, in bytes.
+
+    Args:
+        gameList (.game.GameList): The list to measure.
+
+    Returns:
+        int: The estimated size of the list.
+    """
+    size = sys.getsizeof(gameList.gameList)
+    for game in gameList.gameList:
+        size += constants.SEARCH_CACHE_GAME_OVERHEAD + sys.getsizeof(game.name) + sys.getsizeof(game.link)
+    return size
+
+SEARCH_CACHE = cache.TimedLRUCache(constants.SEARCH_CACHE_SIZE, constants.SEARCH_CACHE_TTL, _gameListSize, constants.SEARCH_CACHE_MAX_BYTES)
+"""Lists of games found by name, keyed by the normalized query (see :func:`_searchKey`).
+Like :data:`GAME_CACHE`, callers always get a copy of the cached lists.
+"""
+
+def _remainingTtl(fetched, catalogTtl, cacheTtl):
+    """Computes how long an entry read from the catalog can stay in memory, so that
+    it does not outlive the catalog entry.
+
+    Args:
+        fetched (float): When the entry was retrieved from BGG, as a timestamp.
+        catalogTtl (float): The time to live of the entry in the catalog.
+        cacheTtl (float): The time to live of the entry in memory.
+
+    Returns:
+        float: The time to live of the entry in memory.
+    """
+    return max(0, min(cacheTtl, fetched + catalogTtl - time.time()))
+
+def _cacheGame(game, fetched=None):
+    """Inserts a game in :data:`GAME_CACHE`. If the game was just retrieved from BGG
+    it is also queued to be stored in the catalog.
+
+    Args:
+        game (.game.Game): The game to cache.
+        fetched (float): When the game was retrieved from BGG, if it was read from the catalog.
+    """
+    cachedGame = copy.copy(game)
+    if fetched is None:
+        GAME_CACHE.put(game.id_, cachedGame)
+        catalog.storeGame(cachedGame)
+    else:
+        GAME_CACHE.put(game.id_, cachedGame, _remainingTtl(fetched, constants.CATALOG_GAME_TTL, constants.GAME_CACHE_TTL))
+
+def _cacheSearch(key, gameList):
+    """Inserts a list of games just retrieved from BGG in :data:`SEARCH_CACHE` and
+    queues it to be stored in the catalog.
+
+    Args:
+        key (tuple): The key of the search, see :func:`_searchKey`.
+        gameList (.game.GameList): The list to cache.
+    """
+    cachedList = gameList.copy()
+    SEARCH_CACHE.put(key, cachedList)
+    catalog.storeSearch(key[0], key[1], cachedList)
+
+def _cacheGames(games):
+    for game in games:
+        _cacheGame(game)
+
+def _markStale(bggObject):
+    """Returns a copy of a game or of a list of games, marked as possibly outdated.
+    """
+    if isinstance(bggObject, GameList):
+        staleObject = bggObject.copy()
+    else:
+        staleObject = copy.copy(bggObject)
+    staleObject.stale = True
+    return staleObject
+
+async def _staleGames(ids):
+    """Gets games from :data:`GAME_CACHE` or from the catalog even if they are expired.
+    It is used when BGG is unreachable.
+
+    Args:
+        ids (list): The IDs of the games, as strings.
+
+    Returns:
+        dict: A dictionary where keys are game IDs and values are games marked as stale.
+    """
+    games = {}
+    for id_ in ids:
+        game = GAME_CACHE.getStale(id_)
+        if game is not None:
+            games[id_] = _markStale(game)
+    missing = [id_ for id_ in ids if id_ not in games]
+    for id_, (game, fetched) in (await catalog.getGames(missing, constants.CATALOG_STALE_TTL)).items():
+        games[id_] = _markStale(game)
+    if games:
+        logger.warning("Serving stale games: " + str(list(games)))
+    return games
+
+async def _staleSearch(key):
+    """Gets a list of games from :data:`SEARCH_CACHE` or from the catalog even if it is
+    expired. It is used when BGG is unreachable.
+
+    Args:
+        key (tuple): The key of the search, see :func:`_searchKey`.
+
+    Returns:
+        .game.GameList: The list marked as stale, or None.
+    """
+    gameList = SEARCH_CACHE.getStale(key)
+    if gameList is None:
+        stored = await catalog.getSearch(key[0], key[1], constants.CATALOG_STALE_TTL)
+        if stored is None:
+            return None
+        gameList = stored[0]
+    logger.warning("Serving stale search: " + str(key))
+    return _markStale(gameList)
+
+async def _searchList(name, exact, priority):
+    """Searches a list of games by name, using :data:`SEARCH_CACHE` and then the
+    catalog if possible. If BGG is unreachable, expired results are served if available.
+
+    Args:
+        name (str): The name to search.
+        exact (bool): Whether the name should be matched exactly or not.
+        priority (int): The priority of the request, see :func:`_search`.
+
+    Returns:
+        See ``Returns`` in :func:`~._parseXml`.
+    """
+    key = _searchKey(name, exact)
+    gameList = SEARCH_CACHE.get(key)
+    if gameList is None:
+        stored = await catalog.getSearch(*key)
+        if stored is not None:
+            gameList, fetched = stored
+            SEARCH_CACHE.put(key, gameList.copy(), _remainingTtl(fetched, constants.CATALOG_SEARCH_TTL, constants.SEARCH_CACHE_TTL))
+            return gameList
+        # BGG ignores case, so the normalized query lets equivalent searches share the request
+        # only board games are kept, so BGG is asked to count only those in the total
+        payload = {"query": key[0], "type": "boardgame"}
+        if exact:
+            payload["exact"] = "1"
+        try:
+            gameList = await _search(constants.REQUEST_KEYWORDS["name_search"], payload, xml_parser.GameListParser,
+                functools.partial(_cacheSearch, key), priority, True)
+        except exceptions.BggUnreachable:
+            gameList = await _staleSearch(key)
+            if gameList is None:
+                raise
+    return gameList.copy()
+
+async def _searchBatch(ids, priority):
+    """Sends a single ``thing`` request for a batch of IDs.
+
+    Args:
+        ids (list): The IDs of the games to search, as strings.
+        priority (int): The priority of the request, see :func:`_search`.
+
+    Returns:
+        list: See ``Returns`` in :func:`.xml_parser.parseGames`.
+    """
+    payload = {"id": ",".join(ids), "stats": "1"}
+    return await _search(constants.REQUEST_KEYWORDS["id_search"], payload, xml_parser.parseGames, _cacheGames, priority)
+
 
 # PUBLIC
 
-def searchById(id_):
+async def searchById(id_, priority=constants.PRIORITY_INTERACTIVE):
     """Searches a game using its ID.
 
     Args:
         id_ (str): The ID of the game to search.
+        priority (int): The priority of the request, if it must be sent to BGG.
+
+    Returns:
+        See ``Returns`` in :func:`~._parseXml`. If BGG is unreachable, an expired
+        game may be returned, marked as stale.
+    """
+    id_ = str(id_)
+    game = GAME_CACHE.get(id_)
+    if game is None:
+        stored = await catalog.getGames([id_])
+        if id_ in stored:
+            game, fetched = stored[id_]
+            _cacheGame(game, fetched)
+            return game
+        payload = {"id": id_, "stats": "1"}
+        try:
+            game = await _search(constants.REQUEST_KEYWORDS["id_search"], payload, xml_parser.parseGame, _cacheGame, priority)
+        except exceptions.BggUnreachable:
+            staleGames = await _staleGames([id_])
+            if id_ not in staleGames:
+                raise
+            return staleGames[id_]
+    return copy.copy(game)
+
+async def searchByIds(ids, priority=constants.PRIORITY_INTERACTIVE):
+    """Searches many games using their IDs. Games in :data:`GAME_CACHE` or in the catalog
+    are not requested again, the others are sent in batches of at most :data:`.constants.THING_IDS_LIMIT`,
+    which are requested concurrently.
+
+    Args:
+        ids (list): The IDs of the games to search.
+        priority (int): The priority of the requests, if they must be sent to BGG.
 
     Returns:
-        See ``Returns`` in :func:`~._parseXml`.        
+        list: A list of :class:`.game.Game`, in the same order as ``ids``. IDs which
+        do not correspond to a board game or an expansion are skipped. If BGG is
+        unreachable, expired games may be returned, marked as stale.
+
+    Raises:
+        .exceptions.NoResultFound: If no ID corresponds to a game.
     """
-    payload = {"id": id_, "stats": 1}
-    return _search(constants.REQUEST_KEYWORDS["id_search"], payload, xml_parser.parseGame)
+    ids = [str(id_) for id_ in ids]
+    if not ids:
+        raise exceptions.NoResultFound()
+    gamesById = {}
+    for id_ in ids:
+        game = GAME_CACHE.get(id_)
+        if game is not None:
+            gamesById[id_] = copy.copy(game)
+    missing = [id_ for id_ in ids if id_ not in gamesById]
+    for id_, (game, fetched) in (await catalog.getGames(missing)).items():
+        _cacheGame(game, fetched)
+        gamesById[id_] = game
+    missing = [id_ for id_ in missing if id_ not in gamesById]
+    limit = constants.THING_IDS_LIMIT
+    batches = [missing[i:i + limit] for i in range(0, len(missing), limit)]
+    results = await asyncio.gather(*[_searchBatch(batch, priority) for batch in batches], return_exceptions=True)
+    for batch, result in zip(batches, results):
+        if isinstance(result, exceptions.NoResultFound):
+            continue
+        if isinstance(result, exceptions.BggUnreachable):
+            staleGames = await _staleGames(batch)
+            if not staleGames:
+                raise result
+            gamesById.update(staleGames)
+            continue
+        if isinstance(result, Exception):
+            raise result
+        for game in result:
+            gamesById[game.id_] = copy.copy(game)
+    games = [gamesById[id_] for id_ in ids if id_ in gamesById]
+    if not games:
+        raise exceptions.NoResultFound()
+    return games
 
-def searchByName(name):
+async def searchByName(name, priority=constants.PRIORITY_INTERACTIVE):
     """Searches a game using a part of its name.
 
     Args:
         name (str): A part of the name of the game to search.
+        priority (int): The priority of the request, if it must be sent to BGG.
 
     Returns:
-        See ``Returns`` in :func:`~._parseXml`.        
+        See ``Returns`` in :func:`~._parseXml`.
     """
-    payload = {"query": name}
-    return _search(constants.REQUEST_KEYWORDS["name_search"], payload, xml_parser.parseGameList)
+    return await _searchList(name, False, priority)
 
-def searchByNameExact(name):
+async def searchByNameExact(name, priority=constants.PRIORITY_INTERACTIVE):
     """Searches a game using its name.
 
     Args:
         name (str): The exact name of the game to search.
+        priority (int): The priority of the request, if it must be sent to BGG.
 
     Returns:
-        See ``Returns`` in :func:`~._parseXml`.        
+        See ``Returns`` in :func:`~._parseXml`.
+    """
+    return await _searchList(name, True, priority)
+
+def attemptStats():
+    """Summarizes the most recent attempts in :data:`ATTEMPT_LOG`, to tune timeouts and
+    retries against the real BGG latency.
+
+    Returns:
+        dict: For each request type, the number of attempts by status (None for network
+        errors and timeouts) and the median, 90th percentile and maximum durations.
+    """
+    stats = {}
+    # the log is appended on the event loop: copying it is atomic, iterating it is not
+    for requestType, status, elapsed in list(ATTEMPT_LOG):
+        entry = stats.setdefault(requestType, {"status": {}, "elapsed": []})
+        entry["status"][status] = entry["status"].get(status, 0) + 1
+        entry["elapsed"].append(elapsed)
+    for entry in stats.values():
+        entry.update(summarize(entry.pop("elapsed")))
+    return stats
+
+async def closeSession():
+    """Closes the shared session. It should be called once, when the bot shuts down.
     """
-    payload = {"query": name, "exact": "1"}
-    return _search(constants.REQUEST_KEYWORDS["name_search"], payload, xml_parser.parseGameList)
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,91 @@
+"""This module runs CPU-heavy steps, like parsing the responses of BGG and formatting the
+answers, out of the event loop when their input is large, so that they do not stall the
+other updates.
+
+Steps with an input smaller than :data:`.constants.OFFLOAD_THRESHOLD` run on the loop,
+since handing them to a pool would cost more than running them. The duration of every
+step is recorded in :data:`STAGE_LOG`, to check when offloading pays off (see
+:func:`stageStats`).
+"""
+import time
+import asyncio
+import logging
+import collections
+import multiprocessing
+import concurrent.futures
+
+import constants
+from tools import stats
+
+logger = logging.getLogger("offload")
+
+_executor = None
+STAGE_LOG = collections.deque(maxlen=constants.STAGE_LOG_SIZE)
+"""The most recent steps, as tuples of (stage, size of the input, whether it was offloaded,
+duration). For offloaded steps the duration includes the wait for a worker.
+"""
+
+def openExecutor():
+    """Creates the pool configured by :data:`.constants.OFFLOAD_EXECUTOR`. Until it is
+    called, every step runs on the loop.
+    """
+    global _executor
+    if "thread" == constants.OFFLOAD_EXECUTOR:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=constants.OFFLOAD_WORKERS)
+    elif "process" == constants.OFFLOAD_EXECUTOR:
+        # the pool starts its processes when the bot already runs threads, which must not be forked
+        _executor = concurrent.futures.ProcessPoolExecutor(max_workers=constants.OFFLOAD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"))
+    else:
+        _executor = None
+    logger.info("Offload executor: " + str(constants.OFFLOAD_EXECUTOR))
+
+def closeExecutor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+async def run(stage, size, function, *args):
+    """Runs a step, in the pool if its input is large enough.
+
+    Args:
+        stage (str): The name of the step, for :func:`stageStats`.
+        size (int): The size of the input, compared with :data:`.constants.OFFLOAD_THRESHOLD`.
+        function (Callable): The function to run. With a process pool, it must be a
+            module-level function, and its arguments and result must be picklable.
+        *args: The arguments of the function.
+
+    Returns:
+        The result of the function. Exceptions raised by the function are raised again.
+    """
+    offloaded = _executor is not None and size >= constants.OFFLOAD_THRESHOLD
+    start = time.perf_counter()
+    try:
+        if offloaded:
+            return await asyncio.get_event_loop().run_in_executor(_executor, function, *args)
+        return function(*args)
+    finally:
+        STAGE_LOG.append((stage, size, offloaded, time.perf_counter() - start))
+
+def stageStats():
+    """Summarizes the most recent steps in :data:`STAGE_LOG`.
+
+    Returns:
+        dict: For each stage and for steps run on the loop ("loop") or offloaded
+        ("pool"), the number of steps, the median size of their input and the median,
+        90th percentile and maximum durations in milliseconds.
+    """
+    steps = {}
+    # the log is appended on the event loop: copying it is atomic, iterating it is not
+    for stage, size, offloaded, elapsed in list(STAGE_LOG):
+        entry = steps.setdefault((stage, "pool" if offloaded else "loop"), ([], []))
+        entry[0].append(size)
+        entry[1].append(elapsed)
+    summary = {}
+    for (stage, mode), (sizes, elapsed) in steps.items():
+        sizes.sort()
+        entry = {"steps": len(elapsed), "size": sizes[len(sizes) // 2]}
+        entry.update(stats.summarize(elapsed, 0.9, 1000))
+        summary.setdefault(stage, {})[mode] = entry
+    return summary
@@ -39,7 +39,7 @@ def _appendList(originalString, listToAppend, separator, ending):
 def _formatGameTitle(game):
     s = _bold(_escapeHtml(game.name.title()))
     if game.year is not None:
-        s += " (" + game.year + ")"
+        s += " (" + str(game.year) + ")"
     s += "\n"
     return s
 
@@ -58,26 +58,22 @@ def _formatGameInfo(game):
             s += _italic("Artists: ")
         s = _appendList(s, game.getArtists(), ", ", ".\n")
     if game.average is not None:
-        try:
-            rating = str(round(float(game.average), 1))
-            if "." in rating:
-                rating = rating.rstrip("0").rstrip(".")
-                # remove decimal part if zero
-            s += _italic("Rating: ") + rating + "\n"
-        except ValueError:
-            # just skip the average, which is likely not available
-            logger.info("Game average is not a number: " + game.average)
+        rating = str(round(game.average, 1))
+        if "." in rating:
+            rating = rating.rstrip("0").rstrip(".")
+            # remove decimal part if zero
+        s += _italic("Rating: ") + rating + "\n"
     if game.rank is not None:
-        s += _italic("Rank: ") + game.rank + "\n"
-    if game.playingTime is not None and "0" != game.playingTime:
-        s += _italic("Playing time: ") + game.playingTime + " minutes.\n"
+        s += _italic("Rank: ") + str(game.rank) + "\n"
+    if game.playingTime:
+        s += _italic("Playing time: ") + str(game.playingTime) + " minutes.\n"
     if game.minPlayers is not None:
-        s += _italic("Players: ") + game.minPlayers
+        s += _italic("Players: ") + str(game.minPlayers)
     if game.maxPlayers is not None:
         if game.minPlayers is None:
-            s += _italic("Players: ") + game.maxPlayers
+            s += _italic("Players: ") + str(game.maxPlayers)
         elif game.maxPlayers > game.minPlayers:
-            s += " - " + game.maxPlayers
+            s += " - " + str(game.maxPlayers)
     return s + "\n"
 
 def _formatGameDescription(game):
@@ -94,6 +90,16 @@ def _formatGameThumbnail(game):
 def _formatGameLink(game):
     return _link(game.link, "Read on BoardGameGeek.") + "\n"
 
+def _formatStaleWarning(bggObject):
+    if bggObject.stale:
+        return "\n" + _italic("BoardGameGeek is unreachable, this information may be outdated.") + "\n"
+    return ""
+
+def _formatTruncatedList(gameList):
+    if gameList.total is not None and gameList.total > gameList.length():
+        return "\n" + _italic("Showing the first " + str(gameList.length()) + " of " + str(gameList.total) + " games found, try a more specific search.") + "\n"
+    return ""
+
 def _formatGameBodyLess(game):
     """Formats the body of an answer containing a game, inserting only basic info.
 
@@ -107,6 +113,7 @@ def _formatGameBodyLess(game):
     s += _formatGameInfo(game)
     s += _formatGameThumbnail(game)
     s += _formatGameLink(game)
+    s += _formatStaleWarning(game)
     return s
 
 def _formatGameBodyMore(game):
@@ -121,6 +128,7 @@ def _formatGameBodyMore(game):
     s = _formatGameTitle(game) + "\n"
     s += _formatGameDescription(game)
     s += _formatGameLink(game)
+    s += _formatStaleWarning(game)
     return s
 
 def _formatGameListBody(gameList):
@@ -141,9 +149,11 @@ def _formatGameListBody(gameList):
         s += " " + str(count) + "."  # element number
         s += " " + _bold(_escapeHtml(game.name.title()))
         if game.year is not None:
-            s += " (" + game.year + ")"
+            s += " (" + str(game.year) + ")"
         s += " - ID: /" + game.id_ + "\n"
         count += 1
+    s += _formatTruncatedList(gameList)
+    s += _formatStaleWarning(gameList)
     return s
 
 def formatGame(game, more=False):
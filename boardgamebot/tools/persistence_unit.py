@@ -1,47 +1,325 @@
-"""This module saves and retrieves user and chat history.
+"""This module saves and retrieves user and chat history, when it is kept in memory by
+:class:`.MemoryHistoryStore`.
+
+The history is saved in an index (see :mod:`.history_index`) and in a log of the entries
+changed after the index was written: every save appends the entries changed since the
+previous one (see :meth:`.MemoryHistoryStore.takeChanges`), so its cost depends on the
+number of active chats, not on the size of the history. When the log grows larger than
+:data:`.constants.HISTORY_LOG_MAX_SIZE`, it is merged into a new index.
+
+At startup the index is only memory-mapped and the log is read without unpickling its
+values: entries are unpickled by :func:`loadEntry` the first time they are used, so the
+startup time does not depend on the size of the history, and the entries of chats which
+never come back are never unpickled.
+
+The history is changed by the event loop, so the changed entries are serialized on the
+loop itself (see :func:`takeSnapshot`): this gives a consistent view of them and takes
+a time proportional to their number, while the thread which saves the history only
+writes bytes. The time the loop spends on snapshots is recorded in :data:`PAUSE_LOG`.
 """
 import os
+import time
 import pickle
 import logging
+import threading
+import collections
+import concurrent.futures
 
 import constants
 from tools import history_manager
+from tools import stats
+from objects.history_index import HistoryIndex, packRecord, readRecords
 
 logger = logging.getLogger("persistence_unit")
 
-def saveHistory():
-    """Saves the history on file.
+_logLock = threading.Lock()
+"""Prevents appends to the log while it is merged into the index."""
+_indexLock = threading.Lock()
+"""Prevents lookups in the index while it is replaced, since the old one is unmapped."""
+_index = None
+"""The :class:`~.history_index.HistoryIndex` of the saved history."""
+_pending = {}
+"""The records in the log when the bot started, not merged into :data:`_index` yet. Keys
+are tuples of ("c", chat ID) or ("u", user ID), values are tuples of last access and
+pickled value (empty if the entry was discarded).
+"""
+PAUSE_LOG = collections.deque(maxlen=constants.PAUSE_LOG_SIZE)
+"""The most recent snapshots, as tuples of (number of entries, time the loop was paused).
+See :func:`pauseStats`.
+"""
+
+def _lastAccess(kind, value):
+    return value.lastAccess if "c" == kind else value[1]
+
+def _packRecords(records):
+    """Serializes the records returned by :meth:`.MemoryHistoryStore.takeChanges`.
+    """
+    data = []
+    for kind, key, value in records:
+        if value is None:
+            data.append(packRecord(kind, key, 0.0, b""))
+        else:
+            data.append(packRecord(kind, key, _lastAccess(kind, value), pickle.dumps(value, -1)))
+    return b"".join(data)
+
+def _readLog(path):
+    """Reads the log, keeping only the latest record of each entry.
+
+    Returns:
+        tuple: The records, see :data:`_pending`, and the size of the valid part of the
+        log, which is smaller than the file if the last record is truncated.
+    """
+    records = {}
+    size = 0
+    if os.path.exists(path):
+        with open(path, "rb") as log:
+            for kind, key, lastAccess, data in readRecords(log):
+                records[(kind, key)] = (lastAccess, data)
+                size = log.tell()
+    return records, size
+
+def _appendLog(path, data):
+    with _logLock:
+        with open(path, "ab") as log:
+            log.write(data)
+            log.flush()
+            os.fsync(log.fileno())
+
+def _mergeEntries(index, records):
+    """Merges the records of the log into the entries of the index. Discarded entries and
+    entries idle for longer than :data:`.constants.HISTORY_MAX_IDLE` are left out, as
+    well as the least recently used ones beyond :data:`.constants.HISTORY_MAX_CHATS`
+    and :data:`.constants.HISTORY_MAX_USERS`.
+
+    Returns:
+        list: The entries for :meth:`.HistoryIndex.write`.
+    """
+    entries = {}
+    if index is not None:
+        for kind, key, lastAccess, data in index.rows():
+            entries[(kind, key)] = (lastAccess, data)
+    entries.update(records)
+    minAccess = time.time() - constants.HISTORY_MAX_IDLE
+    merged = []
+    for kind, maxSize in (("c", constants.HISTORY_MAX_CHATS), ("u", constants.HISTORY_MAX_USERS)):
+        kept = [(kind, key, lastAccess, data) for (entryKind, key), (lastAccess, data) in entries.items()
+            if entryKind == kind and len(data) > 0 and lastAccess >= minAccess]
+        if len(kept) > maxSize:
+            kept = sorted(kept, key=lambda entry: entry[2])[-maxSize:]
+        merged.extend(sorted(kept, key=lambda entry: entry[1]))
+    return merged
+
+def _writeIndex(entries):
+    """Writes a new index, empties the log and starts using the new index.
+
+    Returns:
+        .HistoryIndex: The old index, to be closed with :func:`_closeIndex` once the
+        entries taken from it are not used anymore.
+    """
+    global _index, _pending
+    HistoryIndex.write(constants.HISTORY_INDEX_PATH, entries)
+    index = HistoryIndex(constants.HISTORY_INDEX_PATH)
+    # if the bot stops before the log is emptied, its records are merged again: no harm
+    with open(constants.HISTORY_LOG_PATH, "wb") as log:
+        os.fsync(log.fileno())
+    with _indexLock:
+        oldIndex = _index
+        _index = index
+        _pending = {}
+    if index.size() > constants.HISTORY_WARNING_SIZE:
+        logger.error("Very large history size!")
+    return oldIndex
+
+def _closeIndex(index):
+    if index is None:
+        return
+    try:
+        index.close()
+    except BufferError:
+        logger.warning("Old history index still in use, it is unmapped when released")
+
+def compactHistory():
+    """Merges the log into a new index. It works on the files alone, so it does not
+    need to access the history in memory.
+    """
+    with _logLock:
+        entries = _mergeEntries(_index, _readLog(constants.HISTORY_LOG_PATH)[0])
+        count = len(entries)
+        oldIndex = _writeIndex(entries)
+        # the entries are views of the old index, which cannot be unmapped before them
+        del entries
+        _closeIndex(oldIndex)
+    logger.info("History compacted: " + str(count) + " entries, " + str(_index.size()) + " bytes")
+
+def loadEntry(kind, key):
+    """Gets a saved entry of the history, see :meth:`.MemoryHistoryStore.setLoader`.
+
+    Args:
+        kind (str): "c" for a chat, "u" for a user.
+        key (int): The ID of the chat or user.
+
+    Returns:
+        object: The :class:`~.chat_history.ChatHistory` of the chat or the tuple of the
+        user, or None if it is not saved.
+    """
+    with _indexLock:
+        entry = _pending.get((kind, key))
+        if entry is None and _index is not None:
+            entry = _index.find(kind, key)
+        if entry is None or len(entry[1]) == 0:
+            return None
+        try:
+            return pickle.loads(entry[1])
+        except:
+            logger.exception("Cannot read history of " + kind + " " + str(key))
+            return None
+
+def takeSnapshot():
+    """Collects and serializes the entries changed since the last snapshot. It must run
+    on the event loop, or when the loop is not running, so that no entry changes meanwhile.
+
+    Returns:
+        tuple: The serialized records and the records themselves, to be passed to
+        :meth:`.MemoryHistoryStore.restoreChanges` if they cannot be saved.
+    """
+    start = time.perf_counter()
+    records = history_manager.STORE.takeChanges()
+    data = _packRecords(records)
+    PAUSE_LOG.append((len(records), time.perf_counter() - start))
+    return data, records
+
+def _takeSnapshotOnLoop(loop):
+    """Runs :func:`takeSnapshot` on a running loop and waits for the result.
+
+    Returns:
+        tuple: See :func:`takeSnapshot`, or None if the loop did not run it within
+        :data:`.constants.HISTORY_SAVING_INTERVAL` seconds, for example because it is
+        stopping.
+    """
+    future = concurrent.futures.Future()
+    def run():
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(takeSnapshot())
+            except Exception as e:
+                future.set_exception(e)
+    loop.call_soon_threadsafe(run)
+    try:
+        return future.result(constants.HISTORY_SAVING_INTERVAL)
+    except concurrent.futures.TimeoutError:
+        # if it is too late to cancel, the snapshot is being taken and must be saved
+        if future.cancel():
+            logger.warning("The event loop did not take the history snapshot in time")
+            return None
+        return future.result()
+
+def saveHistory(loop=None):
+    """Appends the entries changed since the last save to the log, and merges the log
+    into the index if it is larger than :data:`.constants.HISTORY_LOG_MAX_SIZE`.
+
+    Args:
+        loop (asyncio.AbstractEventLoop): The loop which changes the history, if it is
+            running in another thread. If None, the history must not change meanwhile.
     """
     try:
-        with open(constants.CHAT_HISTORY_PATH, "wb") as chatHistory:
-            pickle.dump(history_manager.CHAT_HISTORY, chatHistory, -1)
+        snapshot = _takeSnapshotOnLoop(loop) if loop is not None else takeSnapshot()
     except:
-        logger.error("Cannot save chat history!")
+        logger.exception("Cannot take history snapshot!")
+        return
+    if snapshot is None:
+        return
+    data, records = snapshot
+    if records:
+        try:
+            _appendLog(constants.HISTORY_LOG_PATH, data)
+        except:
+            logger.exception("Cannot save history!")
+            history_manager.STORE.restoreChanges(records)
+            return
     try:
-        with open(constants.USER_HISTORY_PATH, "wb") as userHistory:
-            pickle.dump(history_manager.USER_PRIVATE_CHAT, userHistory, -1)
+        if os.path.getsize(constants.HISTORY_LOG_PATH) > constants.HISTORY_LOG_MAX_SIZE:
+            compactHistory()
     except:
-        logger.error("Cannot save user history!")
-    statinfo = os.stat(constants.CHAT_HISTORY_PATH)
-    if(statinfo.st_size > constants.HISTORY_WARNING_SIZE):
-        logger.error("Very large chat history size!")
-    statinfo = os.stat(constants.USER_HISTORY_PATH)
-    if(statinfo.st_size > constants.HISTORY_WARNING_SIZE):
-        logger.error("Very large user history size!")
+        logger.exception("Cannot compact history!")
 
-def getHistory():
-    """Retrieves the history from file.
+def pauseStats():
+    """Summarizes the most recent snapshots in :data:`PAUSE_LOG`.
+
+    Returns:
+        dict: The number of snapshots, the mean number of entries per snapshot and the
+        median, 99th percentile and maximum time the loop was paused, in milliseconds.
+    """
+    # the log is appended on the event loop: copying it is atomic, iterating it is not
+    snapshots = list(PAUSE_LOG)
+    if not snapshots:
+        return {"snapshots": 0}
+    pauses = [pause for entries, pause in snapshots]
+    summary = {"snapshots": len(pauses),
+        "entries": round(sum(entries for entries, pause in snapshots) / len(pauses), 1)}
+    summary.update(stats.summarize(pauses, 0.99, 1000))
+    return summary
+
+def _readLegacyHistory():
+    """Reads the history saved as whole pickles by earlier versions.
     """
+    chats = {}
+    users = {}
     try:
         with open(constants.CHAT_HISTORY_PATH, 'rb') as chatHistory:
-            history_manager.CHAT_HISTORY = pickle.load(chatHistory)
+            chats = pickle.load(chatHistory)
     except:
         logger.warning("Cannot read chat history")
     try:
         with open(constants.USER_HISTORY_PATH, 'rb') as userHistory:
-            history_manager.USER_PRIVATE_CHAT = pickle.load(userHistory)
+            users = pickle.load(userHistory)
     except:
         logger.warning("Cannot read user history")
+    return chats, users
+
+def _migrateLegacyHistory():
+    """Writes the first index from the history saved by earlier versions.
+    """
+    chats, users = _readLegacyHistory()
+    now = time.time()
+    entries = [("c", chatId, chatHistory.lastAccess, pickle.dumps(chatHistory, -1))
+        for chatId, chatHistory in sorted(chats.items())]
+    for userId, user in sorted(users.items()):
+        if not isinstance(user, tuple):
+            user = (user, now)
+        entries.append(("u", userId, user[1], pickle.dumps(user, -1)))
+    _closeIndex(_writeIndex(entries))
+    logger.info("History migrated: " + str(len(chats)) + " chats, " + str(len(users)) + " users")
+
+def getHistory():
+    """Opens the saved history, which is then loaded one entry at a time by
+    :func:`loadEntry`. If there is no index yet, the history saved by earlier versions
+    is migrated. An index which cannot be read is moved aside, with the ``.bad``
+    extension, so that the next compaction does not replace it with the log alone.
+    It must be called before the event loop starts.
+    """
+    global _index, _pending
+    try:
+        if not os.path.exists(constants.HISTORY_INDEX_PATH):
+            _migrateLegacyHistory()
+        else:
+            _closeIndex(_index)
+            _index = None
+            _index = HistoryIndex(constants.HISTORY_INDEX_PATH)
+    except:
+        logger.exception("Cannot read history index")
+        if os.path.exists(constants.HISTORY_INDEX_PATH):
+            os.replace(constants.HISTORY_INDEX_PATH, constants.HISTORY_INDEX_PATH + ".bad")
+            logger.error("History index moved to " + constants.HISTORY_INDEX_PATH + ".bad")
+    try:
+        _pending, size = _readLog(constants.HISTORY_LOG_PATH)
+        if os.path.exists(constants.HISTORY_LOG_PATH) and os.path.getsize(constants.HISTORY_LOG_PATH) > size:
+            # new records must not be appended after a truncated one
+            with open(constants.HISTORY_LOG_PATH, "r+b") as log:
+                log.truncate(size)
+    except:
+        logger.exception("Cannot read history log")
+    history_manager.STORE.setHistory({}, {})
+    history_manager.STORE.setLoader(loadEntry)
 
 def getInlineDefault():
     """Loads the default inline result from file.
@@ -0,0 +1,20 @@
+"""This module summarizes the durations recorded by the other modules for their statistics.
+"""
+
+def summarize(durations, percentile=0.9, scale=1):
+    """Summarizes a list of durations.
+
+    Args:
+        durations (list): The durations, at least one.
+        percentile (float): The percentile reported besides the median and the maximum.
+        scale (float): A factor applied to the durations, like 1000 to report seconds
+            as milliseconds.
+
+    Returns:
+        dict: The median, the percentile (as "p90" for 0.9) and the maximum, rounded to
+        three decimals.
+    """
+    durations = sorted(durations)
+    return {"median": round(durations[len(durations) // 2] * scale, 3),
+        "p" + str(int(round(percentile * 100))): round(durations[int(len(durations) * percentile)] * scale, 3),
+        "max": round(durations[-1] * scale, 3)}
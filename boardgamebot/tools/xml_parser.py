@@ -1,5 +1,12 @@
 """This module parses XML strings received from BGG.
+
+Documents are parsed by a backend: lxml, which is faster, if it is installed and
+defusedxml otherwise (see :data:`.constants.XML_BACKEND`). Both produce identical
+:class:`.game.Game` objects, and both refuse entities and DTDs. Search responses are
+always parsed incrementally by defusedxml, whose callbacks are cheaper than lxml ones
+(see ``test/benchmark_xml_parser.py``).
 """
+import defusedxml
 import defusedxml.ElementTree as ET
 import logging
 
@@ -7,8 +14,77 @@ import exceptions
 import constants
 from objects.game import Game, GameList
 
+try:
+    from lxml import etree as lxmlEtree
+except ImportError:
+    lxmlEtree = None
+
 logger = logging.getLogger("xml_parser")
 
+def _toBytes(xmlString):
+    # lxml refuses strings with an encoding declaration
+    if isinstance(xmlString, str):
+        return xmlString.encode("utf-8")
+    return xmlString
+
+class _DefusedBackend():
+    """Parses with defusedxml, a hardened version of the standard library parser.
+    """
+    name = "defusedxml"
+    errors = (ET.ParseError, defusedxml.DefusedXmlException)
+
+    def fromstring(self, xmlString):
+        return ET.fromstring(xmlString)
+
+class _LxmlBackend():
+    """Parses with lxml, with the settings which make it safe for untrusted input:
+    no entity expansion, no DTD and no network access.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        self.errors = (lxmlEtree.XMLSyntaxError,)
+        self._parser = lxmlEtree.XMLParser(resolve_entities=False, load_dtd=False,
+            no_network=True, huge_tree=False, remove_comments=True, remove_pis=True)
+
+    def fromstring(self, xmlString):
+        root = lxmlEtree.fromstring(_toBytes(xmlString), self._parser)
+        if root.getroottree().docinfo.doctype:
+            raise exceptions.InvalidXmlStructure()
+        return root
+
+_backend = None
+"""The backend in use, see :func:`setBackend`."""
+
+def setBackend(name):
+    """Chooses the backend used to parse.
+
+    Args:
+        name (str): "lxml", "defusedxml" or "auto" to use lxml if it is installed.
+
+    Raises:
+        ValueError: If the backend is unknown, or if lxml is required but not installed.
+    """
+    global _backend
+    if "auto" == name:
+        name = "lxml" if lxmlEtree is not None else "defusedxml"
+    if "lxml" == name:
+        if lxmlEtree is None:
+            raise ValueError("lxml is not installed")
+        _backend = _LxmlBackend()
+    elif "defusedxml" == name:
+        _backend = _DefusedBackend()
+    else:
+        raise ValueError("Unknown XML backend: " + name)
+    logger.info("XML backend: " + name)
+
+def getBackend():
+    """Returns the name of the backend in use.
+    """
+    return _backend.name
+
+setBackend(constants.XML_BACKEND)
+
 def _getRoot(xmlString):
     """Gets the root of the XML document.
 
@@ -16,14 +92,20 @@ def _getRoot(xmlString):
         xmlString (str): The string to parse.
 
     Returns:
-        defusedxml.ElementTree.Element: The root of the document.
+        Element: The root of the document, an ElementTree or lxml element depending on
+        the backend.
 
     Raises:
         .exceptions.NoResultFound: If xmlString is None.
+        .exceptions.InvalidXmlStructure: If the document is not valid.
     """
     if xmlString is None:
         raise exceptions.NoResultFound()
-    return ET.fromstring(xmlString)
+    try:
+        return _backend.fromstring(xmlString)
+    except _backend.errors as err:
+        logger.exception("Parse exception")
+        raise exceptions.InvalidXmlStructure()
 
 def _parseThumbnail(thumb):
     """Parses the thumbnail string.
@@ -35,13 +117,195 @@ def _parseThumbnail(thumb):
     """
     return thumb[2:]
 
+def _parseStatistics(statistics, game):
+    """Parses the ``statistics`` element of an item.
+
+    Args:
+        statistics (Element): The element to parse.
+        game (.game.Game): The game to update.
+    """
+    ratings = statistics.find("ratings")
+    if ratings is not None:
+        avg = ratings.find("average")
+        if avg is not None:
+            game.setAverage(avg.get("value"))
+        ranks = ratings.find("ranks")
+        if ranks is not None:
+            for rank in ranks.findall("rank"):
+                if "1" == rank.get("id"):
+                    game.setRank(rank.get("value"))
+
+def _parseGameItem(item):
+    """Parses a single ``item`` element of a ``thing`` response.
+
+    Args:
+        item (Element): The element to parse.
+
+    Returns:
+        .game.Game: an object containing all the information on the game, or None
+        if the item is not a board game or an expansion.
+
+    Raises:
+        .exceptions.InvalidXmlStructure: If there is an error while parsing.
+    """
+    game = None
+    type_ = item.get("type")
+    if "boardgame" == type_ or "boardgameexpansion" == type_:
+        game = Game(id_=item.get("id"))
+        descr = None
+        # a single pass over the children is much faster than a find for each of them
+        for elem in item:
+            tag = elem.tag
+            if "name" == tag:
+                if game.name is None and "primary" == elem.get("type"):
+                    game.setName(elem.get("value"))
+            elif "link" == tag:
+                linkType = elem.get("type")
+                if "boardgamecategory" == linkType:
+                    game.addCategory(elem.get("value"))
+                elif "boardgamemechanic" == linkType:
+                    game.addMechanic(elem.get("value"))
+                elif "boardgamedesigner" == linkType:
+                    game.addDesigner(elem.get("value"))
+                elif "boardgameartist" == linkType:
+                    game.addArtist(elem.get("value"))
+            elif "yearpublished" == tag:
+                if game.year is None:
+                    game.setYear(elem.get("value"))
+            elif "playingtime" == tag:
+                if game.playingTime is None:
+                    game.setPlayingTime(elem.get("value"))
+            elif "minplayers" == tag:
+                if game.minPlayers is None:
+                    game.setMinPlayers(elem.get("value"))
+            elif "maxplayers" == tag:
+                if game.maxPlayers is None:
+                    game.setMaxPlayers(elem.get("value"))
+            elif "description" == tag:
+                if descr is None:
+                    descr = elem.text or ""
+            elif "thumbnail" == tag:
+                if game.thumbnail is None:
+                    game.setThumbnail(_parseThumbnail(elem.text))
+            elif "statistics" == tag:
+                _parseStatistics(elem, game)
+        game.setDescription(descr if descr else "No description available.")
+        game.setLink(constants.BOARDGAMEGEEK_BASE_ADDRESS + game.id_)
+    return game
+
 # PUBLIC
 
-def parseGameList(xmlString):
-    """Parses a string representing a list of games.
+class GameListParser():
+    """Parses the response of a ``search`` request incrementally, while it is received,
+    without building the whole document in memory.
+
+    Only items of type ``boardgame`` are kept, up to a limit: once it is reached the rest
+    of the response is ignored, so the caller can stop reading it. The number of board games
+    found by BGG is reported separately in :attr:`.game.GameList.total`.
+
+    Args:
+        limit (int): The maximum number of games to keep. The default is
+            :data:`.constants.LIST_SIZE_LIMIT`.
+    """
+    def __init__(self, limit=None):
+        self.limit = constants.LIST_SIZE_LIMIT if limit is None else limit
+        self.gameList = GameList()
+        self.found = 0
+        self.done = False
+        self._declaredTotal = None
+        self._game = None
+        self._parser = ET.DefusedXMLParser(target=self)
+
+    # target methods, called by the underlying parser
+
+    def start(self, tag, attrib):
+        if "items" == tag:
+            total = attrib.get("total")
+            if total is not None and total.isdigit():
+                self._declaredTotal = int(total)
+        elif "item" == tag:
+            if "boardgame" == attrib.get("type"):
+                self.found += 1
+                # after the limit, the rest of the current chunk is only counted
+                if not self.done:
+                    self._game = Game(id_=attrib.get("id"))
+        elif self._game is not None:
+            if "name" == tag and self._game.name is None:
+                self._game.setName(attrib.get("value"))
+            elif "yearpublished" == tag:
+                self._game.setYear(attrib.get("value"))
+
+    def end(self, tag):
+        if "item" == tag and self._game is not None:
+            if self._game.name is None:
+                raise exceptions.InvalidXmlStructure()
+            self._game.setLink(constants.BOARDGAMEGEEK_BASE_ADDRESS + self._game.id_)
+            self.gameList.addGame(self._game)
+            self._game = None
+            if self.gameList.length() >= self.limit:
+                self.done = True
+
+    def data(self, text):
+        pass
+
+    def doctype(self, name, pubid, system):
+        # BGG responses never have a DTD
+        raise exceptions.InvalidXmlStructure()
+
+    def close(self):
+        pass
+
+    def feed(self, data):
+        """Parses the next chunk of the response.
+
+        Args:
+            data (bytes): The chunk to parse, it can also be a string.
+
+        Returns:
+            bool: True if the limit was reached, so the rest of the response is not needed.
+
+        Raises:
+            .exceptions.InvalidXmlStructure: If there is an error while parsing.
+        """
+        if not self.done:
+            try:
+                self._parser.feed(data)
+            except _DefusedBackend.errors as err:
+                logger.exception("Parse exception")
+                raise exceptions.InvalidXmlStructure()
+        return self.done
+
+    def result(self):
+        """Ends the parsing and returns the games found.
+
+        Returns:
+            .game.GameList: an object containing the games kept. If the response was
+            cut off, its total is the one declared by BGG.
+
+        Raises:
+            .exceptions.InvalidXmlStructure: If the response is not complete.
+            .exceptions.NoResultFound: If the list is empty.
+        """
+        if self.done:
+            self.gameList.total = max(self.found, self._declaredTotal or 0)
+        else:
+            try:
+                self._parser.close()
+            except _DefusedBackend.errors as err:
+                logger.exception("Parse exception")
+                raise exceptions.InvalidXmlStructure()
+            self.gameList.total = self.found
+        if self.gameList.isEmpty():
+            raise exceptions.NoResultFound()
+        return self.gameList
+
+def parseGameList(xmlString, limit=None):
+    """Parses a string representing a list of games. See :class:`GameListParser`.
 
     Args:
         xmlString: The string to parse.
+        limit (int): The maximum number of games to keep. The default is
+            :data:`.constants.LIST_SIZE_LIMIT`.
 
     Returns:
         .game.GameList: an object containing all the information on the list.
@@ -50,27 +314,11 @@ def parseGameList(xmlString):
         .exceptions.InvalidXmlStructure: If there is an error while parsing.
         .exceptions.NoResultFound: If the list is empty.
     """
-    root = _getRoot(xmlString)
-    gameList = GameList()
-    for elem in root.iter("item"):
-        if "boardgame" == elem.get("type"):
-            try:
-                game = Game(id_=elem.get("id"))
-                nameElem = elem.find("name")
-                if nameElem is None:
-                    raise exceptions.InvalidXmlStructure()
-                game.setName(nameElem.get("value"))
-                yearElem = elem.find("yearpublished")
-                if yearElem is not None:
-                    game.setYear(yearElem.get("value"))
-                game.setLink(constants.BOARDGAMEGEEK_BASE_ADDRESS + game.id_)
-                gameList.addGame(game)
-            except ET.ParseError as err:
-                logger.exception("Parse exception")
-                raise exceptions.InvalidXmlStructure()
-    if gameList.isEmpty():
+    if xmlString is None:
         raise exceptions.NoResultFound()
-    return gameList
+    parser = GameListParser(limit)
+    parser.feed(xmlString)
+    return parser.result()
 
 def parseGame(xmlString):
     """Parses a string representing a game.
@@ -89,62 +337,32 @@ def parseGame(xmlString):
     item = root.find("item")
     if item is None:
         raise exceptions.NoResultFound()
-    game = None
-    type_ = item.get("type")
-    if "boardgame" == type_ or "boardgameexpansion" == type_:
-        try:
-            game = Game(id_=item.get("id"))
-            for nameElem in item.findall("name"):
-                if "primary" == nameElem.get("type"):
-                    game.setName(nameElem.get("value"))
-                    break;
-            yearElem = item.find("yearpublished")
-            if yearElem is not None:
-                game.setYear(yearElem.get("value"))
-            playingTimeElem = item.find("playingtime")
-            if playingTimeElem is not None:
-                game.setPlayingTime(playingTimeElem.get("value"))
-            minPlayersElem = item.find("minplayers")
-            if minPlayersElem is not None:
-                game.setMinPlayers(minPlayersElem.get("value"))
-            maxPlayersElem = item.find("maxplayers")
-            if maxPlayersElem is not None:
-                game.setMaxPlayers(maxPlayersElem.get("value"))
-            for elem in item.findall("link"):
-                if "boardgamecategory" == elem.get("type"):
-                    game.addCategory(elem.get("value"))
-                elif "boardgamemechanic" == elem.get("type"):
-                    game.addMechanic(elem.get("value"))
-                elif "boardgamedesigner" == elem.get("type"):
-                    game.addDesigner(elem.get("value"))
-                elif "boardgameartist" == elem.get("type"):
-                    game.addArtist(elem.get("value"))
-            descrElem = item.find("description")
-            if descrElem is None or not descrElem.text:
-                descr = "No description available."
-            else:
-                descr = descrElem.text
-            game.setDescription(descr)
-            thumbElem = item.find("thumbnail")
-            if thumbElem is not None:
-                game.setThumbnail(_parseThumbnail(thumbElem.text))
-            game.setLink(constants.BOARDGAMEGEEK_BASE_ADDRESS + game.id_)
-            # STATS
-            statistics = item.find("statistics")
-            if statistics is not None:
-                ratings = statistics.find("ratings")
-                if ratings is not None:
-                    avg = ratings.find("average")
-                    if avg is not None:
-                        game.setAverage(avg.get("value"))
-                    ranks = ratings.find("ranks")
-                    if ranks is not None:
-                        for rank in ranks.findall("rank"):
-                            if "1" == rank.get("id"):
-                                game.setRank(rank.get("value"))
-        except ET.ParseError as err:
-            logger.exception("Parse exception")
-            raise exceptions.InvalidXmlStructure()
+    game = _parseGameItem(item)
     if game is None:
         raise exceptions.NoResultFound()
     return game
+
+def parseGames(xmlString):
+    """Parses a string representing many games, as returned by a ``thing`` request
+    with a list of IDs.
+
+    Args:
+        xmlString: The string to parse.
+
+    Returns:
+        list: A list of :class:`.game.Game`, in the same order as in the response.
+        Items which are not board games or expansions are skipped.
+
+    Raises:
+        .exceptions.InvalidXmlStructure: If there is an error while parsing.
+        .exceptions.NoResultFound: If no item is a board game or an expansion.
+    """
+    root = _getRoot(xmlString)
+    games = []
+    for item in root.findall("item"):
+        game = _parseGameItem(item)
+        if game is not None:
+            games.append(game)
+    if not games:
+        raise exceptions.NoResultFound()
+    return games
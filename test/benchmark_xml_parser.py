@@ -0,0 +1,58 @@
+"""Compares the speed of the backends of xml_parser on the recorded BGG responses, and
+checks that they produce identical games. lxml must be installed to be compared.
+
+Run it with ``python benchmark_xml_parser.py [repetitions]``.
+"""
+import sys
+sys.path.insert(0, "../boardgamebot")
+import timeit
+
+from tools import xml_parser
+from objects.game import GameList
+
+FIXTURES = [("game.xml", xml_parser.parseGame), ("game2.xml", xml_parser.parseGame),
+    ("games.xml", xml_parser.parseGames), ("gameList.xml", xml_parser.parseGameList)]
+
+def load(fileName):
+    with open(fileName, "r", encoding="utf-8") as myfile:
+        return myfile.read()
+
+def games(result):
+    if isinstance(result, GameList):
+        return result.gameList
+    if isinstance(result, list):
+        return result
+    return [result]
+
+def snapshot(result):
+    """Returns all the attributes of the parsed games, to compare the backends.
+    """
+    total = result.total if isinstance(result, GameList) else None
+    return total, [game.__getstate__() for game in games(result)]
+
+repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+backends = ["defusedxml"]
+if xml_parser.lxmlEtree is not None:
+    backends.append("lxml")
+else:
+    print("lxml is not installed, only defusedxml is measured.")
+
+for fileName, parseMethod in FIXTURES:
+    data = load(fileName)
+    reference = None
+    baseline = None
+    for backend in backends:
+        xml_parser.setBackend(backend)
+        result = parseMethod(data)
+        if reference is None:
+            reference = snapshot(result)
+        elif snapshot(result) != reference:
+            print("MISMATCH: " + backend + " parses " + fileName + " differently")
+        elapsed = min(timeit.repeat(lambda: parseMethod(data), number=repetitions, repeat=3))
+        perItem = elapsed / repetitions / len(games(result)) * 1e6
+        if baseline is None:
+            baseline = perItem
+        print(fileName.ljust(14) + backend.ljust(12) + str(round(perItem, 1)).rjust(8) + " us/item"
+            + "   x" + str(round(baseline / perItem, 2)))
+
+xml_parser.setBackend("auto")
@@ -0,0 +1,183 @@
+"""A local stand-in for the BGG XML API2, serving the ``thing`` and ``search`` endpoints
+from the recorded fixtures in this directory. Latency, errors, queued (202) responses and
+rate limiting (429) can be configured, so that the bot can be load and fault tested offline.
+
+Run it with ``python fake_bgg.py --port 8080`` and start the bot with
+``BGG_API_PATH=http://localhost:8080/xmlapi2/`` to point :data:`constants.DEFAULT_API_PATH` at it.
+"""
+import os
+import copy
+import time
+import random
+import asyncio
+import argparse
+import xml.etree.ElementTree as ET
+from aiohttp import web
+
+FIXTURES_PATH = os.path.dirname(os.path.abspath(__file__))
+TERMS_OF_USE = "http://boardgamegeek.com/xmlapi/termsofuse"
+
+class FakeBggConfig():
+    """The behaviour of the fake server.
+
+    Args:
+        latency (float): The average delay of a response, in seconds.
+        jitter (float): The maximum random variation of the delay, in seconds.
+        errorRate (float): The probability of answering 503.
+        queuedRate (float): The probability of answering 202 (request queued).
+        rateLimit (float): The number of requests per second accepted before answering
+            429, or None for no limit.
+        synthesize (bool): Whether to generate a game for IDs which are not in the fixtures.
+        searchPadding (int): The number of generated games appended to every search
+            result, to simulate broad queries.
+    """
+    def __init__(self, latency=0, jitter=0, errorRate=0, queuedRate=0, rateLimit=None, synthesize=True, searchPadding=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.queuedRate = queuedRate
+        self.rateLimit = rateLimit
+        self.synthesize = synthesize
+        self.searchPadding = searchPadding
+
+def _loadItems(fileName):
+    root = ET.parse(os.path.join(FIXTURES_PATH, fileName)).getroot()
+    return root.findall("item")
+
+class FakeBgg():
+    """Serves the fixtures according to a :class:`FakeBggConfig` and counts the requests.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.games = {}
+        for fileName in ("game.xml", "game2.xml"):
+            for item in _loadItems(fileName):
+                self.games[item.get("id")] = item
+        self.template = self.games["145654"]
+        self.searchItems = _loadItems("gameList.xml")
+        self.requests = 0
+        self.responses = {}
+        self._windowStart = time.monotonic()
+        self._windowRequests = 0
+
+    def _game(self, id_):
+        if id_ in self.games:
+            return self.games[id_]
+        if not self.config.synthesize or not id_.isdigit():
+            return None
+        item = copy.deepcopy(self.template)
+        item.set("id", id_)
+        for name in item.findall("name"):
+            if "primary" == name.get("type"):
+                name.set("value", "Game " + id_)
+        return item
+
+    def _searchItem(self, id_, name):
+        item = ET.Element("item", type="boardgame", id=id_)
+        ET.SubElement(item, "name", type="primary", value=name)
+        ET.SubElement(item, "yearpublished", value="2000")
+        return item
+
+    def _rateLimited(self):
+        if self.config.rateLimit is None:
+            return False
+        now = time.monotonic()
+        if now - self._windowStart >= 1:
+            self._windowStart = now
+            self._windowRequests = 0
+        self._windowRequests += 1
+        return self._windowRequests > self.config.rateLimit
+
+    def _respond(self, status, text="", headers=None):
+        self.responses[status] = self.responses.get(status, 0) + 1
+        return web.Response(status=status, text=text, content_type="text/xml", headers=headers)
+
+    async def _fault(self):
+        """Applies the configured latency and faults.
+
+        Returns:
+            aiohttp.web.Response: A faulty response, or None if the request should succeed.
+        """
+        self.requests += 1
+        delay = self.config.latency + random.uniform(-self.config.jitter, self.config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._rateLimited():
+            return self._respond(429, headers={"Retry-After": "1"})
+        if random.random() < self.config.errorRate:
+            return self._respond(503)
+        if random.random() < self.config.queuedRate:
+            return self._respond(202, "<message>Your request for this collection has been accepted and will be processed.</message>")
+        return None
+
+    def _items(self, items, **attributes):
+        root = ET.Element("items", termsofuse=TERMS_OF_USE, **attributes)
+        root.extend(items)
+        return self._respond(200, ET.tostring(root, encoding="unicode"))
+
+    async def thing(self, request):
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+        ids = request.query.get("id", "").split(",")
+        items = [item for item in (self._game(id_) for id_ in ids) if item is not None]
+        return self._items(items)
+
+    async def search(self, request):
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+        query = request.query.get("query", "").lower()
+        exact = "1" == request.query.get("exact")
+        type_ = request.query.get("type")
+        items = []
+        for item in self.searchItems:
+            name = item.find("name").get("value").lower()
+            if type_ is not None and type_ != item.get("type"):
+                continue
+            if (exact and name == query) or (not exact and query in name):
+                items.append(item)
+        if not exact and items:
+            for i in range(self.config.searchPadding):
+                items.append(self._searchItem(str(900000 + i), query + " " + str(i)))
+        return self._items(items, total=str(len(items)))
+
+    def makeApp(self):
+        app = web.Application()
+        app.router.add_get("/xmlapi2/thing", self.thing)
+        app.router.add_get("/xmlapi2/search", self.search)
+        return app
+
+async def start(config, host="127.0.0.1", port=0):
+    """Starts a fake server on the running loop.
+
+    Args:
+        config (FakeBggConfig): The behaviour of the server.
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 to choose a free one.
+
+    Returns:
+        tuple: The :class:`FakeBgg`, the :class:`aiohttp.web.AppRunner` to clean up
+        and the API path to use as :data:`constants.DEFAULT_API_PATH`.
+    """
+    fakeBgg = FakeBgg(config)
+    runner = web.AppRunner(fakeBgg.makeApp())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return fakeBgg, runner, "http://" + host + ":" + str(port) + "/xmlapi2/"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake BGG XML API2 server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--queued-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--search-padding", type=int, default=0)
+    args = parser.parse_args()
+    config = FakeBggConfig(args.latency, args.jitter, args.error_rate, args.queued_rate, args.rate_limit, searchPadding=args.search_padding)
+    web.run_app(FakeBgg(config).makeApp(), host=args.host, port=args.port)
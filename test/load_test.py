@@ -0,0 +1,203 @@
+"""Load and fault test of the whole request_manager pipeline against the fake BGG server
+in :mod:`fake_bgg`, without Telegram. Every simulated chat sends a sequence of commands,
+inline queries and callbacks, and the latency of each answer is measured.
+
+With ``--workers N`` the requests go through the supervisor mode of ``run_bot``: a
+:class:`.supervisor.Supervisor` routes them to N worker processes, where an
+:class:`.background_task.Inbox` hands them to request_manager, and the answers come back
+to this process, which sends the next request of the chat. Every worker has its own fake
+BGG and the whole BGG rate, so that BGG does not hide how the throughput changes with N.
+
+Example: ``python load_test.py --chats 200 --requests 20 --latency 0.3 --error-rate 0.05``
+"""
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+import queue
+import pickle
+import random
+import asyncio
+import argparse
+import multiprocessing
+
+import constants
+
+QUERIES = ["pandemic", "pandemic legacy", "pandemic iberia", "cthulhu", "contagion", "the cure"]
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Load test of request_manager against a fake BGG server.")
+    parser.add_argument("--chats", type=int, default=100, help="number of concurrent chats")
+    parser.add_argument("--requests", type=int, default=10, help="requests sent by every chat")
+    parser.add_argument("--ids", type=int, default=500, help="number of distinct game IDs requested")
+    parser.add_argument("--bgg-rate", type=float, default=1000, help="requests per second allowed to BGG by the scheduler of each process")
+    parser.add_argument("--no-cache", action="store_true", help="disable the in-memory caches")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--queued-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests per second accepted by each fake BGG")
+    parser.add_argument("--workers", type=int, default=None, help="route the requests through a supervisor to this number of worker processes")
+    return parser.parse_args()
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def configure(args):
+    """Sets the constants of a process which runs request_manager, before tools.http is
+    imported, since the scheduler is created then."""
+    constants.defineREGEXPs()
+    constants.BGG_REQUEST_RATE = args.bgg_rate
+    constants.BGG_REQUEST_BURST = args.bgg_rate
+    constants.SCHEDULER_MAX_WAITING = max(constants.SCHEDULER_MAX_WAITING, args.chats)
+
+async def startBgg(args):
+    import fake_bgg
+    from tools import http
+
+    config = fake_bgg.FakeBggConfig(args.latency, args.jitter, args.error_rate, args.queued_rate, args.rate_limit)
+    fakeBgg, runner, constants.DEFAULT_API_PATH = await fake_bgg.start(config)
+    if args.no_cache:
+        http.GAME_CACHE.maxSize = 0
+        http.SEARCH_CACHE.maxSize = 0
+    return fakeBgg, runner
+
+async def stopBgg(fakeBgg, runner):
+    """Stops the fake BGG and returns the statistics of the process."""
+    from tools import http
+    from tools import history_manager
+
+    details = ["Fake BGG: " + str(fakeBgg.requests) + " requests, responses " + str(fakeBgg.responses),
+        "Attempts: " + str(http.attemptStats()),
+        "Game cache: " + str(http.GAME_CACHE.stats()),
+        "Search cache: " + str(http.SEARCH_CACHE.stats()),
+        "Scheduler: " + str(http.SCHEDULER.stats()),
+        "Circuit breaker: " + str(http.BREAKER.stats()),
+        "History snapshot: " + str(len(pickle.dumps(history_manager.STORE.chats, -1))) + " bytes"]
+    await http.closeSession()
+    await runner.cleanup()
+    return details
+
+async def sendRequest(request_manager, chatId, i, args):
+    """Sends the i-th request of a chat.
+
+    Returns:
+        bool: Whether the answer says that BGG is unreachable.
+    """
+    choice = random.random()
+    if choice < 0.5:
+        answer = await request_manager.processCommand("i", str(random.randint(1, args.ids)), chatId)
+    elif choice < 0.7:
+        answer = await request_manager.processCommand("b", random.choice(QUERIES), chatId)
+    elif choice < 0.9:
+        answer = await request_manager.processInline(None, random.choice(QUERIES), chatId)
+    else:
+        answer = await request_manager.processCallback("gm" + str(random.randint(1, args.ids)), chatId, i)
+    unreachableText = request_manager.output_formatter.formatBggUnreachable().formattedAnswer
+    return answer is not None and getattr(answer, "formattedAnswer", None) == unreachableText
+
+async def simulateChat(request_manager, chatId, args, latencies, unreachable):
+    for i in range(args.requests):
+        start = time.monotonic()
+        if await sendRequest(request_manager, chatId, i, args):
+            unreachable.append(chatId)
+        latencies.append(time.monotonic() - start)
+
+async def run(args):
+    import request_manager
+
+    fakeBgg, runner = await startBgg(args)
+    latencies = []
+    unreachable = []
+    start = time.monotonic()
+    await asyncio.gather(*[simulateChat(request_manager, chatId, args, latencies, unreachable) for chatId in range(args.chats)])
+    elapsed = time.monotonic() - start
+    return latencies, len(unreachable), elapsed, [await stopBgg(fakeBgg, runner)]
+
+def worker(index, workers, connection, args, results):
+    """Runs request_manager in a worker process of the supervisor. A request is the pair
+    (chat ID, request number) and is answered with ("answer", chat ID, unreachable); None
+    asks for the statistics of the worker and stops it."""
+    configure(args)
+    from objects import background_task
+    import request_manager
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    fakeBgg, runner = loop.run_until_complete(startBgg(args))
+
+    async def handle(msg):
+        if msg is None:
+            results.put(("details", index, await stopBgg(fakeBgg, runner)))
+            loop.stop()
+            return
+        chatId, i = msg
+        results.put(("answer", chatId, await sendRequest(request_manager, chatId, i, args)))
+
+    background_task.Inbox(connection, loop, handle).start()
+    results.put(("ready", index, None))
+    loop.run_forever()
+    loop.close()
+
+def runSupervised(args):
+    from objects import supervisor
+
+    results = multiprocessing.get_context("spawn").Queue()
+    workerSupervisor = supervisor.Supervisor(worker, args.workers, (args, results))
+    workerSupervisor.start()
+    for i in range(args.workers):
+        results.get()  # the worker is listening
+
+    latencies = []
+    unreachable = 0
+    sent = {}
+    answered = [0] * args.chats
+    start = time.monotonic()
+    for chatId in range(args.chats):
+        sent[chatId] = time.monotonic()
+        workerSupervisor.route(chatId, (chatId, 0))
+    while len(latencies) < args.chats * args.requests:
+        try:
+            kind, chatId, isUnreachable = results.get(timeout=constants.WORKER_CHECK_INTERVAL)
+        except queue.Empty:
+            workerSupervisor.check()
+            continue
+        if kind != "answer":
+            continue  # a worker started again
+        latencies.append(time.monotonic() - sent[chatId])
+        unreachable += isUnreachable
+        answered[chatId] += 1
+        if answered[chatId] < args.requests:
+            sent[chatId] = time.monotonic()
+            workerSupervisor.route(chatId, (chatId, answered[chatId]))
+    elapsed = time.monotonic() - start
+
+    # the key of a worker index is routed to that worker
+    for index in range(args.workers):
+        workerSupervisor.route(index, None)
+    details = {}
+    while len(details) < args.workers:
+        kind, index, lines = results.get()
+        if "details" == kind:
+            details[index] = lines
+    workerSupervisor.stop()
+    return latencies, unreachable, elapsed, [details[index] for index in range(args.workers)]
+
+if __name__ == "__main__":
+    args = parseArguments()
+    if args.workers is not None:
+        latencies, unreachable, elapsed, details = runSupervised(args)
+    else:
+        configure(args)
+        loop = asyncio.get_event_loop()
+        latencies, unreachable, elapsed, details = loop.run_until_complete(run(args))
+
+    latencies.sort()
+    print("Answers: " + str(len(latencies)) + " in " + str(round(elapsed, 2)) + " s (" + str(round(len(latencies) / elapsed, 1)) + " answers/s)")
+    print("Latency: p50 " + str(round(percentile(latencies, 0.5), 3)) + " s, p90 " + str(round(percentile(latencies, 0.9), 3))
+        + " s, p99 " + str(round(percentile(latencies, 0.99), 3)) + " s, max " + str(round(latencies[-1], 3)) + " s")
+    print("Unreachable answers: " + str(unreachable))
+    for index, lines in enumerate(details):
+        if args.workers is not None:
+            print("Worker " + str(index) + ":")
+        for line in lines:
+            print(("    " if args.workers is not None else "") + line)
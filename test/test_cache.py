@@ -0,0 +1,23 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+
+from objects.cache import TimedLRUCache
+
+cache = TimedLRUCache(2, 0.5)
+cache.put("a", 1)
+cache.put("b", 2)
+print(cache.get("a"))  # 1, "a" becomes the most recently used
+cache.put("c", 3)      # evicts "b"
+print(cache.get("b"))  # None
+print(cache.get("c"))  # 3
+time.sleep(0.6)
+print(cache.get("a"))  # None, expired
+print(cache.stats())
+
+cache = TimedLRUCache(10, 60, len, 5)
+cache.put("short", "abc")
+cache.put("long", "abcd")  # total weight 7 > 5, evicts "short"
+print(cache.get("short"))  # None
+print(cache.get("long"))   # abcd
+print(cache.stats())
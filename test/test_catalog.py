@@ -0,0 +1,27 @@
+import os
+import sys
+sys.path.insert(0, "../boardgamebot")
+import asyncio
+import tempfile
+
+import constants
+from tools import catalog
+from objects.game import Game, GameList
+
+constants.CATALOG_PATH = os.path.join(tempfile.mkdtemp(), "catalog.db")
+loop = asyncio.get_event_loop()
+
+catalog.openCatalog()
+game = Game("145654", "Invaders", "2013")
+catalog.storeGame(game)
+catalog.storeSearch("invaders", True, GameList([game]))
+catalog.writePending(0)
+
+games = loop.run_until_complete(catalog.getGames(["145654", "1"]))
+print(games["145654"][0].toString())
+print("1" in games)  # False
+gameList, fetched = loop.run_until_complete(catalog.getSearch("invaders", True))
+print(gameList.toString())
+print(loop.run_until_complete(catalog.getSearch("invaders", False)))  # None
+print(loop.run_until_complete(catalog.getGames(["145654"], maxAge=-1)))  # {}, too old
+catalog.closeCatalog()
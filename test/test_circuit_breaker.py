@@ -0,0 +1,20 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+
+from objects.circuit_breaker import CircuitBreaker
+
+breaker = CircuitBreaker(60, 4, 0.5, 0.2)
+breaker.recordSuccess()
+breaker.recordSuccess()
+breaker.recordFailure()
+print(breaker.state)    # closed, only 3 requests
+breaker.recordFailure()
+print(breaker.state)    # open, 2 failures out of 4
+print(breaker.allow())  # False
+time.sleep(0.3)
+print(breaker.allow())  # True, the probe
+print(breaker.allow())  # False, the probe is still running
+breaker.recordSuccess()
+print(breaker.state)    # closed
+print(breaker.stats())
@@ -0,0 +1,25 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+import asyncio
+
+from objects.dispatcher import ChatDispatcher
+
+handled = []
+
+async def handler(msg):
+    chatId, n = msg
+    await asyncio.sleep(0.1 if 0 == n else 0.01)  # the first update of each chat is the slowest
+    handled.append(msg)
+
+loop = asyncio.get_event_loop()
+dispatcher = ChatDispatcher(handler)
+start = time.monotonic()
+for n in range(3):
+    for chatId in range(10):
+        dispatcher.dispatch(chatId, (chatId, n))
+print(dispatcher.stats())  # 10 chats, 30 pending
+loop.run_until_complete(asyncio.sleep(0.3))
+print(all([n for c, n in handled if c == chatId] == [0, 1, 2] for chatId in range(10)))  # True, in order
+print(time.monotonic() - start < 0.5)  # True, chats run in parallel
+print(dispatcher.stats())  # no chats left
@@ -0,0 +1,27 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import copy
+import pickle
+
+from objects.game import Game, GameList
+
+game = Game("30549", "Pandemic", "2008")
+game.setAverage("7.6")
+game.setRank("Not Ranked")
+game.addCategory("Medical")
+print(game.year, game.average, game.rank)  # 2008 7.6 None
+
+restored = pickle.loads(pickle.dumps(game, -1))
+print(restored.toString(), restored.categories)
+print(copy.copy(game).__getstate__() == game.__getstate__())  # True
+
+# a game pickled before __slots__, with strings in numeric fields
+old = Game.__new__(Game)
+old.__setstate__({"type_": "g", "id_": "1", "name": "Old", "year": "1999", "average": "6.5", "rank": "10",
+    "playingTime": "0", "minPlayers": "2", "maxPlayers": "4", "categories": [], "mechanics": [],
+    "designers": [], "artists": [], "description": "", "thumbnail": None, "link": None, "msgId": 5})
+print(old.year, old.average, old.rank, old.stale)  # 1999 6.5 10 False
+
+gameList = GameList([game])
+gameList.total = 10
+print(pickle.loads(pickle.dumps(gameList, -1)).total)  # 10
@@ -0,0 +1,72 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+
+import constants
+from tools import history_manager
+from objects.game import Game
+
+constants.HISTORY_MAX_CHATS = 3
+constants.HISTORY_MAX_IDLE = 0.5
+
+for chatId in range(1, 5):
+    history_manager.updateLastGame(Game(str(chatId), "Game " + str(chatId)), chatId)
+print(list(history_manager.STORE.chats))  # [2, 3, 4], chat 1 is discarded
+history_manager.getLastGameId(2)
+print(list(history_manager.STORE.chats))  # [3, 4, 2]
+
+time.sleep(0.6)
+history_manager.updateLastGame(Game("5", "Game 5"), 5)
+history_manager.setUserPrivateChat(10, 5)
+print(history_manager.sweep())  # 2, chat 3 was discarded when chat 5 was added
+print(list(history_manager.STORE.chats), list(history_manager.STORE.users))  # [5] [10]
+
+# a page of a list fetched again numbers the games BGG returned this time
+from objects.game import GameList
+history_manager.updateLastGameList(GameList([Game("1", "A"), Game("2", "B")], 0, "a"), 5)
+history_manager.setMsgId(5, 50)
+history_manager.updateLastGameListPage(GameList([Game("3", "C"), Game("1", "A")], 0, "a"), 10, 5)
+print(history_manager.getGameIdFromRecentList(1, 5), history_manager.getLastGameListMsgId(5))  # 3 50
+
+# user history saved before entries were timestamped
+history_manager.STORE.setHistory(dict(history_manager.STORE.chats), {11: 11})
+print(history_manager.STORE.users[11][0])  # 11
+
+# two processes sharing the history in SQLite
+import os
+import tempfile
+from objects import history_store
+
+path = os.path.join(tempfile.mkdtemp(), "history.db")
+constants.HISTORY_MAX_IDLE = 3600
+first = history_store.SqliteHistoryStore(path)
+second = history_store.SqliteHistoryStore(path)
+history_manager.setStore(first)
+history_manager.updateLastGame(Game("7", "Game 7"), 7)
+history_manager.setUserPrivateChat(70, 7)
+history_manager.setStore(second)
+history_manager.setMsgId(7, 100)
+print(history_manager.getLastGameId(7), history_manager.getRecentGames(70))  # 7 ['7']
+history_manager.setStore(first)
+print(history_manager.getLastGameMsgId(7))  # 100
+
+# a change in another process waits for the transaction, briefly, instead of overwriting it
+import time
+import sqlite3
+with first.transaction():
+    chatHistory = history_manager._retrieveChatHistory(7)
+    history_manager.setStore(second)
+    start = time.monotonic()
+    try:
+        history_manager.updateLastGame(Game("8", "Game 8"), 7)
+    except sqlite3.OperationalError as e:
+        print(e, time.monotonic() - start < 1)  # database is locked True
+    chatHistory.addRecentGame("9")
+    first.putChat(7, chatHistory)
+history_manager.updateLastGame(Game("8", "Game 8"), 7)
+print(history_manager.getLastGameId(7), history_manager.getRecentGames(70))  # 8 ['8', '9', '7']
+history_manager.setStore(first)
+constants.HISTORY_MAX_IDLE = 0
+print(history_manager.sweep())  # 2
+first.close()
+second.close()
@@ -1,14 +1,23 @@
 import sys
 sys.path.insert(0, "../boardgamebot")
+import asyncio
 
 from tools import http
 import exceptions
 
+loop = asyncio.get_event_loop()
+
 try:
-    print(http.searchByName("Pandemic Iberia").toString())
-    print(http.searchByNameExact("Pandemic").toString())
-    print(http.searchById(131691).toString())
+    print(loop.run_until_complete(http.searchByName("Pandemic Iberia")).toString())
+    print(loop.run_until_complete(http.searchByNameExact("Pandemic")).toString())
+    print(loop.run_until_complete(http.searchById(131691)).toString())
+    # many lookups in flight at the same time on the same loop
+    games = loop.run_until_complete(asyncio.gather(*[http.searchById(id_) for id_ in (131691, 30549, 145654)]))
+    for game in games:
+        print(game.toString())
 except exceptions.BggUnreachable:
     print("Bgg unreachable")
 except exceptions.NoResultFound:
     print("No result found")
+finally:
+    loop.run_until_complete(http.closeSession())
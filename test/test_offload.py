@@ -0,0 +1,32 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import asyncio
+
+import constants
+from tools import offload
+from tools import xml_parser
+
+# the process pool spawns its workers, which import this module
+if __name__ == "__main__":
+    with open("games.xml", "rb") as myfile:
+        data = myfile.read()
+    loop = asyncio.get_event_loop()
+
+    # without an executor every step runs on the loop
+    games = loop.run_until_complete(offload.run("parse", len(data), xml_parser.parseGames, data))
+
+    for executor in ["thread", "process"]:
+        constants.OFFLOAD_EXECUTOR = executor
+        constants.OFFLOAD_THRESHOLD = len(data)
+        offload.openExecutor()
+        offloaded = loop.run_until_complete(offload.run("parse", len(data), xml_parser.parseGames, data))
+        print([game.__getstate__() for game in offloaded] == [game.__getstate__() for game in games])  # True
+        offload.closeExecutor()
+
+    try:
+        loop.run_until_complete(offload.run("parse", 0, xml_parser.parseGames, b"<items>"))
+    except Exception as e:
+        print(type(e).__name__)  # InvalidXmlStructure
+
+    stats = offload.stageStats()["parse"]
+    print(stats["loop"]["steps"], stats["pool"]["steps"])  # 2 2
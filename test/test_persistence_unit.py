@@ -0,0 +1,87 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import os
+import tempfile
+
+import constants
+from tools import history_manager
+from tools import persistence_unit
+from objects.game import Game
+
+directory = tempfile.mkdtemp()
+constants.HISTORY_LOG_PATH = os.path.join(directory, "history.log")
+constants.CHAT_HISTORY_PATH = os.path.join(directory, "chat_history.dat")
+constants.USER_HISTORY_PATH = os.path.join(directory, "user_history.dat")
+constants.HISTORY_INDEX_PATH = os.path.join(directory, "history.idx")
+
+persistence_unit.getHistory()  # no history yet, creates an empty index
+for chatId in range(3):
+    history_manager.updateLastGame(Game(str(chatId), "Game " + str(chatId)), chatId)
+history_manager.setUserPrivateChat(10, 1)
+persistence_unit.saveHistory()
+size = os.path.getsize(constants.HISTORY_LOG_PATH)
+history_manager.updateLastGame(Game("5", "Game 5"), 1)
+persistence_unit.saveHistory()  # appends only chat 1
+print(os.path.getsize(constants.HISTORY_LOG_PATH) < 2 * size)  # True
+
+# a crash while appending leaves a truncated record
+with open(constants.HISTORY_LOG_PATH, "ab") as log:
+    log.write(b"c\x01")
+persistence_unit.getHistory()
+print(len(history_manager.STORE.chats))  # 0, entries are loaded when used
+print(history_manager.getLastGameId(1), list(history_manager.STORE.chats))  # 5 [1]
+print(history_manager.getRecentGames(10))  # ['5', '1']
+
+# records saved after the truncated one are read again
+history_manager.updateLastGame(Game("6", "Game 6"), 2)
+persistence_unit.saveHistory()
+persistence_unit.compactHistory()
+print(os.path.getsize(constants.HISTORY_LOG_PATH))  # 0
+persistence_unit.getHistory()
+print(history_manager.getLastGameId(2), history_manager.getLastGameId(0))  # 6 0
+
+# discarded entries are not loaded again
+constants.HISTORY_MAX_CHATS = 2
+history_manager.getLastGameId(1)  # chat 2 is discarded
+try:
+    history_manager.getLastGameId(2)
+except Exception as e:
+    print(type(e).__name__)  # ChatHistoryNotFound
+persistence_unit.saveHistory()
+persistence_unit.getHistory()
+print(persistence_unit.loadEntry("c", 2), persistence_unit.loadEntry("c", 1) is not None)  # None True
+constants.HISTORY_MAX_CHATS = 200000
+
+# snapshots taken on the loop while the loop changes the history
+import asyncio
+import threading
+
+async def changeHistory():
+    for i in range(200):
+        history_manager.updateLastGame(Game(str(i), "Game " + str(i)), i % 50)
+        await asyncio.sleep(0)
+
+loop = asyncio.get_event_loop()
+saver = threading.Thread(target=lambda: [persistence_unit.saveHistory(loop) for i in range(5)])
+saver.start()
+loop.run_until_complete(changeHistory())
+loop.run_until_complete(loop.run_in_executor(None, saver.join))
+persistence_unit.saveHistory()
+persistence_unit.getHistory()
+print(history_manager.getLastGameId(49))  # 199
+print(persistence_unit.pauseStats()["snapshots"] >= 6)  # True
+
+# compacting replaces the index and unmaps the old one
+oldIndex = persistence_unit._index
+persistence_unit.compactHistory()
+print(oldIndex._map.closed, history_manager.getLastGameId(49))  # True 199
+
+# a damaged index is moved aside instead of being replaced by the log alone
+with open(constants.HISTORY_INDEX_PATH, "r+b") as index:
+    index.write(b"X")
+persistence_unit.getHistory()
+print(os.path.exists(constants.HISTORY_INDEX_PATH + ".bad"))  # True
+history_manager.updateLastGame(Game("7", "Game 7"), 3)
+persistence_unit.saveHistory()
+persistence_unit.compactHistory()
+print(len(persistence_unit._index), os.path.getsize(constants.HISTORY_INDEX_PATH + ".bad") > 0)  # 1 True
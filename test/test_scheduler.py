@@ -0,0 +1,58 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+import asyncio
+
+import exceptions
+from objects.scheduler import TokenBucket, RequestScheduler
+
+loop = asyncio.get_event_loop()
+start = time.monotonic()
+order = []
+
+async def request(name, priority):
+    try:
+        await scheduler.acquire(priority)
+        order.append((name, round(time.monotonic() - start, 1)))
+    except exceptions.RequestShed:
+        order.append((name, "shed"))
+
+# one request every 0.1 seconds, no burst
+scheduler = RequestScheduler(TokenBucket(10, 1), 3, {0: 5, 1: 5, 2: 5})
+loop.run_until_complete(asyncio.gather(
+    request("first", 0),
+    request("background", 2),
+    request("inline", 1),
+    request("chat", 0),        # served before inline
+    request("inline 2", 1),    # queue full: sheds the background request
+))
+print(order)
+print(scheduler.stats())
+
+# a waiting request promoted to a higher priority moves to its lane, and waits as long as it allows
+from objects.scheduler import Ticket
+order = []
+start = time.monotonic()
+scheduler = RequestScheduler(TokenBucket(10, 1), 10, {0: 5, 1: 0.15})
+ticket = Ticket(1)
+
+async def promoted():
+    try:
+        await scheduler.acquire(ticket.priority, ticket)
+        order.append(("promoted", round(time.monotonic() - start, 1)))
+    except exceptions.RequestShed:
+        order.append(("promoted", "shed"))
+
+async def promote():
+    await asyncio.sleep(0.05)
+    scheduler.promote(ticket, 0)
+
+loop.run_until_complete(asyncio.gather(
+    request("first", 0),
+    request("chat", 0),
+    request("chat 2", 0),
+    promoted(),                # inline, served after the chats
+    request("inline", 1),      # shed after 0.15 seconds
+    promote(),
+))
+print(order, ticket.priority)  # [('first', 0.0), ('chat', 0.1), ('inline', 'shed'), ('chat 2', 0.2), ('promoted', 0.3)] 0
@@ -0,0 +1,40 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+import asyncio
+import functools
+
+import constants
+from objects.send_queue import SendQueue
+
+class FloodError(Exception):
+    pass
+
+constants.TELEGRAM_SEND_RATE = 100
+constants.TELEGRAM_CHAT_SEND_RATE = 10
+constants.TELEGRAM_CHAT_SEND_BURST = 1
+calls = []
+floods = [True]
+
+async def call(chatId, text):
+    if "flood" == text and floods and floods.pop():
+        raise FloodError()
+    calls.append((chatId, text, round(time.monotonic() - start, 1)))
+    return text
+
+def retryAfter(err):
+    return 0.05 if isinstance(err, FloodError) else None
+
+async def test():
+    sendQueue = SendQueue(retryAfter)
+    sends = [sendQueue.send(1, functools.partial(call, 1, "message"))]
+    # the edits of message 5 wait behind the message, so only the last one is sent
+    sends += [sendQueue.send(1, functools.partial(call, 1, "page " + str(i)), (1, 5)) for i in range(3)]
+    sends += [sendQueue.send(2, functools.partial(call, 2, "flood"))]
+    sends += [sendQueue.send(None, functools.partial(call, None, "callback"))]
+    print(await asyncio.gather(*sends))  # ['message', 'page 2', 'page 2', 'page 2', 'flood', 'callback']
+    print(sendQueue.stats())  # 4 sent, 2 collapsed, 1 retried
+
+start = time.monotonic()
+asyncio.get_event_loop().run_until_complete(test())
+print(calls)  # callback at once, chat 1 paced at 10 per second, chat 2 retried
@@ -0,0 +1,45 @@
+import sys
+sys.path.insert(0, "../boardgamebot")
+import time
+import threading
+import multiprocessing
+
+import constants
+from objects.supervisor import Supervisor, shardOf
+
+def worker(index, workers, connection, results, crashing):
+    # a thread answers every update with the worker which received it, and the main
+    # thread fails when asked to, while the thread is waiting for an update
+    def answer():
+        while True:
+            results.put((index, connection.recv()))
+    threading.Thread(target=answer, daemon=True).start()
+    while crashing.value != index:
+        time.sleep(0.05)
+    crashing.value = -1
+    raise RuntimeError("worker " + str(index) + " crashed")
+
+if __name__ == "__main__":
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    crashing = context.Value("i", -1)
+    supervisor = Supervisor(worker, 3, (results, crashing))
+    supervisor.start()
+    for chatId in range(30):
+        supervisor.route(chatId, chatId)
+    received = [results.get(timeout=10) for i in range(30)]
+    print(all(index == shardOf(chatId, 3) for index, chatId in received))  # True, every chat on its worker
+    print(sorted(chatId for index, chatId in received) == list(range(30)))  # True
+
+    constants.WORKER_RESTART_DELAY = 0
+    crashing.value = 1  # prints the traceback of worker 1
+    time.sleep(1)
+    print(supervisor.stats())  # 2 alive
+    supervisor.route(1, 1)  # routed while the worker is dead
+    supervisor.route(4, 4)
+    supervisor.check()
+    supervisor.route(7, 7)
+    print([results.get(timeout=10) for i in range(3)])  # [(1, 1), (1, 4), (1, 7)], in order
+    print(supervisor.stats())  # 3 alive, 1 restart
+    supervisor.stop()
+    print(supervisor.stats())  # 0 alive
@@ -0,0 +1,49 @@
+"""Tests the webhook server with the recorded updates in updates.json.
+
+Run it with ``python test_webhook.py URL`` to POST the recorded updates to a bot started
+with ``--webhook``, instead: URL is the local address, including the secret path.
+"""
+import sys
+sys.path.insert(0, "../boardgamebot")
+import json
+import asyncio
+import aiohttp
+
+import constants
+from objects.webhook import WebhookServer
+
+with open("updates.json", "r") as myfile:
+    UPDATES = json.load(myfile)
+
+async def post(url, headers=None):
+    statuses = []
+    async with aiohttp.ClientSession() as session:
+        for update in UPDATES:
+            async with session.post(url, json=update, headers=headers) as r:
+                statuses.append(r.status)
+    return statuses
+
+async def test():
+    handled = []
+    async def handler(msg):
+        handled.append(msg)
+    constants.WEBHOOK_QUEUE_SIZE = 3
+    server = WebhookServer(handler, "secret", "token")
+    port = await server.start("127.0.0.1", 0)
+    url = "http://127.0.0.1:" + str(port) + "/secret"
+    print(await post(url, {"X-Telegram-Bot-Api-Secret-Token": "token"}))  # [200, 200, 200, 200]
+    await asyncio.sleep(0.1)
+    print([sorted(msg)[0] for msg in handled])  # ['chat', 'chat_instance', 'from'], the poll is ignored
+    print(await post(url))  # [403, 403, 403, 403]
+    print(await post(url.replace("secret", "guess"), {"X-Telegram-Bot-Api-Secret-Token": "token"}))  # [404, 404, 404, 404]
+    for worker in server._workers:
+        worker.cancel()
+    print(await post(url, {"X-Telegram-Bot-Api-Secret-Token": "token"}))  # [200, 200, 200, 503]
+    print(server.stats())
+    await server.stop()
+
+loop = asyncio.get_event_loop()
+if len(sys.argv) > 1:
+    print(loop.run_until_complete(post(sys.argv[1])))
+else:
+    loop.run_until_complete(test())
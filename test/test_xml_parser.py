@@ -16,6 +16,21 @@ with open("gameList.xml", "r", encoding="utf-8") as myfile:
 gameList = xml_parser.parseGameList(data)
 print(gameList.toString())
 
+# streaming parse, stopped after 3 games
+parser = xml_parser.GameListParser(3)
+chunks = data.encode("utf-8")
+for i in range(0, len(chunks), 64):
+    if parser.feed(chunks[i:i + 64]):
+        break
+gameList = parser.result()
+print(str(gameList.length()) + " of " + str(gameList.total))
+print(gameList.toString())
+
+with open("games.xml", "r", encoding="utf-8") as myfile:
+    data = myfile.read().replace("\n", "")
+for game in xml_parser.parseGames(data):
+    print(game.toString())
+
 def parseGame():
     with open("game2.xml", "r", encoding="utf-8") as myfile:
         data=myfile.read().replace("\n", "")